@@ -0,0 +1,112 @@
+"""Range-partition gps_locations by timestamp
+
+Revision ID: 002_partition_gps_locations
+Revises: 001_add_admin_logs
+Create Date: 2024-12-10
+
+Rebuilds gps_locations as a table range-partitioned on timestamp, with
+one partition per day (or per week, with -x gps_partition_interval=week).
+Partitions covering the retained data (GPS_RETENTION_DAYS, or
+-x gps_retention_days=N) and the next week are created here, and older
+fixes are not copied over; app/services/gps_partitions.py keeps creating
+future partitions and drops expired ones. A default partition catches
+fixes with out-of-range clocks.
+
+The primary key becomes (id, timestamp) because a partitioned table's
+unique constraints must include the partition key. ids keep coming from
+the same sequence, so they stay unique.
+"""
+from datetime import date, timedelta
+from typing import Optional, Sequence, Union
+
+from alembic import context, op
+import sqlalchemy as sa
+
+from app.config import settings
+
+# revision identifiers, used by Alembic.
+revision: str = '002_partition_gps_locations'
+down_revision: Union[str, None] = '001_add_admin_logs'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+COLUMNS = "id, vehicle_id, latitude, longitude, speed, heading, accuracy, altitude, device_id, timestamp"
+
+
+def _create_table(name: str, partitioned: bool) -> None:
+    primary_key = "PRIMARY KEY (id, timestamp)" if partitioned else "PRIMARY KEY (id)"
+    partition_by = " PARTITION BY RANGE (timestamp)" if partitioned else ""
+    op.execute(f"""
+        CREATE TABLE {name} (
+            id INTEGER NOT NULL DEFAULT nextval('gps_locations_id_seq'),
+            vehicle_id INTEGER NOT NULL,
+            latitude NUMERIC(10, 8) NOT NULL,
+            longitude NUMERIC(11, 8) NOT NULL,
+            speed NUMERIC(6, 2),
+            heading INTEGER,
+            accuracy NUMERIC(6, 2),
+            altitude NUMERIC(8, 2),
+            device_id VARCHAR(50),
+            timestamp TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+            {primary_key},
+            CONSTRAINT gps_locations_vehicle_id_fkey
+                FOREIGN KEY (vehicle_id) REFERENCES vehicles (id) ON DELETE CASCADE
+        ){partition_by}
+    """)
+
+
+def _rename_old_table() -> None:
+    op.execute("ALTER TABLE gps_locations RENAME TO gps_locations_old")
+    op.execute("ALTER INDEX IF EXISTS gps_locations_pkey RENAME TO gps_locations_old_pkey")
+    for index in ("ix_gps_locations_id", "ix_gps_locations_vehicle_id", "ix_gps_locations_timestamp"):
+        op.execute(f"DROP INDEX IF EXISTS {index}")
+
+
+def _move_rows_and_drop_old_table(since: Optional[date] = None) -> None:
+    where = f" WHERE timestamp >= '{since.isoformat()}'" if since else ""
+    op.execute(f"INSERT INTO gps_locations ({COLUMNS}) SELECT {COLUMNS} FROM gps_locations_old{where}")
+    op.execute("ALTER SEQUENCE gps_locations_id_seq OWNED BY gps_locations.id")
+    op.execute("DROP TABLE gps_locations_old")
+
+
+def upgrade() -> None:
+    x_args = context.get_x_argument(as_dictionary=True)
+    interval = x_args.get("gps_partition_interval", "day")
+    period = timedelta(days=7 if interval == "week" else 1)
+    retention_days = int(x_args.get("gps_retention_days", settings.GPS_RETENTION_DAYS))
+
+    _rename_old_table()
+    _create_table("gps_locations", partitioned=True)
+    op.execute("CREATE INDEX ix_gps_locations_vehicle_id ON gps_locations (vehicle_id)")
+    op.execute("CREATE INDEX ix_gps_locations_timestamp ON gps_locations (timestamp)")
+
+    # Partitions from the oldest retained fix through the next week
+    oldest = op.get_bind().execute(
+        sa.text("SELECT min(timestamp)::date FROM gps_locations_old")
+    ).scalar()
+    today = date.today()
+    cutoff = today - timedelta(days=retention_days) if retention_days > 0 else None
+    day = oldest or today
+    if cutoff and day < cutoff:
+        day = cutoff
+    if interval == "week":
+        day -= timedelta(days=day.weekday())
+    while day <= today + timedelta(days=7):
+        op.execute(
+            f"CREATE TABLE gps_locations_p{day:%Y%m%d} PARTITION OF gps_locations "
+            f"FOR VALUES FROM ('{day.isoformat()}') TO ('{(day + period).isoformat()}')"
+        )
+        day += period
+    op.execute("CREATE TABLE gps_locations_default PARTITION OF gps_locations DEFAULT")
+
+    # Fixes already past retention would only be dropped with their partitions
+    _move_rows_and_drop_old_table(since=cutoff)
+
+
+def downgrade() -> None:
+    _rename_old_table()
+    _create_table("gps_locations", partitioned=False)
+    op.execute("CREATE INDEX ix_gps_locations_id ON gps_locations (id)")
+    op.execute("CREATE INDEX ix_gps_locations_vehicle_id ON gps_locations (vehicle_id)")
+    op.execute("CREATE INDEX ix_gps_locations_timestamp ON gps_locations (timestamp)")
+    _move_rows_and_drop_old_table()
@@ -0,0 +1,42 @@
+"""Composite (vehicle_id, timestamp DESC) index on gps_locations
+
+Revision ID: 003_gps_vehicle_timestamp_index
+Revises: 002_partition_gps_locations
+Create Date: 2024-12-11
+
+The location history and last-position queries filter on vehicle_id and
+read the newest fixes first. A composite index serves both the filter
+and the order, so Postgres no longer bitmap-ANDs the single-column
+indexes and sorts. It replaces ix_gps_locations_vehicle_id, which is a
+prefix of it.
+
+With -x gps_covering_index=true the index also INCLUDEs latitude,
+longitude, speed and heading, so queries reading only those columns are
+answered by index-only scans (at the cost of a larger index).
+"""
+from typing import Sequence, Union
+
+from alembic import context, op
+
+# revision identifiers, used by Alembic.
+revision: str = '003_gps_vehicle_timestamp_index'
+down_revision: Union[str, None] = '002_partition_gps_locations'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+COVERED_COLUMNS = "latitude, longitude, speed, heading"
+
+
+def upgrade() -> None:
+    covering = context.get_x_argument(as_dictionary=True).get("gps_covering_index", "false").lower() == "true"
+    include = f" INCLUDE ({COVERED_COLUMNS})" if covering else ""
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS ix_gps_locations_vehicle_timestamp "
+        f"ON gps_locations (vehicle_id, timestamp DESC){include}"
+    )
+    op.execute("DROP INDEX IF EXISTS ix_gps_locations_vehicle_id")
+
+
+def downgrade() -> None:
+    op.execute("CREATE INDEX IF NOT EXISTS ix_gps_locations_vehicle_id ON gps_locations (vehicle_id)")
+    op.execute("DROP INDEX IF EXISTS ix_gps_locations_vehicle_timestamp")
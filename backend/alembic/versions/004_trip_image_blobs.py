@@ -0,0 +1,37 @@
+"""Keep trip image bytes in the blob store, not in trip_images
+
+Revision ID: 004_trip_image_blobs
+Revises: 003_gps_vehicle_timestamp_index
+Create Date: 2024-12-16
+
+New rows keep only the SHA-256 key and size of the JPEG. image_data
+becomes nullable and stays for legacy rows until
+`python -m app.scripts.migrate_trip_images` has moved them.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '004_trip_image_blobs'
+down_revision: Union[str, None] = '003_gps_vehicle_timestamp_index'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('trip_images', sa.Column('blob_key', sa.String(length=64), nullable=True))
+    op.add_column('trip_images', sa.Column('size', sa.Integer(), nullable=True))
+    op.create_index('ix_trip_images_blob_key', 'trip_images', ['blob_key'])
+    op.alter_column('trip_images', 'image_data', existing_type=sa.Text(), nullable=True)
+
+
+def downgrade() -> None:
+    moved = op.get_bind().execute(sa.text("SELECT count(*) FROM trip_images WHERE image_data IS NULL")).scalar()
+    if moved:
+        raise RuntimeError(f"{moved} trip images exist only in the blob store; cannot downgrade")
+    op.alter_column('trip_images', 'image_data', existing_type=sa.Text(), nullable=False)
+    op.drop_index('ix_trip_images_blob_key', table_name='trip_images')
+    op.drop_column('trip_images', 'size')
+    op.drop_column('trip_images', 'blob_key')
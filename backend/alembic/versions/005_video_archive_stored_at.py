@@ -0,0 +1,28 @@
+"""Track when an archived frame has been written to storage
+
+Revision ID: 005_video_archive_stored_at
+Revises: 004_trip_image_blobs
+Create Date: 2024-12-17
+
+Frames are written by a background worker pool after the upload returns,
+so video_archives.stored_at is NULL until the file exists. Rows created
+before this revision never had a file written and stay NULL.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '005_video_archive_stored_at'
+down_revision: Union[str, None] = '004_trip_image_blobs'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('video_archives', sa.Column('stored_at', sa.DateTime(timezone=True), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('video_archives', 'stored_at')
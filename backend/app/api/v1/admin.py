@@ -4,11 +4,13 @@ Admin API endpoints for logs and system statistics.
 
 from datetime import datetime, timedelta
 from typing import Optional, List
-from fastapi import APIRouter, Depends, Query, Request
+from fastapi import APIRouter, BackgroundTasks, Depends, Query, Request
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, func, and_, or_
 from sqlalchemy.orm import selectinload
 
+from ...config import settings
+from ...core.exceptions import BadRequestException
 from ...database import get_db
 from ...dependencies import get_current_admin_user, get_current_manager_user
 from ...models.user import User, UserRole
@@ -21,6 +23,8 @@ from ...schemas.admin import (
     UserStats, DeviceStats, SystemHealthStats, RevenueStatsResponse, RevenueByPeriod,
     LogLevel, ActionType
 )
+from ...services.columnar_export import EXPORT_TABLES, run_columnar_export, whole_days
+from ...services.gps_export import naive_utc
 
 router = APIRouter()
 
@@ -495,3 +499,59 @@ async def get_quick_stats(
         "today_revenue": float(today_revenue_result),
         "timestamp": datetime.utcnow().isoformat()
     }
+
+
+# ============== Analytics Exports ==============
+
+@router.post("/exports/columnar", status_code=202)
+async def start_columnar_export(
+    background_tasks: BackgroundTasks,
+    table: Optional[List[str]] = Query(None, description="gps_locations and/or trips (default: both)"),
+    date_from: Optional[datetime] = Query(None, description="Inclusive, defaults to 24 hours ago"),
+    date_to: Optional[datetime] = Query(None, description="Exclusive, defaults to now"),
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_admin_user),
+    request: Request = None
+):
+    """
+    Export GPS fixes and trips to Parquet, partitioned by date and vehicle.
+    The window is widened to whole UTC days, since each day's files are
+    rewritten in full. Runs in the background and writes to
+    COLUMNAR_EXPORT_DESTINATION.
+    Admin only endpoint.
+    """
+    tables = table or list(EXPORT_TABLES)
+    unknown = sorted(set(tables) - set(EXPORT_TABLES))
+    if unknown:
+        raise BadRequestException(detail=f"Unknown tables: {', '.join(unknown)}")
+    date_from, date_to = naive_utc(date_from), naive_utc(date_to)
+    if date_from is None:
+        date_from = (date_to or datetime.utcnow()) - timedelta(hours=24)
+    if date_to is not None and date_from >= date_to:
+        raise BadRequestException(detail="date_from must be before date_to")
+    date_from, date_to = whole_days(date_from, date_to)
+
+    # Runs after the response on its own connection of the request's engine
+    background_tasks.add_task(run_columnar_export, tables, date_from, date_to, bind=db.bind)
+
+    await create_admin_log(
+        db=db,
+        user=current_user,
+        action=DBActionType.EXPORT,
+        message=f"Started Parquet export of {', '.join(tables)}",
+        resource_type="columnar_export",
+        details={
+            "tables": tables,
+            "date_from": date_from.isoformat(),
+            "date_to": date_to.isoformat() if date_to else None,
+        },
+        request=request
+    )
+
+    return {
+        "status": "started",
+        "tables": tables,
+        "date_from": date_from,
+        "date_to": date_to,
+        "destination": settings.COLUMNAR_EXPORT_DESTINATION,
+    }
@@ -2,11 +2,14 @@
 Trip images API endpoints.
 """
 
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, Header, HTTPException, status, Query
+from fastapi.responses import Response
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, func, and_
-from typing import Optional
+from typing import Optional, Tuple
 from datetime import datetime
+import binascii
+import re
 
 from ...database import get_db
 from ...models.image import TripImage
@@ -19,6 +22,9 @@ from ...schemas.image import (
     ImageHistoryResponse,
 )
 from ...dependencies import get_current_user
+from ...services.blob_store import BlobNotFound, blob_key, blob_store, is_blob_key
+from ...services.thumbnails import preview_key, thumbnailer
+from ...services.trip_images import decode_image, lock_blob, release_blob
 
 router = APIRouter()
 
@@ -44,11 +50,25 @@ async def create_trip_image(
             detail="Trip not found"
         )
 
-    # Create image record
+    try:
+        image_bytes = decode_image(image.image_data)
+    except (binascii.Error, ValueError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid base64 image data"
+        )
+
+    # Store the JPEG by content hash; the row keeps only the key. The key
+    # stays locked until commit so a concurrent delete of the same bytes
+    # cannot remove the blob between the put and the insert.
+    await lock_blob(db, blob_key(image_bytes))
+    key, size = await blob_store.put(image_bytes)
+    thumbnailer.submit(key, image_bytes)
     db_image = TripImage(
         trip_id=image.trip_id,
         device_id=image.device_id,
-        image_data=image.image_data
+        blob_key=key,
+        size=size
     )
 
     db.add(db_image)
@@ -205,6 +225,81 @@ async def get_latest_trip_image(
     return image
 
 
+def _byte_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Parse a single-range Range header into inclusive (start, end); None to send everything."""
+    match = re.fullmatch(r"bytes=(\d*)-(\d*)", header.strip())
+    if not match or match.group(1) == match.group(2) == "":
+        return None
+    first, last = match.groups()
+    if first == "":
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start > end or start >= size:
+        raise HTTPException(
+            status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+            detail="Requested range not satisfiable",
+            headers={"Content-Range": f"bytes */{size}"},
+        )
+    return start, end
+
+
+@router.get("/blobs/{blob_key}")
+async def download_image_blob(
+    blob_key: str,
+    size: Optional[int] = Query(None, description="Serve the preview this many pixels wide instead"),
+    range_header: Optional[str] = Header(None, alias="Range"),
+    if_none_match: Optional[str] = Header(None, alias="If-None-Match"),
+):
+    """
+    Download an image by its content key, whole or a single byte range.
+    Keys are only handed out by the authenticated image endpoints, and a
+    key always names the same bytes, so responses are cacheable forever.
+    With ?size= the image's preview is served, rendered on first request
+    if it is not stored yet.
+    """
+    if not is_blob_key(blob_key):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Image not found")
+
+    source_key = None
+    if size is not None:
+        try:
+            thumbnailer.check_width(size)
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+        source_key, blob_key = blob_key, preview_key(blob_key, size)
+
+    etag = f'"{blob_key}"'
+    headers = {
+        "ETag": etag,
+        "Accept-Ranges": "bytes",
+        "Cache-Control": "public, max-age=31536000, immutable",
+    }
+    if if_none_match == etag:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    try:
+        if source_key is not None:
+            await thumbnailer.preview(source_key, size)
+        length = await blob_store.size(blob_key)
+        byte_range = _byte_range(range_header, length) if range_header else None
+        if byte_range is None:
+            return Response(await blob_store.get(blob_key), media_type="image/jpeg", headers=headers)
+        start, end = byte_range
+        content = await blob_store.get(blob_key, start, end)
+    except BlobNotFound:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Image not found")
+
+    headers["Content-Range"] = f"bytes {start}-{end}/{length}"
+    return Response(
+        content,
+        status_code=status.HTTP_206_PARTIAL_CONTENT,
+        media_type="image/jpeg",
+        headers=headers,
+    )
+
+
 @router.delete("/{image_id}", status_code=204)
 async def delete_trip_image(
     image_id: int,
@@ -212,7 +307,7 @@ async def delete_trip_image(
     current_user: User = Depends(get_current_user)
 ):
     """
-    Delete a trip image.
+    Delete a trip image, and its blob and previews unless another image has the same bytes.
     Admin only.
     """
     if not current_user.is_admin:
@@ -231,7 +326,10 @@ async def delete_trip_image(
             detail="Image not found"
         )
 
+    key = image.blob_key
     await db.delete(image)
     await db.commit()
+    await release_blob(db, key)
+    await db.commit()
 
     return None
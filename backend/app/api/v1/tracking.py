@@ -2,130 +2,315 @@
 GPS Tracking API endpoints.
 """
 
-from fastapi import APIRouter, Depends, Query, HTTPException
+from fastapi import APIRouter, Depends, Query, HTTPException, Body, Response
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, desc
+from sqlalchemy import select, desc, insert
 from datetime import datetime, timedelta
-from typing import List
+from typing import List, Dict, Any, Optional, Set
 
+from ...config import settings
 from ...database import get_db
 from ...models.tracking import GPSLocation
 from ...models.vehicle import Vehicle
-from ...schemas.tracking import GPSLocationCreate, GPSLocationResponse
-from ...dependencies import get_current_user
+from ...schemas.tracking import (
+    GPSLocationCreate, GPSLocationResponse, GPSBatchItemResult, GPSBatchResponse
+)
+from ...dependencies import get_current_user, get_current_manager_user
 from ...models.user import User
+from ...services.gps_buffer import gps_buffer, heading_degrees, BufferFullError
+from ...services.position_registry import position_registry
+from ...services.trajectory import TraceSimplifier
+from ...services.gps_export import EXPORT_FORMATS, export_query, naive_utc, stream_export
 from ...websocket.tracking import broadcast_location_update
 
 router = APIRouter()
 
+# Vehicle IDs known to exist, so queued fixes skip the per-request SELECT.
+# Fixes for vehicles deleted later are dropped by the buffer's flush.
+_known_vehicle_ids: Set[int] = set()
+
+
+async def _existing_vehicle_ids(db: AsyncSession, vehicle_ids: Set[int], use_cache: bool) -> Set[int]:
+    """Return the subset of vehicle_ids that exist, with at most one query."""
+    missing = vehicle_ids - _known_vehicle_ids if use_cache else vehicle_ids
+    found = set()
+    if missing:
+        result = await db.execute(select(Vehicle.id).where(Vehicle.id.in_(missing)))
+        found = set(result.scalars().all())
+        if use_cache:
+            _known_vehicle_ids.update(found)
+    if use_cache:
+        return vehicle_ids & _known_vehicle_ids
+    return found
+
+
+def _location_row(location_data: GPSLocationCreate, received_at: datetime) -> dict:
+    """Build a gps_locations row from a validated fix."""
+    return {
+        "vehicle_id": location_data.vehicle_id,
+        "latitude": location_data.latitude,
+        "longitude": location_data.longitude,
+        "speed": location_data.speed,
+        "heading": heading_degrees(location_data.heading),
+        "accuracy": location_data.accuracy,
+        "altitude": location_data.altitude,
+        "device_id": location_data.device_id,
+        "timestamp": location_data.timestamp or received_at,
+    }
+
+
+async def _publish_fix(location_id: Optional[int], row: dict):
+    """Record a fix as its vehicle's last known position and broadcast it if it is the newest."""
+    position = position_registry.update(row, location_id)
+    if position is not None:
+        await broadcast_location_update(position.to_message())
+
 
 @router.post("/location", response_model=GPSLocationResponse, status_code=201)
 async def receive_gps_location(
     location_data: GPSLocationCreate,
+    response: Response,
     db: AsyncSession = Depends(get_db)
 ):
     """
     Receive GPS location from device (ESP32).
     No authentication required for devices.
+
+    When the write-behind buffer is running the fix is queued and the
+    endpoint answers 202 without waiting for the database; otherwise the
+    fix is inserted synchronously and 201 is returned.
     """
-    # Verify vehicle exists
-    stmt = select(Vehicle).where(Vehicle.id == location_data.vehicle_id)
-    result = await db.execute(stmt)
-    vehicle = result.scalar_one_or_none()
+    buffered = gps_buffer.running
 
-    if not vehicle:
+    # Verify vehicle exists
+    existing = await _existing_vehicle_ids(db, {location_data.vehicle_id}, use_cache=buffered)
+    if not existing:
         raise HTTPException(status_code=404, detail="Vehicle not found")
 
+    row = _location_row(location_data, datetime.utcnow())
+
+    if buffered:
+        try:
+            gps_buffer.put(row)
+        except BufferFullError as e:
+            raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+
+        await _publish_fix(None, row)
+        response.status_code = 202
+        return GPSLocationResponse(id=None, **row)
+
     # Create GPS location
-    db_location = GPSLocation(
-        vehicle_id=location_data.vehicle_id,
-        latitude=location_data.latitude,
-        longitude=location_data.longitude,
-        speed=location_data.speed,
-        heading=location_data.heading,
-        accuracy=location_data.accuracy,
-        altitude=location_data.altitude,
-        device_id=location_data.device_id,
-        timestamp=datetime.utcnow()
-    )
+    db_location = GPSLocation(**row)
 
     db.add(db_location)
     await db.commit()
     await db.refresh(db_location)
 
     # Broadcast to WebSocket clients
-    await broadcast_location_update({
-        "id": db_location.id,
-        "vehicle_id": db_location.vehicle_id,
-        "latitude": float(db_location.latitude),
-        "longitude": float(db_location.longitude),
-        "speed": float(db_location.speed) if db_location.speed else None,
-        "heading": float(db_location.heading) if db_location.heading else None,
-        "timestamp": db_location.timestamp.isoformat()
-    })
+    await _publish_fix(db_location.id, row)
 
     return db_location
 
 
-@router.get("/live", response_model=List[GPSLocationResponse])
-async def get_live_locations(
-    db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+@router.post("/locations:batch", response_model=GPSBatchResponse)
+async def receive_gps_location_batch(
+    response: Response,
+    fixes: List[Dict[str, Any]] = Body(..., description="GPS fixes, possibly for many vehicles"),
+    db: AsyncSession = Depends(get_db)
 ):
-    """Get latest GPS locations for all active vehicles."""
-    # Get latest location for each vehicle (last 60 seconds)
-    cutoff_time = datetime.utcnow() - timedelta(seconds=60)
-
-    # Subquery to get latest timestamp per vehicle
-    from sqlalchemy import func
-    subq = (
-        select(
-            GPSLocation.vehicle_id,
-            func.max(GPSLocation.timestamp).label('max_timestamp')
+    """
+    Receive a batch of GPS fixes from devices (ESP32).
+    Each fix is validated on its own, so one bad fix does not reject the
+    whole upload. Accepted fixes are queued on the write-behind buffer (202)
+    or, if it is not running, written with a single multi-row insert.
+    No authentication required for devices.
+    """
+    if len(fixes) > settings.GPS_BATCH_MAX_SIZE:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch too large (max {settings.GPS_BATCH_MAX_SIZE} fixes)"
         )
-        .where(GPSLocation.timestamp >= cutoff_time)
-        .group_by(GPSLocation.vehicle_id)
-        .subquery()
-    )
 
-    # Get full location records
-    stmt = (
-        select(GPSLocation)
-        .join(
-            subq,
-            (GPSLocation.vehicle_id == subq.c.vehicle_id) &
-            (GPSLocation.timestamp == subq.c.max_timestamp)
-        )
-        .order_by(desc(GPSLocation.timestamp))
+    received_at = datetime.utcnow()
+    results: List[GPSBatchItemResult] = [None] * len(fixes)
+
+    # Validate every fix in one pass
+    valid = []
+    for index, raw in enumerate(fixes):
+        try:
+            valid.append((index, GPSLocationCreate.model_validate(raw)))
+        except ValidationError as e:
+            error = e.errors()[0]
+            field = ".".join(str(part) for part in error["loc"])
+            results[index] = GPSBatchItemResult(
+                index=index, accepted=False, error=f"{field}: {error['msg']}" if field else error["msg"]
+            )
+
+    # Verify all referenced vehicles with a single query
+    buffered = gps_buffer.running
+    vehicle_ids = {fix.vehicle_id for _, fix in valid}
+    known_ids = await _existing_vehicle_ids(db, vehicle_ids, use_cache=buffered)
+
+    rows = []
+    row_indexes = []
+    for index, fix in valid:
+        if fix.vehicle_id not in known_ids:
+            results[index] = GPSBatchItemResult(index=index, accepted=False, error="Vehicle not found")
+            continue
+        rows.append(_location_row(fix, received_at))
+        row_indexes.append(index)
+
+    if rows and buffered:
+        queued = gps_buffer.put_many(rows)
+        for index in row_indexes[queued:]:
+            results[index] = GPSBatchItemResult(index=index, accepted=False, error="GPS ingest buffer is full")
+        rows, row_indexes = rows[:queued], row_indexes[:queued]
+        ids = [None] * queued
+        response.status_code = 202
+    elif rows:
+        stmt = insert(GPSLocation).returning(GPSLocation.id, sort_by_parameter_order=True)
+        result = await db.execute(stmt, rows)
+        ids = result.scalars().all()
+        await db.commit()
+
+    if rows:
+        latest = {}
+        for index, row, location_id in zip(row_indexes, rows, ids):
+            results[index] = GPSBatchItemResult(index=index, accepted=True, id=location_id)
+            current = latest.get(row["vehicle_id"])
+            if current is None or row["timestamp"] >= current[1]["timestamp"]:
+                latest[row["vehicle_id"]] = (location_id, row)
+
+        # Only the newest fix per vehicle is interesting to live dashboards
+        for location_id, row in latest.values():
+            await _publish_fix(location_id, row)
+
+    return GPSBatchResponse(
+        accepted=len(rows),
+        rejected=len(fixes) - len(rows),
+        results=results
     )
 
-    result = await db.execute(stmt)
-    locations = result.scalars().all()
 
-    return locations
+@router.get("/live", response_model=List[GPSLocationResponse])
+async def get_live_locations(
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Get latest GPS locations for all active vehicles."""
+    # Latest location for each vehicle (last 60 seconds), served from memory
+    await position_registry.ensure_seeded(db)
+    return position_registry.snapshot(max_age_seconds=60)
 
 
 @router.get("/vehicle/{vehicle_id}/history", response_model=List[GPSLocationResponse])
 async def get_vehicle_location_history(
     vehicle_id: int,
     hours: int = Query(default=24, ge=1, le=168),  # Max 1 week
+    compact: bool = Query(default=False, description="Only position, speed, heading and timestamp"),
+    tolerance_m: Optional[float] = Query(
+        default=None, gt=0, le=10000, description="Simplify the trace to within this many meters"
+    ),
+    max_points: Optional[int] = Query(
+        default=None, ge=2, le=10000, description="Simplify the trace to at most this many points"
+    ),
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    """Get GPS location history for a specific vehicle."""
+    """
+    Get GPS location history for a specific vehicle.
+
+    Without tolerance_m / max_points, the newest 1000 raw fixes are returned.
+    With either, the whole time range is streamed and simplified
+    (Douglas-Peucker), so long ranges fit in a few hundred points.
+    """
     cutoff_time = datetime.utcnow() - timedelta(hours=hours)
+    simplified = tolerance_m is not None or max_points is not None
+
+    if compact or simplified:
+        # Columns held by ix_gps_locations_vehicle_timestamp (with the covering
+        # option of migration 003), so Postgres can answer from the index alone
+        stmt = select(
+            GPSLocation.vehicle_id,
+            GPSLocation.latitude,
+            GPSLocation.longitude,
+            GPSLocation.speed,
+            GPSLocation.heading,
+            GPSLocation.timestamp,
+        )
+    else:
+        stmt = select(GPSLocation)
 
     stmt = (
-        select(GPSLocation)
+        stmt
         .where(
             GPSLocation.vehicle_id == vehicle_id,
             GPSLocation.timestamp >= cutoff_time
         )
         .order_by(desc(GPSLocation.timestamp))
-        .limit(1000)  # Max 1000 points
     )
 
-    result = await db.execute(stmt)
-    locations = result.scalars().all()
+    if simplified:
+        simplifier = TraceSimplifier(tolerance_m=tolerance_m, max_points=max_points)
+        result = await db.stream(stmt.execution_options(yield_per=settings.GPS_HISTORY_CHUNK_SIZE))
+        async for rows in result.partitions():
+            simplifier.add(rows)
+        return [{"vehicle_id": vehicle_id, **point} for point in simplifier.finish()]
+
+    result = await db.execute(stmt.limit(1000))  # Max 1000 points
+    if compact:
+        return result.mappings().all()
+    return result.scalars().all()
+
+
+def _export_response(
+    db: AsyncSession,
+    vehicle_ids: Optional[List[int]],
+    start: Optional[datetime],
+    end: Optional[datetime],
+    export_format: str,
+    filename: str,
+) -> StreamingResponse:
+    """Stream an export of GPS history as NDJSON or CSV (the last 24 hours by default)."""
+    start, end = naive_utc(start), naive_utc(end)
+    if start is None:
+        start = (end or datetime.utcnow()) - timedelta(hours=24)
+    if end is not None and start >= end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+    return StreamingResponse(
+        # Streamed on a separate connection of the same engine: the request's
+        # session is closed once the response starts
+        stream_export(export_query(vehicle_ids, start, end), export_format, bind=db.bind),
+        media_type=EXPORT_FORMATS[export_format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{export_format}"'},
+    )
+
 
-    return locations
+@router.get("/vehicle/{vehicle_id}/export")
+async def export_vehicle_locations(
+    vehicle_id: int,
+    format: str = Query(default="ndjson", pattern="^(ndjson|csv)$"),
+    start: Optional[datetime] = Query(default=None, description="Inclusive, defaults to 24 hours ago"),
+    end: Optional[datetime] = Query(default=None, description="Exclusive, defaults to now"),
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Export the GPS history of a vehicle, oldest first, without a row limit."""
+    if not await _existing_vehicle_ids(db, {vehicle_id}, use_cache=False):
+        raise HTTPException(status_code=404, detail="Vehicle not found")
+    return _export_response(db, [vehicle_id], start, end, format, f"vehicle-{vehicle_id}-locations")
+
+
+@router.get("/export")
+async def export_fleet_locations(
+    format: str = Query(default="ndjson", pattern="^(ndjson|csv)$"),
+    start: Optional[datetime] = Query(default=None, description="Inclusive, defaults to 24 hours ago"),
+    end: Optional[datetime] = Query(default=None, description="Exclusive, defaults to now"),
+    vehicle_id: Optional[List[int]] = Query(default=None, description="Repeat to export several vehicles"),
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_manager_user)
+):
+    """Export the GPS history of the whole fleet (or the given vehicles), oldest first."""
+    return _export_response(db, vehicle_id, start, end, format, "fleet-locations")
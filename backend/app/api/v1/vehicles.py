@@ -12,7 +12,7 @@ from ...models.user import User
 from ...models.vehicle import Vehicle, Driver, Trip
 from ...schemas.vehicle import (
     VehicleCreate, VehicleUpdate, VehicleResponse,
-    DriverCreate, DriverUpdate, DriverResponse,
+    DriverCreate, DriverUpdate, DriverResponse, NearbyDriverResponse,
     TripCreate, TripUpdate, TripResponse, TripRequest
 )
 from ...dependencies import get_current_user, get_current_manager_user
@@ -196,6 +196,46 @@ async def get_my_driver_profile(
     return driver
 
 
+@router.get("/drivers/available", response_model=List[NearbyDriverResponse])
+async def get_available_drivers(
+    lat: float = Query(..., ge=-90, le=90),
+    lng: float = Query(..., ge=-180, le=180),
+    radius: float = Query(5.0, gt=0, le=50),  # km
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Get available drivers within radius km of a location, nearest first."""
+    from ...services.position_registry import position_registry
+
+    # Vehicles near the location, from the spatial index (bounding box + haversine)
+    await position_registry.ensure_seeded(db)
+    hits = dict(position_registry.index.within_radius(lat, lng, radius))
+    if not hits:
+        return []
+
+    stmt = select(Driver, Vehicle.id).join(
+        Vehicle, Driver.id == Vehicle.current_driver_id
+    ).where(
+        Driver.status == "ON_DUTY",
+        Vehicle.id.in_(hits.keys())
+    )
+
+    result = await db.execute(stmt)
+    nearby = []
+    for driver, vehicle_id in result.all():
+        position = position_registry.get(vehicle_id)
+        nearby.append(NearbyDriverResponse(
+            **DriverResponse.model_validate(driver).model_dump(),
+            vehicle_id=vehicle_id,
+            latitude=position.latitude,
+            longitude=position.longitude,
+            distance_km=round(hits[vehicle_id], 3),
+        ))
+
+    nearby.sort(key=lambda d: d.distance_km)
+    return nearby
+
+
 @router.get("/drivers/{driver_id}", response_model=DriverResponse)
 async def get_driver(
     driver_id: int,
@@ -301,49 +341,39 @@ async def request_trip(
     current_user: User = Depends(get_current_user)
 ):
     """Customer requests a taxi (finds nearest available driver)."""
-    from ...models.tracking import GPSLocation
+    from ...services.position_registry import position_registry
+    from ...services.spatial_index import haversine_km
     from ...websocket.trips import trip_manager
-    from sqlalchemy import func
-    import math
-
-    # Calculate distance between two coordinates
-    def haversine(lat1, lon1, lat2, lon2):
-        R = 6371  # Earth radius in km
-        phi1, phi2 = math.radians(lat1), math.radians(lat2)
-        dphi = math.radians(lat2 - lat1)
-        dlambda = math.radians(lon2 - lon1)
-        a = math.sin(dphi/2)**2 + math.cos(phi1)*math.cos(phi2)*math.sin(dlambda/2)**2
-        return 2 * R * math.asin(math.sqrt(a))
-
-    # Find available drivers with recent GPS data
-    stmt = select(Driver, Vehicle, GPSLocation).join(
-        Vehicle, Driver.id == Vehicle.current_driver_id
-    ).join(
-        GPSLocation, Vehicle.id == GPSLocation.vehicle_id
-    ).where(
-        Driver.status == "ON_DUTY"
-    ).order_by(GPSLocation.timestamp.desc())
 
-    result = await db.execute(stmt)
-    available = result.all()
+    async def on_duty(vehicle_ids):
+        # Of the nearest vehicles, those with an ON_DUTY driver
+        stmt = select(Driver, Vehicle).join(
+            Vehicle, Driver.id == Vehicle.current_driver_id
+        ).where(
+            Vehicle.id.in_(vehicle_ids),
+            Driver.status == "ON_DUTY"
+        )
+        result = await db.execute(stmt)
+        return {vehicle.id: (driver, vehicle) for driver, vehicle in result.all()}
 
-    if not available:
-        raise NotFoundException(detail="No available drivers")
+    await position_registry.ensure_seeded(db)
 
-    # Find nearest driver
+    # Find nearest driver: positions come from the spatial index, and only
+    # the closest candidates are checked against the database
     pickup_lat = trip_request.pickup_location["lat"]
     pickup_lng = trip_request.pickup_location["lng"]
 
-    nearest = min(available, key=lambda x: haversine(
-        pickup_lat, pickup_lng, float(x[2].latitude), float(x[2].longitude)
-    ))
+    nearest = await position_registry.nearest_confirmed(pickup_lat, pickup_lng, on_duty)
 
-    driver, vehicle, gps = nearest
+    if not nearest:
+        raise NotFoundException(detail="No available drivers")
+
+    driver, vehicle = nearest[1]
 
     # Calculate estimated fare (simple: $2 base + $1.50/km)
     dest_lat = trip_request.destination["lat"]
     dest_lng = trip_request.destination["lng"]
-    distance = haversine(pickup_lat, pickup_lng, dest_lat, dest_lng)
+    distance = haversine_km(pickup_lat, pickup_lng, dest_lat, dest_lng)
     estimated_fare = 2.0 + (distance * 1.5)
 
     # Identity verification disabled
@@ -574,24 +604,3 @@ async def get_trip(
         raise NotFoundException(detail="Trip not found")
 
     return trip
-
-
-@router.get("/drivers/available", response_model=List[DriverResponse])
-async def get_available_drivers(
-    lat: float = Query(...),
-    lng: float = Query(...),
-    radius: float = Query(5.0),  # km
-    db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_user)
-):
-    """Get available drivers near a location."""
-    from ...models.tracking import GPSLocation
-
-    stmt = select(Driver).join(
-        Vehicle, Driver.id == Vehicle.current_driver_id
-    ).where(Driver.status == "ON_DUTY")
-
-    result = await db.execute(stmt)
-    drivers = result.scalars().all()
-
-    return drivers
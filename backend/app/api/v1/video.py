@@ -2,22 +2,27 @@
 Video API endpoints.
 """
 
-from fastapi import APIRouter, Depends, File, UploadFile, HTTPException, Request, Header, Body
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, Depends, File, UploadFile, HTTPException, Request, Header, Body, Query
+from fastapi.responses import JSONResponse, Response
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from typing import List, Optional
 import base64
 import logging
-from datetime import datetime, timedelta
+from datetime import datetime
 
 from ...database import get_db
 from ...models.user import User
 from ...models.video import VideoArchive, VideoStream
 from ...models.vehicle import Vehicle
-from ...schemas.video import VideoArchiveResponse, FrameUpload
-from ...dependencies import get_current_user
+from ...schemas.video import VideoArchiveResponse, FrameSegment, FrameUpload, FrameUploadResponse
+from ...dependencies import get_current_manager_user, get_current_user
 from ...core.exceptions import NotFoundException
+from ...services.broker import VIDEO_CHANNEL, broker
+from ...services.frame_storage import frame_storage
+from ...services.segmenter import frame_at, segmenter
+from ...services.thumbnails import thumbnailer
+from ...websocket.video import video_manager
 
 logger = logging.getLogger(__name__)
 
@@ -28,8 +33,14 @@ router = APIRouter()
 # ESP32-CAM DEVICE ENDPOINT - Simple image receiver (no AI)
 # ============================================================================
 
-# Store latest frame per device for WebSocket streaming
-latest_frames = {}  # {device_id: {"image": base64_string, "timestamp": datetime}}
+def store_frame(message: dict):
+    """Broker handler: buffer a new frame of a route and push it to this worker's viewers."""
+    video_manager.broadcast_frame(
+        message["route_id"], message["jpeg"], message["timestamp"], message.get("trip_id")
+    )
+
+
+broker.subscribe(VIDEO_CHANNEL, store_frame)
 
 
 @router.post("/device/upload")
@@ -56,14 +67,13 @@ async def device_upload_image(
         route_id = x_route_id or request.query_params.get("route_id", "taxi-01")
         trip_id = x_trip_id or request.query_params.get("trip_id")
 
-        # Store as base64 for WebSocket streaming
-        image_base64 = base64.b64encode(image_bytes).decode('utf-8')
-        latest_frames[route_id] = {
-            "image": image_base64,
+        # Hand the raw JPEG to WebSocket streaming on every worker
+        await broker.publish(VIDEO_CHANNEL, {
+            "route_id": route_id,
+            "jpeg": image_bytes,
             "timestamp": datetime.utcnow().isoformat(),
-            "size": len(image_bytes),
             "trip_id": trip_id  # Associate with trip if provided
-        }
+        })
 
         logger.info(f"📸 Frame received: {route_id}, {len(image_bytes)} bytes, Trip: {trip_id or 'N/A'}")
 
@@ -80,19 +90,29 @@ async def device_upload_image(
 
 
 @router.get("/device/latest/{route_id}")
-async def get_latest_frame(route_id: str):
-    """Get the latest frame for a device (for polling fallback)."""
-    if route_id in latest_frames:
-        return latest_frames[route_id]
-    return {"error": "No frame available", "route_id": route_id}
+async def get_latest_frame(
+    route_id: str,
+    size: Optional[int] = Query(None, description="Return a preview this many pixels wide instead"),
+):
+    """Get the latest frame for a device (for polling fallback and dashboard tiles)."""
+    frame = video_manager.frames.latest(route_id)
+    if frame is None:
+        return {"error": "No frame available", "route_id": route_id}
+    if size is not None:
+        try:
+            await thumbnailer.frame_preview(frame, size)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    return frame.as_dict(size)
 
 
 @router.get("/device/list")
 async def list_active_devices():
     """List all devices that have sent frames."""
+    devices = video_manager.frames.route_ids()
     return {
-        "devices": list(latest_frames.keys()),
-        "count": len(latest_frames)
+        "devices": devices,
+        "count": len(devices)
     }
 
 
@@ -100,12 +120,20 @@ async def list_active_devices():
 # FRAME UPLOAD ENDPOINTS (Base64 JSON format)
 # ============================================================================
 
-@router.post("/frames/upload", response_model=VideoArchiveResponse, status_code=201)
+@router.post("/frames/upload", response_model=FrameUploadResponse, status_code=201)
 async def upload_frame(
     frame_data: FrameUpload,
     db: AsyncSession = Depends(get_db)
 ):
-    """Upload video frame from ESP32 (no auth required for devices)."""
+    """
+    Upload video frame from ESP32 (no auth required for devices).
+    The frame is appended to its camera's open segment, which is returned
+    as an archive without id; its row is created when the segment closes
+    and stored_at is set once it has been written to storage.
+    """
+    if frame_storage.full():
+        raise HTTPException(status_code=503, detail="Frame storage queue is full", headers={"Retry-After": "1"})
+
     # Verify vehicle exists
     stmt = select(Vehicle).where(Vehicle.id == frame_data.vehicle_id)
     result = await db.execute(stmt)
@@ -118,33 +146,40 @@ async def upload_frame(
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Invalid base64: {str(e)}")
 
-    # Generate filename
     timestamp = datetime.utcnow()
-    filename = f"frames/vehicle_{frame_data.vehicle_id}/{timestamp.strftime('%Y%m%d_%H%M%S')}.jpg"
-
-    # Save to S3 (or local for development)
-    # TODO: Implement S3 upload using boto3
-    file_path = filename  # S3 key
+    segment = segmenter.add(
+        frame_data.vehicle_id,
+        frame_data.camera_position,
+        frame_bytes,
+        timestamp,
+        trip_id=frame_data.trip_id,
+        device_id=frame_data.device_id,
+    )
+    _, offset, size = segment.index[-1]
 
-    # Create archive record
-    archive = VideoArchive(
+    return FrameUploadResponse(
         vehicle_id=frame_data.vehicle_id,
-        camera_position=frame_data.camera_position,
-        file_path=file_path,
-        file_size=len(frame_bytes),
-        duration=0,  # Single frame
-        metadata={"device_id": frame_data.device_id, "type": "frame"},
-        retention_until=timestamp + timedelta(days=7)
+        camera_position=segment.camera_position,
+        file_path=segment.path,
+        file_size=segment.size,
+        duration=segment.duration,
+        extra_metadata=segment.metadata(index=False),
+        created_at=timestamp,
+        retention_until=segment.retention_until,
+        segment=FrameSegment(path=segment.path, frame=len(segment.index) - 1, offset=offset, size=size),
     )
 
-    db.add(archive)
-    await db.commit()
-    await db.refresh(archive)
 
-    # TODO: Enqueue for AI analysis
-    # await enqueue_ai_analysis(archive.id)
+@router.get("/frames/storage-stats")
+async def get_frame_storage_stats(current_user: User = Depends(get_current_manager_user)):
+    """Get queue depth, write and failure counters of the frame storage workers (managers only)."""
+    return {**frame_storage.get_stats(), "segments": segmenter.get_stats()}
 
-    return archive
+
+@router.get("/thumbnails/stats")
+async def get_thumbnail_stats(current_user: User = Depends(get_current_manager_user)):
+    """Get queue depth, render and drop counters of the preview workers (managers only)."""
+    return thumbnailer.get_stats()
 
 
 @router.get("/archives", response_model=List[VideoArchiveResponse])
@@ -183,3 +218,39 @@ async def get_video_archive(
         raise NotFoundException(detail="Video archive not found")
 
     return archive
+
+
+@router.get("/archives/{archive_id}/frame")
+async def get_video_archive_frame(
+    archive_id: int,
+    t: float = Query(0, ge=0, description="Seconds from the start of the segment"),
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Get the JPEG shown at a time offset of an archived segment.
+    Only that frame's bytes are read from storage, located by the
+    segment's index; single-frame archives return their one frame.
+    """
+    stmt = select(VideoArchive).where(VideoArchive.id == archive_id)
+    result = await db.execute(stmt)
+    archive = result.scalar_one_or_none()
+
+    if not archive:
+        raise NotFoundException(detail="Video archive not found")
+    if archive.stored_at is None:
+        raise HTTPException(status_code=409, detail="Video archive is not stored yet")
+
+    index = (archive.extra_metadata or {}).get("index")
+    headers = {"Cache-Control": "private, max-age=31536000, immutable"}
+    try:
+        if index:
+            offset_ms, start, length = frame_at(index, t)
+            headers["X-Frame-Offset-Ms"] = str(offset_ms)
+            jpeg = await frame_storage.read(archive.file_path, start, start + length - 1)
+        else:
+            jpeg = await frame_storage.read(archive.file_path)
+    except FileNotFoundError:
+        raise NotFoundException(detail="Video archive file not found")
+
+    return Response(jpeg, media_type="image/jpeg", headers=headers)
@@ -7,10 +7,18 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 from fastapi.exceptions import RequestValidationError
 from contextlib import asynccontextmanager
+from typing import Optional
 import logging
 
 from .config import settings
-from .database import engine, Base, close_db
+from .database import engine, Base, close_db, AsyncSessionLocal
+from .services.gps_buffer import gps_buffer
+from .services.position_registry import position_registry
+from .services.gps_partitions import partition_maintainer
+from .services.broker import broker
+from .services.frame_storage import frame_storage
+from .services.thumbnails import thumbnailer
+from .services.segmenter import segmenter
 
 # Configure logging
 logging.basicConfig(
@@ -35,10 +43,51 @@ async def lifespan(app: FastAPI):
         async with engine.begin() as conn:
             await conn.run_sync(Base.metadata.create_all)
 
+    # Load last known vehicle positions
+    try:
+        async with AsyncSessionLocal() as db:
+            await position_registry.seed(db)
+    except Exception as e:
+        logger.warning(f"Could not seed position registry: {e}")
+
+    # Start GPS write-behind buffer
+    if settings.GPS_WRITE_BEHIND:
+        gps_buffer.start()
+
+    # Create upcoming gps_locations partitions and drop expired ones
+    partition_maintainer.start()
+
+    # Write uploaded video frames to storage in the background
+    frame_storage.start()
+
+    # Render image previews in worker processes
+    thumbnailer.start()
+
+    # Pack uploaded frames into archive segments
+    segmenter.start()
+
+    # Relay WebSocket fan-out between workers (no-op for the in-memory broker)
+    try:
+        await broker.start()
+    except Exception as e:
+        logger.warning(f"Could not start message broker: {e}")
+
+    # Ping idle WebSocket clients and drop the ones that stopped answering
+    heartbeat.start([tracking_manager.outbound, video_manager.outbound, trip_manager.outbound])
+
     yield
 
     # Shutdown
     logger.info("Shutting down application")
+    await heartbeat.stop()
+    await broker.stop()
+    # Archive the open segments first: their bytes go through the frame storage queue,
+    # which is only drained and stopped after them
+    await segmenter.stop()
+    await thumbnailer.stop()
+    await frame_storage.stop()
+    await partition_maintainer.stop()
+    await gps_buffer.stop()
     await close_db()
 
 
@@ -137,43 +186,51 @@ app.include_router(admin_router, prefix="/api/v1/admin", tags=["Admin"])
 
 
 # WebSocket endpoints
-from fastapi import WebSocket, WebSocketDisconnect
+from fastapi import Depends, Query, WebSocket, WebSocketDisconnect
+from .dependencies import get_current_manager_user
+from .models.user import User
 from .websocket.tracking import tracking_manager
 from .websocket.video import video_manager
 from .websocket.trips import trip_manager
-from .api.v1.video import latest_frames
-import asyncio
+from .websocket.heartbeat import connection_limits, heartbeat
 
 
 @app.websocket("/ws/tracking")
-async def websocket_tracking_endpoint(websocket: WebSocket):
+async def websocket_tracking_endpoint(
+    websocket: WebSocket,
+    tick_ms: int = Query(0, ge=0, le=60000, description="Batch updates every N ms (0 = every fix)"),
+    since: Optional[int] = Query(None, ge=0, description="Resume after this sequence number"),
+    epoch: Optional[str] = Query(None, max_length=16, description="Epoch of the snapshot or replay `since` came from"),
+):
     """WebSocket endpoint for real-time GPS tracking updates."""
-    await tracking_manager.connect(websocket)
+    if not await tracking_manager.connect(websocket, tick_ms):
+        return
     try:
+        tracking_manager.resume(websocket, since, epoch)
         while True:
-            data = await websocket.receive_text()
+            # Subscribe/unsubscribe messages narrow the stream to vehicles or a map area
+            data = await tracking_manager.outbound.receive_text(websocket)
+            tracking_manager.handle_message(websocket, data)
     except WebSocketDisconnect:
         tracking_manager.disconnect(websocket)
 
 
 @app.websocket("/ws/video/{route_id}")
-async def websocket_video_endpoint(websocket: WebSocket, route_id: str):
+async def websocket_video_endpoint(
+    websocket: WebSocket,
+    route_id: str,
+    rewind: int = Query(0, ge=0, le=1000, description="Start with up to N buffered frames"),
+):
     """
     WebSocket endpoint for real-time video streaming.
     Frontend connects here to receive frames from ESP32-CAM devices.
     """
-    await video_manager.connect(websocket, route_id)
+    if not await video_manager.connect(websocket, route_id, rewind):
+        return
     try:
-        while True:
-            # Send latest frame every 100ms if available
-            if route_id in latest_frames:
-                await websocket.send_json({
-                    "type": "frame",
-                    "route_id": route_id,
-                    **latest_frames[route_id]
-                })
-            await asyncio.sleep(0.1)  # 10 FPS max
-    except WebSocketDisconnect:
+        # Frames are pushed by uploads; only read pongs and wait for the viewer to leave
+        await video_manager.outbound.drain(websocket)
+    finally:
         video_manager.disconnect(websocket, route_id)
 
 
@@ -183,14 +240,15 @@ async def websocket_driver_trips(websocket: WebSocket, driver_id: int):
     WebSocket endpoint for drivers to receive real-time trip requests.
     All connected drivers will see new trip requests instantly.
     """
-    await trip_manager.connect_driver(websocket, driver_id)
+    if not await trip_manager.connect_driver(websocket, driver_id):
+        return
     try:
         while True:
             # Keep connection alive, waiting for messages
-            data = await websocket.receive_text()
+            data = await trip_manager.outbound.receive_text(websocket)
             # Handle any driver messages (e.g., acknowledgments)
     except WebSocketDisconnect:
-        trip_manager.disconnect_driver(driver_id)
+        trip_manager.disconnect_driver(driver_id, websocket)
 
 
 @app.websocket("/ws/trips/customer/{customer_id}")
@@ -199,14 +257,15 @@ async def websocket_customer_trips(websocket: WebSocket, customer_id: int):
     WebSocket endpoint for customers to receive real-time trip updates.
     Customer will be notified when driver accepts, arrives, starts, completes trip.
     """
-    await trip_manager.connect_customer(websocket, customer_id)
+    if not await trip_manager.connect_customer(websocket, customer_id):
+        return
     try:
         while True:
             # Keep connection alive, waiting for messages
-            data = await websocket.receive_text()
+            data = await trip_manager.outbound.receive_text(websocket)
             # Handle any customer messages
     except WebSocketDisconnect:
-        trip_manager.disconnect_customer(customer_id)
+        trip_manager.disconnect_customer(customer_id, websocket)
 
 
 @app.get("/api/v1/trips/ws-stats")
@@ -215,6 +274,21 @@ async def get_trip_ws_stats():
     return trip_manager.get_stats()
 
 
+@app.get("/api/v1/ws-stats")
+async def get_ws_stats(current_user: User = Depends(get_current_manager_user)):
+    """
+    Get connection, queue, drop and reap counters of every WebSocket manager.
+    Fleet managers and admins only: it lists client addresses and connected user IDs.
+    """
+    return {
+        "connections": connection_limits.stats(),
+        "tracking": tracking_manager.get_stats(),
+        "video": video_manager.get_stats(),
+        "trips": trip_manager.get_stats(),
+        "broker": broker.stats(),
+    }
+
+
 # SQLAdmin setup
 if settings.DEBUG:
     from sqladmin import Admin
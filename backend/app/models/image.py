@@ -16,7 +16,9 @@ class TripImage(Base):
     id = Column(Integer, primary_key=True, index=True)
     trip_id = Column(Integer, ForeignKey("trips.id", ondelete="CASCADE"), nullable=False, index=True)
     device_id = Column(String(100))  # ESP32-CAM device identifier
-    image_data = Column(Text, nullable=False)  # Base64 encoded image
+    image_data = Column(Text, nullable=True)  # Legacy base64 image, until moved to the blob store
+    blob_key = Column(String(64), index=True)  # SHA-256 of the JPEG in the blob store
+    size = Column(Integer)  # JPEG size in bytes
     captured_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
 
     # Relationships
@@ -2,7 +2,7 @@
 GPS tracking model.
 """
 
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Numeric
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Numeric, Index
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from ..database import Base
@@ -14,7 +14,7 @@ class GPSLocation(Base):
     __tablename__ = "gps_locations"
 
     id = Column(Integer, primary_key=True, index=True)
-    vehicle_id = Column(Integer, ForeignKey("vehicles.id", ondelete="CASCADE"), nullable=False, index=True)
+    vehicle_id = Column(Integer, ForeignKey("vehicles.id", ondelete="CASCADE"), nullable=False)
     latitude = Column(Numeric(10, 8), nullable=False)
     longitude = Column(Numeric(11, 8), nullable=False)
     speed = Column(Numeric(6, 2), default=0.00)  # km/h
@@ -24,6 +24,11 @@ class GPSLocation(Base):
     device_id = Column(String(50))  # ESP32 device identifier
     timestamp = Column(DateTime(timezone=True), nullable=False, index=True, server_default=func.now())
 
+    __table_args__ = (
+        # History and last-position lookups: one vehicle, newest first
+        Index("ix_gps_locations_vehicle_timestamp", vehicle_id, timestamp.desc()),
+    )
+
     # Relationships
     vehicle = relationship("Vehicle", back_populates="gps_locations")
 
@@ -62,6 +62,7 @@ class VideoArchive(Base):
     extra_metadata = Column(JSON)  # Additional metadata (device_id, fps, resolution, etc.)
     created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
     retention_until = Column(DateTime(timezone=True))  # Auto-delete after this date
+    stored_at = Column(DateTime(timezone=True))  # Set once the file is written (NULL while queued or failed)
 
     # Relationships
     vehicle = relationship("Vehicle", back_populates="video_archives")
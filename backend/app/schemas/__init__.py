@@ -1,10 +1,10 @@
 """Pydantic schemas."""
 from .user import UserCreate, UserUpdate, UserResponse, UserLogin
 from .token import Token, TokenPayload
-from .vehicle import DriverCreate, DriverUpdate, DriverResponse
+from .vehicle import DriverCreate, DriverUpdate, DriverResponse, NearbyDriverResponse
 from .vehicle import VehicleCreate, VehicleUpdate, VehicleResponse
 from .vehicle import TripCreate, TripUpdate, TripResponse
-from .tracking import GPSLocationCreate, GPSLocationResponse
+from .tracking import GPSLocationCreate, GPSLocationResponse, GPSBatchItemResult, GPSBatchResponse
 from .video import VideoArchiveResponse, VideoStreamResponse
 from .chat import ChatMessage, ChatResponse
 from .admin import (
@@ -17,10 +17,10 @@ from .admin import (
 __all__ = [
     "UserCreate", "UserUpdate", "UserResponse", "UserLogin",
     "Token", "TokenPayload",
-    "DriverCreate", "DriverUpdate", "DriverResponse",
+    "DriverCreate", "DriverUpdate", "DriverResponse", "NearbyDriverResponse",
     "VehicleCreate", "VehicleUpdate", "VehicleResponse",
     "TripCreate", "TripUpdate", "TripResponse",
-    "GPSLocationCreate", "GPSLocationResponse",
+    "GPSLocationCreate", "GPSLocationResponse", "GPSBatchItemResult", "GPSBatchResponse",
     "VideoArchiveResponse", "VideoStreamResponse",
     "ChatMessage", "ChatResponse",
     "AdminLogCreate", "AdminLogResponse", "AdminLogListResponse",
@@ -12,11 +12,13 @@ class TripImageCreate(BaseModel):
 
 
 class TripImageResponse(BaseModel):
-    """Schema for trip image response."""
+    """Schema for trip image response; the JPEG is served by GET /images/blobs/{blob_key}."""
     id: int
     trip_id: int
     device_id: Optional[str] = None
-    image_data: str
+    blob_key: Optional[str] = None
+    size: Optional[int] = None
+    image_data: Optional[str] = Field(None, description="Base64 image of rows not yet moved to the blob store")
     captured_at: datetime
 
     class Config:
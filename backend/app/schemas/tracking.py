@@ -1,9 +1,11 @@
 """
 Pydantic schemas for GPS tracking.
 """
-from pydantic import BaseModel, Field
-from datetime import datetime
-from typing import Optional
+from pydantic import BaseModel, Field, field_validator, model_validator
+from datetime import datetime, timedelta, timezone
+from typing import Literal, Optional, List, Tuple
+
+from ..config import settings
 
 
 class GPSLocationCreate(BaseModel):
@@ -16,11 +18,33 @@ class GPSLocationCreate(BaseModel):
     accuracy: Optional[float] = Field(None, ge=0, description="GPS accuracy in meters")
     altitude: Optional[float] = Field(None, description="Altitude in meters")
     device_id: Optional[str] = Field(None, max_length=100, description="Device identifier")
+    timestamp: Optional[datetime] = Field(None, description="Fix time (defaults to server receive time)")
+
+    @field_validator("timestamp")
+    @classmethod
+    def normalize_timestamp(cls, v: Optional[datetime]) -> Optional[datetime]:
+        """
+        Store device timestamps as naive UTC, like server-side ones, and
+        refuse fixes outside the partitioned range: ones already past
+        GPS_RETENTION_DAYS or beyond the GPS_PARTITION_PREMAKE_DAYS of
+        pre-created partitions (a wrong device clock) would otherwise land
+        in the default partition.
+        """
+        if v is None:
+            return v
+        if v.tzinfo is not None:
+            v = v.astimezone(timezone.utc).replace(tzinfo=None)
+        now = datetime.utcnow()
+        if v > now + timedelta(days=settings.GPS_PARTITION_PREMAKE_DAYS):
+            raise ValueError("timestamp is too far in the future")
+        if settings.GPS_RETENTION_DAYS > 0 and v < now - timedelta(days=settings.GPS_RETENTION_DAYS):
+            raise ValueError("timestamp is older than the GPS retention period")
+        return v
 
 
 class GPSLocationResponse(BaseModel):
     """Schema for GPS location response."""
-    id: int
+    id: Optional[int] = None  # None while the fix is still queued for writing
     vehicle_id: int
     latitude: float
     longitude: float
@@ -32,3 +56,48 @@ class GPSLocationResponse(BaseModel):
 
     class Config:
         from_attributes = True
+
+
+class GPSBatchItemResult(BaseModel):
+    """Per-fix outcome of a batch upload."""
+    index: int
+    accepted: bool
+    id: Optional[int] = None
+    error: Optional[str] = None
+
+
+class GPSBatchResponse(BaseModel):
+    """Schema for batch GPS upload response."""
+    accepted: int
+    rejected: int
+    results: List[GPSBatchItemResult]
+
+
+class BoundingBox(BaseModel):
+    """Map viewport a tracking client wants updates for."""
+    min_lat: float = Field(..., ge=-90, le=90)
+    min_lng: float = Field(..., ge=-180, le=180)
+    max_lat: float = Field(..., ge=-90, le=90)
+    max_lng: float = Field(..., ge=-180, le=180)
+
+    @model_validator(mode="after")
+    def check_order(self) -> "BoundingBox":
+        if self.min_lat > self.max_lat or self.min_lng > self.max_lng:
+            raise ValueError("min_lat/min_lng must not exceed max_lat/max_lng")
+        return self
+
+    def as_tuple(self) -> Tuple[float, float, float, float]:
+        return (self.min_lat, self.min_lng, self.max_lat, self.max_lng)
+
+
+class TrackingSubscription(BaseModel):
+    """
+    Client message on /ws/tracking.
+
+    subscribe adds vehicle_ids and/or replaces the viewport ("bbox": null
+    clears it); unsubscribe removes vehicle_ids, or with no fields clears
+    every filter so the client receives the whole fleet again.
+    """
+    action: Literal["subscribe", "unsubscribe"]
+    vehicle_ids: Optional[List[int]] = Field(None, max_length=1000)
+    bbox: Optional[BoundingBox] = None
@@ -40,6 +40,14 @@ class DriverResponse(DriverBase):
         from_attributes = True
 
 
+class NearbyDriverResponse(DriverResponse):
+    """Schema for an available driver near a location."""
+    vehicle_id: int
+    latitude: float
+    longitude: float
+    distance_km: float
+
+
 # Vehicle Schemas
 class VehicleBase(BaseModel):
     """Base vehicle schema."""
@@ -52,17 +52,36 @@ class VideoArchiveResponse(VideoArchiveBase):
     duration: int
     file_size: int
     thumbnail_url: Optional[str] = None
-    metadata: Optional[dict] = None
+    metadata: Optional[dict] = Field(None, validation_alias="extra_metadata")
     created_at: datetime
     retention_until: Optional[datetime] = None
+    stored_at: Optional[datetime] = None
 
     class Config:
         from_attributes = True
 
 
+class FrameSegment(BaseModel):
+    """Where an uploaded frame sits in its camera's open segment."""
+    path: str
+    frame: int  # Position of the frame in the segment
+    offset: int  # Byte offset of the frame in the segment
+    size: int
+
+
+class FrameUploadResponse(VideoArchiveResponse):
+    """
+    Upload response: the archive the frame will be stored in. Its row is
+    only created when the segment closes, so id is None until then.
+    """
+    id: Optional[int] = None
+    segment: Optional[FrameSegment] = None
+
+
 class FrameUpload(BaseModel):
     """Schema for uploading a frame from ESP32."""
     device_id: str
     vehicle_id: int
     camera_position: CameraPosition = CameraPosition.FRONT
+    trip_id: Optional[int] = None  # Frames of different trips go to different segments
     frame_base64: str  # Base64 encoded image
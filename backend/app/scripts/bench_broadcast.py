@@ -0,0 +1,122 @@
+"""
+Benchmark: tracking broadcast latency with many dashboard sockets.
+
+GPS ingest awaits the location broadcast, so broadcast latency is added
+to every ingest request. Compares ConnectionManager.publish_location
+(encode once, queue on each client's bounded outbound queue, sent by
+per-client writer tasks) against the previous loop, which awaited send_json on each
+socket in turn. Sockets are simulated in memory; a fraction of them are
+slow, like phones on a bad network.
+
+With --tick-ms the simulated dashboards use tick mode, and the frames
+each one received show the effect of coalescing updates per tick.
+
+Usage:
+    python -m app.scripts.bench_broadcast --sockets 5000 --slow-fraction 0.01
+    python -m app.scripts.bench_broadcast --sockets 1000 --tick-ms 250 --interval-ms 1
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from datetime import datetime
+
+from app.config import settings
+from app.scripts.bench_dispatch import report
+from app.websocket.tracking import ConnectionManager
+
+
+class SimulatedSocket:
+    """In-memory WebSocket that takes `delay` seconds to accept each frame."""
+
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.frames = 0
+
+    async def send_text(self, text: str):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        self.frames += 1
+
+    async def send_json(self, data: dict):
+        await self.send_text(json.dumps(data))
+
+    async def close(self, code: int = 1000):
+        pass
+
+
+def make_sockets(count: int, slow_fraction: float, slow_ms: float, rng: random.Random):
+    return [
+        SimulatedSocket(slow_ms / 1000 if rng.random() < slow_fraction else 0)
+        for _ in range(count)
+    ]
+
+
+async def legacy_broadcast(sockets, message: dict):
+    """Previous broadcast: serialize and await each socket in turn."""
+    for socket in sockets:
+        await socket.send_json(message)
+
+
+def make_message(i: int) -> dict:
+    return {
+        "type": "location_update",
+        "data": {
+            "id": None, "vehicle_id": i % 500, "latitude": 40.7128, "longitude": -74.0060,
+            "speed": 32.5, "heading": 180, "timestamp": datetime.utcnow().isoformat(),
+        },
+    }
+
+
+async def run(args):
+    rng = random.Random(args.seed)
+    settings.WS_SEND_TIMEOUT_MS = args.send_timeout_ms
+
+    manager = ConnectionManager()
+    sockets = make_sockets(args.sockets, args.slow_fraction, args.slow_ms, rng)
+    for socket in sockets:
+        manager.register(socket, tick_ms=args.tick_ms)
+    samples = []
+    for i in range(args.updates):
+        started = time.perf_counter()
+        manager.publish_location(make_message(i))
+        samples.append((time.perf_counter() - started) * 1e6)
+        await asyncio.sleep(args.interval_ms / 1000)  # Writers drain between ingest requests
+    print(f"Connected after {args.updates} updates: {len(manager.active_connections):,} "
+          f"(slow clients dropped after the send timeout)")
+    await asyncio.sleep(max(args.tick_ms, args.send_timeout_ms) / 1000 * 2)  # Last tick and sends
+    fast = [socket for socket in sockets if not socket.delay]
+    print(f"Frames per dashboard for {args.updates} updates: "
+          f"{sum(socket.frames for socket in fast) / len(fast):,.1f}")
+    print(f"Outbound: {manager.get_stats()}")
+
+    legacy_sockets = make_sockets(args.sockets, args.slow_fraction, args.slow_ms, rng)
+    legacy_samples = []
+    for i in range(args.legacy_updates):
+        started = time.perf_counter()
+        await legacy_broadcast(legacy_sockets, make_message(i))
+        legacy_samples.append((time.perf_counter() - started) * 1e6)
+
+    print()
+    report("queued", samples)
+    report("sequential", legacy_samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark tracking broadcast latency")
+    parser.add_argument("--sockets", type=int, default=5000)
+    parser.add_argument("--slow-fraction", type=float, default=0.01)
+    parser.add_argument("--slow-ms", type=float, default=250)
+    parser.add_argument("--send-timeout-ms", type=int, default=100)
+    parser.add_argument("--updates", type=int, default=200)
+    parser.add_argument("--interval-ms", type=float, default=10, help="Time between updates")
+    parser.add_argument("--tick-ms", type=int, default=0, help="Dashboards batch updates every N ms")
+    parser.add_argument("--legacy-updates", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+Benchmark: nearest-driver lookup for trip dispatch.
+
+Times the lookup request_trip runs, PositionRegistry.nearest_confirmed,
+which takes the nearest vehicles from the grid index and confirms them
+with one `vehicle_id IN (...)` query, widening until one is ON_DUTY.
+Compares it against loading every ON_DUTY driver and filtering the index
+with a membership predicate ("full load"), and against the original
+approach, which ran min() with a pure-Python haversine over every GPS row
+("legacy scan"). The database is replaced by an in-memory lookup of the
+ON_DUTY vehicles, so only the rows each query returns are counted, not
+the round trip; dispatch returns k rows per round, full load the fleet.
+
+Usage:
+    python -m app.scripts.bench_dispatch --drivers 10000 --gps-rows 10000000 --on-duty 0.2
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+from array import array
+from datetime import datetime
+
+from app.services.position_registry import PositionRegistry
+from app.services.spatial_index import haversine_km
+
+# NYC area coordinates
+NYC_CENTER = {"lat": 40.7128, "lng": -74.0060}
+SPREAD_DEG = 0.3  # roughly 30km
+
+
+def generate_history(drivers: int, gps_rows: int, rng: random.Random):
+    """Generate a GPS history as flat arrays (vehicle_id, lat, lng), oldest first."""
+    vehicle_ids = array("i")
+    lats = array("d")
+    lngs = array("d")
+    for row in range(gps_rows):
+        vehicle_ids.append(row % drivers)
+        lats.append(NYC_CENTER["lat"] + rng.uniform(-SPREAD_DEG, SPREAD_DEG))
+        lngs.append(NYC_CENTER["lng"] + rng.uniform(-SPREAD_DEG, SPREAD_DEG))
+    return vehicle_ids, lats, lngs
+
+
+def legacy_nearest(lats: array, lngs: array, vehicle_ids: array, lat: float, lng: float) -> int:
+    """Previous dispatch: min() over every GPS row ever recorded."""
+    best = min(range(len(lats)), key=lambda i: haversine_km(lat, lng, lats[i], lngs[i]))
+    return vehicle_ids[best]
+
+
+def report(name: str, samples: list):
+    """Print latency statistics in microseconds."""
+    samples = sorted(samples)
+    p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+    print(
+        f"{name:<14} mean={statistics.mean(samples):>14,.1f}us  "
+        f"p50={statistics.median(samples):>14,.1f}us  p99={p99:>14,.1f}us"
+    )
+
+
+async def run(args):
+    rng = random.Random(args.seed)
+    print(f"Generating {args.gps_rows:,} GPS rows for {args.drivers:,} drivers...")
+    vehicle_ids, lats, lngs = generate_history(args.drivers, args.gps_rows, rng)
+
+    # The registry holds only the newest fix per driver: the last row of each
+    registry = PositionRegistry()
+    now = datetime.utcnow()
+    for row in range(max(0, len(lats) - args.drivers), len(lats)):
+        registry.update({"vehicle_id": vehicle_ids[row], "latitude": lats[row],
+                         "longitude": lngs[row], "timestamp": now})
+    on_duty = {vehicle_id: ("driver", vehicle_id) for vehicle_id in range(args.drivers)
+               if rng.random() < args.on_duty}
+    print(f"Indexed {len(registry):,} drivers, {len(on_duty):,} ON_DUTY")
+
+    queries = [
+        (NYC_CENTER["lat"] + rng.uniform(-SPREAD_DEG, SPREAD_DEG),
+         NYC_CENTER["lng"] + rng.uniform(-SPREAD_DEG, SPREAD_DEG))
+        for _ in range(max(args.queries, args.legacy_queries))
+    ]
+    rows_returned = 0
+
+    async def confirm(candidates):
+        # Stands in for the SELECT ... WHERE vehicle_id IN (...) AND status = 'ON_DUTY'
+        nonlocal rows_returned
+        found = {vehicle_id: on_duty[vehicle_id] for vehicle_id in candidates if vehicle_id in on_duty}
+        rows_returned += len(candidates)
+        return found
+
+    dispatch_samples = []
+    for lat, lng in queries[:args.queries]:
+        started = time.perf_counter()
+        await registry.nearest_confirmed(lat, lng, confirm, k=args.candidates)
+        dispatch_samples.append((time.perf_counter() - started) * 1e6)
+    dispatch_rows = rows_returned / args.queries
+
+    full_load_samples = []
+    for lat, lng in queries[:args.queries]:
+        started = time.perf_counter()
+        available = {vehicle_id: row for vehicle_id, row in on_duty.items()}
+        registry.index.nearest(lat, lng, k=1, predicate=lambda vehicle_id: vehicle_id in available)
+        full_load_samples.append((time.perf_counter() - started) * 1e6)
+
+    legacy_samples = []
+    for lat, lng in queries[:args.legacy_queries]:
+        started = time.perf_counter()
+        legacy_nearest(lats, lngs, vehicle_ids, lat, lng)
+        legacy_samples.append((time.perf_counter() - started) * 1e6)
+
+    print()
+    report("dispatch", dispatch_samples)
+    report("full load", full_load_samples)
+    report("legacy scan", legacy_samples)
+    print(f"\nRows checked per request: dispatch {dispatch_rows:,.1f}, full load {len(on_duty):,}")
+    print(f"Speedup over full load (mean): "
+          f"{statistics.mean(full_load_samples) / statistics.mean(dispatch_samples):,.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark nearest-driver lookup")
+    parser.add_argument("--drivers", type=int, default=10_000)
+    parser.add_argument("--gps-rows", type=int, default=10_000_000)
+    parser.add_argument("--on-duty", type=float, default=0.2, help="Fraction of drivers that are ON_DUTY")
+    parser.add_argument("--candidates", type=int, default=8, help="First batch of nearest vehicles to confirm")
+    parser.add_argument("--queries", type=int, default=1000, help="Queries per dispatch approach")
+    parser.add_argument("--legacy-queries", type=int, default=3, help="Queries against the legacy scan")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
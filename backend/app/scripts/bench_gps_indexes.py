@@ -0,0 +1,192 @@
+"""
+Benchmark: gps_locations indexes for the history and last-position queries.
+
+Seeds a scratch table shaped like gps_locations and times the queries
+with the previous single-column indexes, with the composite
+(vehicle_id, timestamp DESC) index of migration 003, and with its
+covering variant. The scan type of each plan is printed alongside, so
+index-only scans are visible. The scratch table is dropped afterwards
+unless --keep is given.
+
+Usage:
+    python -m app.scripts.bench_gps_indexes --rows 50000000 --vehicles 1000
+"""
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import time
+
+from sqlalchemy import text
+
+from app.database import engine
+
+TABLE = "bench_gps_locations"
+
+QUERIES = {
+    "history": (
+        f"SELECT * FROM {TABLE} WHERE vehicle_id = :vehicle_id "
+        "AND timestamp >= now() - interval '24 hours' ORDER BY timestamp DESC LIMIT 1000"
+    ),
+    "history compact": (
+        f"SELECT vehicle_id, latitude, longitude, speed, heading, timestamp FROM {TABLE} "
+        "WHERE vehicle_id = :vehicle_id AND timestamp >= now() - interval '24 hours' "
+        "ORDER BY timestamp DESC LIMIT 1000"
+    ),
+    "last position": (
+        f"SELECT latitude, longitude, speed, heading, timestamp FROM {TABLE} "
+        "WHERE vehicle_id = :vehicle_id ORDER BY timestamp DESC LIMIT 1"
+    ),
+}
+
+INDEX_SETUPS = {
+    "single-column": [
+        f"CREATE INDEX {TABLE}_vehicle_id ON {TABLE} (vehicle_id)",
+        f"CREATE INDEX {TABLE}_timestamp ON {TABLE} (timestamp)",
+    ],
+    "composite": [
+        f"CREATE INDEX {TABLE}_vehicle_timestamp ON {TABLE} (vehicle_id, timestamp DESC)",
+    ],
+    "covering": [
+        f"CREATE INDEX {TABLE}_vehicle_timestamp ON {TABLE} (vehicle_id, timestamp DESC) "
+        "INCLUDE (latitude, longitude, speed, heading)",
+    ],
+}
+
+
+async def seed(conn, rows: int, vehicles: int, days: int, chunk: int):
+    """Create the scratch table and fill it with random fixes spread over `days`."""
+    await conn.execute(text(f"DROP TABLE IF EXISTS {TABLE}"))
+    await conn.execute(text(f"""
+        CREATE TABLE {TABLE} (
+            id BIGSERIAL PRIMARY KEY,
+            vehicle_id INTEGER NOT NULL,
+            latitude NUMERIC(10, 8) NOT NULL,
+            longitude NUMERIC(11, 8) NOT NULL,
+            speed NUMERIC(6, 2),
+            heading INTEGER,
+            accuracy NUMERIC(6, 2),
+            altitude NUMERIC(8, 2),
+            device_id VARCHAR(50),
+            timestamp TIMESTAMP WITH TIME ZONE NOT NULL
+        )
+    """))
+    started = time.perf_counter()
+    for offset in range(0, rows, chunk):
+        count = min(chunk, rows - offset)
+        await conn.execute(text(f"""
+            INSERT INTO {TABLE} (vehicle_id, latitude, longitude, speed, heading, accuracy, device_id, timestamp)
+            SELECT
+                1 + (g % :vehicles),
+                40.7128 + (random() - 0.5) * 0.6,
+                -74.0060 + (random() - 0.5) * 0.6,
+                round((random() * 80)::numeric, 2),
+                (random() * 359)::int,
+                5.0,
+                'ESP32-' || (1 + (g % :vehicles)),
+                now() - random() * make_interval(days => :days)
+            FROM generate_series(1, :count) AS g
+        """), {"vehicles": vehicles, "days": days, "count": count})
+        print(f"  {offset + count:,} / {rows:,} rows ({time.perf_counter() - started:.0f}s)")
+
+
+async def drop_indexes(conn):
+    """Drop every benchmark index except the primary key."""
+    result = await conn.execute(text(
+        "SELECT indexname FROM pg_indexes WHERE tablename = :table AND indexname <> :pkey"
+    ), {"table": TABLE, "pkey": f"{TABLE}_pkey"})
+    for name in result.scalars().all():
+        await conn.execute(text(f"DROP INDEX {name}"))
+
+
+def scan_types(plan: dict) -> list:
+    """Collect the scan node types of a JSON plan."""
+    found = [plan["Node Type"]] if "Scan" in plan["Node Type"] else []
+    for child in plan.get("Plans", []):
+        found.extend(scan_types(child))
+    return found
+
+
+async def run_queries(conn, vehicle_ids: list) -> dict:
+    """Time each query over the sampled vehicles. Returns {name: (samples_ms, scans)}."""
+    results = {}
+    for name, sql in QUERIES.items():
+        plan = await conn.execute(text(f"EXPLAIN (FORMAT JSON) {sql}"), {"vehicle_id": vehicle_ids[0]})
+        plan = plan.scalar()
+        plan = json.loads(plan) if isinstance(plan, str) else plan
+        scans = sorted(set(scan_types(plan[0]["Plan"])))
+
+        samples = []
+        for vehicle_id in vehicle_ids:
+            started = time.perf_counter()
+            result = await conn.execute(text(sql), {"vehicle_id": vehicle_id})
+            result.all()
+            samples.append((time.perf_counter() - started) * 1000)
+        results[name] = (samples, scans)
+    return results
+
+
+def report(setup: str, results: dict):
+    """Print latency statistics in milliseconds."""
+    print(f"\n[{setup}]")
+    for name, (samples, scans) in results.items():
+        samples = sorted(samples)
+        p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+        print(
+            f"  {name:<16} mean={statistics.mean(samples):>9.2f}ms  "
+            f"p50={statistics.median(samples):>9.2f}ms  p99={p99:>9.2f}ms  "
+            f"scan={', '.join(scans)}"
+        )
+
+
+async def run(args):
+    rng = random.Random(args.seed)
+    vehicle_ids = [rng.randint(1, args.vehicles) for _ in range(args.queries)]
+
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        if not args.reuse:
+            print(f"Seeding {args.rows:,} rows for {args.vehicles:,} vehicles over {args.days} days...")
+            await seed(conn, args.rows, args.vehicles, args.days, args.chunk)
+
+        try:
+            for setup, statements in INDEX_SETUPS.items():
+                await drop_indexes(conn)
+                started = time.perf_counter()
+                for statement in statements:
+                    await conn.execute(text(statement))
+                # Refresh statistics and the visibility map (needed for index-only scans)
+                await conn.execute(text(f"VACUUM ANALYZE {TABLE}"))
+                size = await conn.execute(text(
+                    "SELECT pg_size_pretty(sum(pg_relation_size(indexrelid))) FROM pg_index "
+                    "WHERE indrelid = CAST(:table AS regclass) AND NOT indisprimary"
+                ), {"table": TABLE})
+                print(f"\nBuilt {setup} indexes in {time.perf_counter() - started:.1f}s "
+                      f"(size {size.scalar()})")
+
+                await run_queries(conn, vehicle_ids[:10])  # Warm the cache
+                report(setup, await run_queries(conn, vehicle_ids))
+        finally:
+            if not args.keep:
+                await conn.execute(text(f"DROP TABLE IF EXISTS {TABLE}"))
+
+    await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark gps_locations history indexes")
+    parser.add_argument("--rows", type=int, default=50_000_000)
+    parser.add_argument("--vehicles", type=int, default=1000)
+    parser.add_argument("--days", type=int, default=30, help="Time span of the seeded fixes")
+    parser.add_argument("--queries", type=int, default=200, help="Queries per setup and query type")
+    parser.add_argument("--chunk", type=int, default=5_000_000, help="Rows per INSERT while seeding")
+    parser.add_argument("--reuse", action="store_true", help=f"Reuse an existing {TABLE} table")
+    parser.add_argument("--keep", action="store_true", help=f"Keep {TABLE} after the run")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
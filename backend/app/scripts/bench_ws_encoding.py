@@ -0,0 +1,89 @@
+"""
+Benchmark: bytes on the wire for tracking location updates.
+
+Replays a random-walk fleet through the JSON location_update frames that
+/ws/tracking sends by default and through the msgpack subprotocol
+(keyframes plus per-vehicle deltas), for per-fix delivery and for tick
+batches.
+
+Usage:
+    python -m app.scripts.bench_ws_encoding --vehicles 500 --updates 100000
+"""
+import argparse
+import random
+from datetime import datetime, timedelta
+
+from app.websocket.compact import CompactEncoder, pack_positions
+from app.websocket.outbound import encode
+
+# NYC area coordinates
+NYC_CENTER = {"lat": 40.7128, "lng": -74.0060}
+
+
+def generate_updates(vehicles: int, updates: int, rng: random.Random):
+    """Location message data, one fix per vehicle in turn, about 1 s apart."""
+    positions = {
+        vehicle_id: [NYC_CENTER["lat"] + rng.uniform(-0.2, 0.2), NYC_CENTER["lng"] + rng.uniform(-0.2, 0.2)]
+        for vehicle_id in range(1, vehicles + 1)
+    }
+    started = datetime(2024, 12, 1, 8, 0)
+    for i in range(updates):
+        vehicle_id = i % vehicles + 1
+        position = positions[vehicle_id]
+        position[0] += rng.uniform(-0.0002, 0.0002)
+        position[1] += rng.uniform(-0.0002, 0.0002)
+        yield {
+            "id": None,
+            "vehicle_id": vehicle_id,
+            "latitude": position[0],
+            "longitude": position[1],
+            "speed": round(rng.uniform(0, 60), 2),
+            "heading": rng.randrange(360),
+            "timestamp": (started + timedelta(seconds=i / vehicles)).isoformat(),
+        }
+
+
+def report(name: str, total: int, frames: int, baseline: int):
+    print(f"{name:<22} {total:>14,} bytes  {total / frames:>8.1f} B/frame  "
+          f"{baseline / total:>6.1f}x smaller than JSON")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare JSON and msgpack tracking frame sizes")
+    parser.add_argument("--vehicles", type=int, default=500)
+    parser.add_argument("--updates", type=int, default=100_000)
+    parser.add_argument("--keyframe-every", type=int, default=30)
+    parser.add_argument("--batch", type=int, default=250, help="Updates per tick batch")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    updates = list(generate_updates(args.vehicles, args.updates, random.Random(args.seed)))
+
+    json_bytes = sum(len(encode({"type": "location_update", "data": data}).encode()) for data in updates)
+
+    encoder = CompactEncoder(keyframe_every=args.keyframe_every)
+    client = object()
+    msgpack_bytes = 0
+    msgpack_frames = 0
+    for data in updates:
+        generation, keyframe, delta = encoder.encode(data)
+        if encoder.needs_keyframe(client, data["vehicle_id"], generation):
+            msgpack_bytes += len(keyframe)
+            msgpack_frames += 1
+        if delta is not None:
+            msgpack_bytes += len(delta)
+            msgpack_frames += 1
+
+    batches = [updates[i:i + args.batch] for i in range(0, len(updates), args.batch)]
+    json_batch_bytes = sum(len(encode({"type": "location_batch", "data": b}).encode()) for b in batches)
+    msgpack_batch_bytes = sum(len(pack_positions("b", b)) for b in batches)
+
+    print(f"{len(updates):,} updates from {args.vehicles:,} vehicles\n")
+    report("JSON per fix", json_bytes, len(updates), json_bytes)
+    report("msgpack per fix", msgpack_bytes, msgpack_frames, json_bytes)
+    report("JSON batches", json_batch_bytes, len(batches), json_bytes)
+    report("msgpack batches", msgpack_batch_bytes, len(batches), json_bytes)
+
+
+if __name__ == "__main__":
+    main()
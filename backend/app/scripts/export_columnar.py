@@ -0,0 +1,44 @@
+"""
+Export gps_locations and trips to partitioned Parquet for offline analytics.
+
+Usage:
+    python -m app.scripts.export_columnar --days 1
+    python -m app.scripts.export_columnar --start 2024-12-01 --end 2024-12-08 --dest s3://bucket/taxiwatch
+    python -m app.scripts.export_columnar --table gps_locations --dest ./exports
+"""
+import argparse
+import asyncio
+from datetime import datetime, timedelta
+
+from app.services.columnar_export import EXPORT_TABLES, run_columnar_export
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export GPS fixes and trips to Parquet")
+    parser.add_argument("--table", action="append", choices=sorted(EXPORT_TABLES),
+                        help="Table to export; repeat for several (default: all)")
+    parser.add_argument("--start", type=datetime.fromisoformat, help="Inclusive, UTC (from its midnight)")
+    parser.add_argument("--end", type=datetime.fromisoformat, help="Exclusive, UTC (up to the next midnight)")
+    parser.add_argument("--days", type=int, help="Export the last N days (overrides --start)")
+    parser.add_argument("--dest", help="Local directory or s3://bucket/prefix "
+                                       "(default: COLUMNAR_EXPORT_DESTINATION)")
+    args = parser.parse_args()
+
+    start = args.start
+    if args.days:
+        start = (args.end or datetime.utcnow()) - timedelta(days=args.days)
+
+    summary = asyncio.run(run_columnar_export(
+        tables=args.table or tuple(EXPORT_TABLES),
+        start=start,
+        end=args.end,
+        destination=args.dest,
+    ))
+    print(f"Exported {summary['start'] or 'the beginning'} to {summary['end'] or 'now'} "
+          f"to {summary['destination']}")
+    for name, stats in summary["tables"].items():
+        print(f"  {name}: {stats['rows']} rows in {stats['files']} files")
+
+
+if __name__ == "__main__":
+    main()
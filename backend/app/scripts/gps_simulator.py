@@ -39,7 +39,7 @@ async def send_location_update(client: httpx.AsyncClient, location: dict):
             f"{API_URL}/tracking/location",
             json=location
         )
-        if response.status_code == 201:
+        if response.status_code in (201, 202):
             print(f"  ✓ Vehicle {location['vehicle_id']}: "
                   f"({location['latitude']:.4f}, {location['longitude']:.4f}) "
                   f"Speed: {location['speed']:.1f} km/h")
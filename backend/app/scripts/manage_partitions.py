@@ -0,0 +1,77 @@
+"""
+Manage gps_locations partitions.
+
+Usage:
+    python -m app.scripts.manage_partitions maintain   # create upcoming, drop expired
+    python -m app.scripts.manage_partitions list
+    python -m app.scripts.manage_partitions explain --vehicle-id 1 --hours 24
+"""
+import argparse
+import asyncio
+from datetime import datetime, timedelta
+
+from sqlalchemy import desc, select
+
+from app.database import engine
+from app.models.tracking import GPSLocation
+from app.services.gps_partitions import is_partitioned, list_partitions, run_partition_maintenance
+
+
+async def maintain():
+    """Run partition maintenance once."""
+    result = await run_partition_maintenance()
+    if not result["partitioned"]:
+        print("gps_locations is not partitioned; run `alembic upgrade head` first")
+        return
+    print(f"Created: {result['created'] or 'none'}")
+    print(f"Dropped: {result['dropped'] or 'none'}")
+    for error in result.get("errors", []):
+        print(f"Failed: {error}")
+
+
+async def show_partitions():
+    """Print the current partitions."""
+    async with engine.connect() as conn:
+        if not await is_partitioned(conn):
+            print("gps_locations is not partitioned")
+            return
+        for name in await list_partitions(conn):
+            print(name)
+
+
+async def explain(vehicle_id: int, hours: int):
+    """Print the plan of the location history query, showing pruned partitions."""
+    cutoff = datetime.utcnow() - timedelta(hours=hours)
+    stmt = (
+        select(GPSLocation)
+        .where(GPSLocation.vehicle_id == vehicle_id, GPSLocation.timestamp >= cutoff)
+        .order_by(desc(GPSLocation.timestamp))
+        .limit(1000)
+    )
+    sql = stmt.compile(engine.sync_engine, compile_kwargs={"literal_binds": True})
+    async with engine.connect() as conn:
+        result = await conn.exec_driver_sql(f"EXPLAIN (ANALYZE, BUFFERS) {sql}")
+        for line in result.scalars():
+            print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage gps_locations partitions")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("maintain")
+    sub.add_parser("list")
+    explain_parser = sub.add_parser("explain")
+    explain_parser.add_argument("--vehicle-id", type=int, required=True)
+    explain_parser.add_argument("--hours", type=int, default=24)
+    args = parser.parse_args()
+
+    if args.command == "maintain":
+        asyncio.run(maintain())
+    elif args.command == "list":
+        asyncio.run(show_partitions())
+    else:
+        asyncio.run(explain(args.vehicle_id, args.hours))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,26 @@
+"""
+Move base64 trip images from trip_images.image_data to the blob store.
+
+Safe to stop and rerun; rows already moved are skipped.
+
+Usage:
+    python -m app.scripts.migrate_trip_images
+    python -m app.scripts.migrate_trip_images --batch-size 500
+"""
+import argparse
+import asyncio
+
+from app.services.trip_images import migrate_trip_images
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Move trip images to the blob store")
+    parser.add_argument("--batch-size", type=int, default=100, help="Rows per committed batch")
+    args = parser.parse_args()
+
+    summary = asyncio.run(migrate_trip_images(batch_size=args.batch_size))
+    print(f"Moved {summary['moved']} images, skipped {summary['skipped']} invalid ones")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+"""
+Content-addressed blob storage for images.
+
+Blobs are keyed by the SHA-256 hex digest of their bytes, so storing the
+same image twice keeps one copy and a key always names the same content
+(responses for it can be cached forever). Database rows keep only the key
+and size. Blobs derived from another one, such as thumbnails, are keyed by
+derived_key(source key, variant) instead, so they can be found from the
+source without a lookup; they are as immutable as their source.
+
+BLOB_STORE_BACKEND selects the backend: "local" writes under
+BLOB_STORE_PATH, "s3" writes to S3_BUCKET_FRAMES under BLOB_STORE_S3_PREFIX
+on AWS or any S3-compatible store at S3_ENDPOINT_URL (MinIO, R2). Since
+rows may share a blob, it is only deleted, with its previews, when the
+last trip image referencing it is (see trip_images.release_blob).
+"""
+
+import asyncio
+import hashlib
+import os
+import re
+import tempfile
+from abc import ABC, abstractmethod
+from typing import Optional, Tuple
+
+from ..config import settings
+
+KEY_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+
+def blob_key(data: bytes) -> str:
+    """Content address of a blob."""
+    return hashlib.sha256(data).hexdigest()
+
+
+def derived_key(source_key: str, variant: str) -> str:
+    """Address of a blob derived from the source blob, e.g. its "w160" thumbnail."""
+    return hashlib.sha256(f"{source_key}/{variant}".encode()).hexdigest()
+
+
+def is_blob_key(key: str) -> bool:
+    return bool(KEY_PATTERN.match(key))
+
+
+class BlobNotFound(Exception):
+    """No blob is stored under the key."""
+
+
+class BlobStore(ABC):
+    """Base blob store: content addressing on top of a key/bytes backend."""
+
+    async def put(self, data: bytes) -> Tuple[str, int]:
+        """Store a blob unless it is already stored; returns (key, size)."""
+        key = blob_key(data)
+        if not await self.exists(key):
+            await self._write(key, data)
+        return key, len(data)
+
+    async def put_derived(self, key: str, data: bytes) -> int:
+        """Store a derived blob under its derived_key unless it is already stored."""
+        if not await self.exists(key):
+            await self._write(key, data)
+        return len(data)
+
+    async def exists(self, key: str) -> bool:
+        try:
+            await self.size(key)
+            return True
+        except BlobNotFound:
+            return False
+
+    async def delete(self, *keys: str):
+        """Remove blobs; keys that are not stored are ignored."""
+        for key in keys:
+            await self._delete(key)
+
+    @abstractmethod
+    async def size(self, key: str) -> int:
+        """Size of a blob; BlobNotFound if it is not stored."""
+
+    @abstractmethod
+    async def get(self, key: str, start: int = 0, end: Optional[int] = None) -> bytes:
+        """Bytes start..end (inclusive) of a blob, or all of it."""
+
+    @abstractmethod
+    async def _write(self, key: str, data: bytes):
+        """Store bytes under a key."""
+
+    @abstractmethod
+    async def _delete(self, key: str):
+        """Remove a blob if it is stored."""
+
+
+class LocalBlobStore(BlobStore):
+    """Blobs as files under a directory, fanned out by key prefix."""
+
+    def __init__(self, root: Optional[str] = None):
+        self.root = os.path.abspath(root or settings.BLOB_STORE_PATH)
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], key[2:4], key)
+
+    async def size(self, key: str) -> int:
+        try:
+            return (await asyncio.to_thread(os.stat, self.path(key))).st_size
+        except FileNotFoundError:
+            raise BlobNotFound(key)
+
+    async def get(self, key: str, start: int = 0, end: Optional[int] = None) -> bytes:
+        def read() -> bytes:
+            with open(self.path(key), "rb") as f:
+                f.seek(start)
+                return f.read() if end is None else f.read(end - start + 1)
+
+        try:
+            return await asyncio.to_thread(read)
+        except FileNotFoundError:
+            raise BlobNotFound(key)
+
+    async def _write(self, key: str, data: bytes):
+        def write():
+            path = self.path(key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write then rename, so readers never see a partial blob
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(data)
+                os.replace(tmp, path)
+            except BaseException:
+                os.unlink(tmp)
+                raise
+
+        await asyncio.to_thread(write)
+
+    async def _delete(self, key: str):
+        try:
+            await asyncio.to_thread(os.unlink, self.path(key))
+        except FileNotFoundError:
+            pass
+
+
+class S3BlobStore(BlobStore):
+    """Blobs as objects in an S3 or S3-compatible bucket."""
+
+    def __init__(self, bucket: Optional[str] = None, prefix: Optional[str] = None, client=None):
+        self.bucket = bucket or settings.S3_BUCKET_FRAMES
+        self.prefix = (prefix if prefix is not None else settings.BLOB_STORE_S3_PREFIX).strip("/")
+        self._client = client
+
+    @property
+    def client(self):
+        if self._client is None:
+            import boto3
+
+            self._client = boto3.client(
+                "s3",
+                region_name=settings.AWS_REGION,
+                endpoint_url=settings.S3_ENDPOINT_URL,
+                aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
+                aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
+            )
+        return self._client
+
+    def object_key(self, key: str) -> str:
+        return f"{self.prefix}/{key[:2]}/{key}" if self.prefix else f"{key[:2]}/{key}"
+
+    @staticmethod
+    def _missing(error: Exception) -> bool:
+        code = getattr(error, "response", {}).get("Error", {}).get("Code")
+        return code in ("404", "NoSuchKey", "NotFound")
+
+    async def size(self, key: str) -> int:
+        try:
+            head = await asyncio.to_thread(self.client.head_object, Bucket=self.bucket, Key=self.object_key(key))
+        except Exception as e:
+            if self._missing(e):
+                raise BlobNotFound(key)
+            raise
+        return head["ContentLength"]
+
+    async def get(self, key: str, start: int = 0, end: Optional[int] = None) -> bytes:
+        options = {"Bucket": self.bucket, "Key": self.object_key(key)}
+        if start or end is not None:
+            options["Range"] = f"bytes={start}-{'' if end is None else end}"
+        try:
+            response = await asyncio.to_thread(self.client.get_object, **options)
+        except Exception as e:
+            if self._missing(e):
+                raise BlobNotFound(key)
+            raise
+        return await asyncio.to_thread(response["Body"].read)
+
+    async def _write(self, key: str, data: bytes):
+        await asyncio.to_thread(self.client.put_object, Bucket=self.bucket, Key=self.object_key(key), Body=data)
+
+    async def _delete(self, key: str):
+        # S3 reports success for missing keys too
+        await asyncio.to_thread(self.client.delete_object, Bucket=self.bucket, Key=self.object_key(key))
+
+
+def create_blob_store() -> BlobStore:
+    """Create the blob store selected by BLOB_STORE_BACKEND."""
+    if settings.BLOB_STORE_BACKEND == "s3":
+        return S3BlobStore()
+    return LocalBlobStore()
+
+
+# Global blob store instance
+blob_store = create_blob_store()
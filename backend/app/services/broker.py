@@ -0,0 +1,188 @@
+"""
+Publish/subscribe broker for real-time fan-out across processes.
+
+Producers (GPS ingest, trip endpoints, frame uploads) publish to a
+channel; every process subscribes and hands each message to its own
+WebSocket managers, so a fix received by one uvicorn worker or instance
+reaches dashboards connected to any other.
+
+BROKER_BACKEND selects the backend: "memory" delivers within the process
+(single worker, tests), "redis" relays through Redis pub/sub at
+REDIS_URL. With Redis, a process receives its own messages back through
+Redis rather than delivering them locally, so each is handled once.
+Messages are serialized with msgpack so they may carry raw bytes (JPEG
+frames) without base64.
+
+Fan-out is best effort: a publish that fails or takes longer than
+BROKER_PUBLISH_TIMEOUT_MS is logged and counted, never raised, so an
+unreachable Redis does not fail the request that produced the message.
+The message is then delivered to the handlers of the publishing process
+directly, so its own clients are still served while Redis is down (after
+a timeout Redis may have taken it too, and local clients get it twice).
+"""
+
+import asyncio
+import inspect
+import logging
+from abc import ABC, abstractmethod
+from typing import Awaitable, Callable, Dict, List, Optional, Union
+
+import msgpack
+
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+Handler = Callable[[dict], Union[None, Awaitable[None]]]
+
+# Channels
+TRACKING_CHANNEL = "taxiwatch.tracking"
+TRIPS_CHANNEL = "taxiwatch.trips"
+VIDEO_CHANNEL = "taxiwatch.video"
+
+
+class Broker(ABC):
+    """Base broker: keeps the handlers subscribed to each channel."""
+
+    def __init__(self):
+        self.handlers: Dict[str, List[Handler]] = {}
+        self.published = 0
+        self.delivered = 0
+        self.failed = 0
+
+    def subscribe(self, channel: str, handler: Handler):
+        """Register a handler for the messages of a channel."""
+        self.handlers.setdefault(channel, []).append(handler)
+
+    @abstractmethod
+    async def publish(self, channel: str, message: dict):
+        """Send a message to the subscribers of a channel in every process; never raises."""
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    async def dispatch(self, channel: str, message: dict):
+        """Hand a message to the local handlers of its channel."""
+        for handler in self.handlers.get(channel, ()):
+            try:
+                result = handler(message)
+                if inspect.isawaitable(result):
+                    await result
+            except Exception as e:
+                logger.error(f"Error handling {channel} message: {e}")
+        self.delivered += 1
+
+    def stats(self) -> dict:
+        return {
+            "backend": type(self).__name__,
+            "channels": sorted(self.handlers),
+            "published": self.published,
+            "delivered": self.delivered,
+            "failed": self.failed,
+        }
+
+
+class InMemoryBroker(Broker):
+    """Delivers messages to the handlers of this process only."""
+
+    async def publish(self, channel: str, message: dict):
+        self.published += 1
+        await self.dispatch(channel, message)
+
+
+class RedisBroker(Broker):
+    """Relays messages between processes through Redis pub/sub."""
+
+    def __init__(self, url: Optional[str] = None, client=None, timeout_ms: Optional[int] = None):
+        super().__init__()
+        self.url = url or settings.REDIS_URL
+        self.timeout = (timeout_ms or settings.BROKER_PUBLISH_TIMEOUT_MS) / 1000
+        self._client = client
+        self._pubsub = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            import redis.asyncio as redis
+
+            self._client = redis.from_url(self.url)
+        return self._client
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self):
+        """Subscribe to every channel with handlers and start relaying."""
+        if self.running or not self.handlers:
+            return
+        self._pubsub = self.client.pubsub()
+        await self._pubsub.subscribe(*self.handlers)
+        self._task = asyncio.create_task(self._listen())
+        logger.info(f"Redis broker listening on {sorted(self.handlers)}")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._pubsub is not None:
+            await self._pubsub.unsubscribe()
+            await self._pubsub.close()
+            self._pubsub = None
+
+    async def publish(self, channel: str, message: dict):
+        """
+        Publish to Redis within the timeout; failures are logged and counted,
+        not raised, and the message is delivered to local handlers instead.
+        """
+        try:
+            await asyncio.wait_for(
+                self.client.publish(channel, msgpack.packb(message, use_bin_type=True)), self.timeout
+            )
+        except asyncio.TimeoutError:
+            self.failed += 1
+            logger.warning(f"Redis publish to {channel} timed out after {self.timeout}s; delivering locally")
+            await self.dispatch(channel, message)
+            return
+        except Exception as e:
+            self.failed += 1
+            logger.warning(f"Redis publish to {channel} failed: {e}; delivering locally")
+            await self.dispatch(channel, message)
+            return
+        self.published += 1
+
+    async def _listen(self):
+        while True:
+            try:
+                async for item in self._pubsub.listen():
+                    if item.get("type") != "message":
+                        continue
+                    channel = item["channel"]
+                    if isinstance(channel, bytes):
+                        channel = channel.decode()
+                    await self.dispatch(channel, msgpack.unpackb(item["data"], raw=False))
+                return
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Redis broker connection error: {e}")
+                await asyncio.sleep(1)
+
+
+def create_broker() -> Broker:
+    """Create the broker selected by BROKER_BACKEND."""
+    if settings.BROKER_BACKEND == "redis":
+        return RedisBroker()
+    return InMemoryBroker()
+
+
+# Global broker instance
+broker = create_broker()
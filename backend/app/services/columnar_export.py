@@ -0,0 +1,293 @@
+"""
+Columnar export of GPS fixes and trips for offline analytics.
+
+Rows are read in chunks ordered by (vehicle_id, time), so each
+(date, vehicle_id) partition arrives as one contiguous run and is written
+to a single Parquet file, one row group per chunk. Export windows are
+widened to whole UTC days, so every file written holds its complete
+partition and re-running an export over the same range overwrites those
+files instead of duplicating (or, for partial days, losing) rows.
+
+Output is Hive partitioned (``date=YYYY-MM-DD/vehicle_id=N/part-0.parquet``)
+under a local directory or an ``s3://bucket/prefix`` URI, and loads
+directly with ``pandas.read_parquet(dir)`` or duckdb's ``read_parquet(...,
+hive_partitioning=true)``. Coordinates are float32 and device_id / status
+are dictionary encoded.
+"""
+
+import asyncio
+import os
+from dataclasses import dataclass, field
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import pyarrow as pa
+import pyarrow.fs as pafs
+import pyarrow.parquet as pq
+from sqlalchemy import Select, select
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from ..config import settings
+from ..database import engine
+from ..models.tracking import GPSLocation
+from ..models.vehicle import Trip
+from .gps_export import naive_utc
+
+# Written in place of a null partition value; pyarrow and duckdb read it back as null
+NULL_PARTITION = "__HIVE_DEFAULT_PARTITION__"
+
+GPS_SCHEMA = pa.schema([
+    ("id", pa.int64()),
+    ("device_id", pa.dictionary(pa.int32(), pa.string())),
+    ("latitude", pa.float32()),
+    ("longitude", pa.float32()),
+    ("speed", pa.float32()),
+    ("heading", pa.int16()),
+    ("accuracy", pa.float32()),
+    ("altitude", pa.float32()),
+    ("timestamp", pa.timestamp("us", tz="UTC")),
+])
+
+TRIP_SCHEMA = pa.schema([
+    ("id", pa.int64()),
+    ("customer_id", pa.int32()),
+    ("driver_id", pa.int32()),
+    ("status", pa.dictionary(pa.int8(), pa.string())),
+    ("start_time", pa.timestamp("us", tz="UTC")),
+    ("end_time", pa.timestamp("us", tz="UTC")),
+    ("pickup_lat", pa.float32()),
+    ("pickup_lng", pa.float32()),
+    ("destination_lat", pa.float32()),
+    ("destination_lng", pa.float32()),
+    ("distance", pa.float32()),
+    ("duration", pa.int32()),
+    ("fare", pa.float32()),
+    ("estimated_fare", pa.float32()),
+    ("identity_verified", pa.bool_()),
+    ("verification_score", pa.int16()),
+    ("created_at", pa.timestamp("us", tz="UTC")),
+])
+
+
+def _float(value) -> Optional[float]:
+    """Numeric columns arrive as Decimal."""
+    return None if value is None else float(value)
+
+
+def _utc(value: Optional[datetime]) -> Optional[datetime]:
+    """Treat naive timestamps as UTC, as they are stored."""
+    if value is not None and value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value
+
+
+def _point(value, key: str) -> Optional[float]:
+    """Read a coordinate from a {lat, lng, address} JSON column."""
+    return _float(value.get(key)) if isinstance(value, dict) else None
+
+
+def _status(value) -> Optional[str]:
+    return getattr(value, "value", value)
+
+
+@dataclass(frozen=True)
+class ExportTable:
+    """How one table is queried, partitioned and converted to Arrow."""
+
+    name: str
+    schema: pa.Schema
+    columns: Tuple
+    vehicle_column: object
+    time_column: object
+    converters: Dict[str, Callable] = field(default_factory=dict)
+
+    def query(self, start: Optional[datetime], end: Optional[datetime]) -> Select:
+        """Rows in [start, end), contiguous per (vehicle_id, date) partition."""
+        stmt = select(*self.columns)
+        if start is not None:
+            stmt = stmt.where(self.time_column >= naive_utc(start))
+        if end is not None:
+            stmt = stmt.where(self.time_column < naive_utc(end))
+        return stmt.order_by(self.vehicle_column, self.time_column, self.columns[0])
+
+    def partition_key(self, row) -> Tuple[Optional[date], Optional[int]]:
+        """(UTC date, vehicle_id) of a row."""
+        moment = _utc(getattr(row, self.time_column.key))
+        day = moment.astimezone(timezone.utc).date() if moment else None
+        return day, getattr(row, self.vehicle_column.key)
+
+    def to_arrow(self, rows: Sequence) -> pa.RecordBatch:
+        """Convert Core rows to a record batch, dropping the partition columns."""
+        arrays = []
+        for f in self.schema:
+            convert = self.converters.get(f.name)
+            values = [convert(row) if convert else getattr(row, f.name) for row in rows]
+            if pa.types.is_dictionary(f.type):
+                arrays.append(pa.array(values, type=pa.string()).dictionary_encode().cast(f.type))
+            else:
+                arrays.append(pa.array(values, type=f.type))
+        return pa.RecordBatch.from_arrays(arrays, schema=self.schema)
+
+
+def _floats(*names: str) -> Dict[str, Callable]:
+    return {name: (lambda row, name=name: _float(getattr(row, name))) for name in names}
+
+
+def _times(*names: str) -> Dict[str, Callable]:
+    return {name: (lambda row, name=name: _utc(getattr(row, name))) for name in names}
+
+
+EXPORT_TABLES: Dict[str, ExportTable] = {
+    "gps_locations": ExportTable(
+        name="gps_locations",
+        schema=GPS_SCHEMA,
+        columns=(
+            GPSLocation.id, GPSLocation.vehicle_id, GPSLocation.device_id, GPSLocation.latitude,
+            GPSLocation.longitude, GPSLocation.speed, GPSLocation.heading, GPSLocation.accuracy,
+            GPSLocation.altitude, GPSLocation.timestamp,
+        ),
+        vehicle_column=GPSLocation.vehicle_id,
+        time_column=GPSLocation.timestamp,
+        converters={
+            **_floats("latitude", "longitude", "speed", "accuracy", "altitude"),
+            **_times("timestamp"),
+        },
+    ),
+    "trips": ExportTable(
+        name="trips",
+        schema=TRIP_SCHEMA,
+        columns=(
+            Trip.id, Trip.vehicle_id, Trip.customer_id, Trip.driver_id, Trip.status,
+            Trip.start_time, Trip.end_time, Trip.pickup_location, Trip.destination,
+            Trip.distance, Trip.duration, Trip.fare, Trip.estimated_fare,
+            Trip.identity_verified, Trip.verification_score, Trip.created_at,
+        ),
+        vehicle_column=Trip.vehicle_id,
+        time_column=Trip.created_at,
+        converters={
+            "status": lambda row: _status(row.status),
+            "pickup_lat": lambda row: _point(row.pickup_location, "lat"),
+            "pickup_lng": lambda row: _point(row.pickup_location, "lng"),
+            "destination_lat": lambda row: _point(row.destination, "lat"),
+            "destination_lng": lambda row: _point(row.destination, "lng"),
+            **_floats("distance", "fare", "estimated_fare"),
+            **_times("start_time", "end_time", "created_at"),
+        },
+    ),
+}
+
+
+def whole_days(
+    start: Optional[datetime], end: Optional[datetime]
+) -> Tuple[Optional[datetime], Optional[datetime]]:
+    """Widen [start, end) to UTC midnights (naive UTC), so it covers whole date partitions."""
+    start, end = naive_utc(start), naive_utc(end)
+    if start is not None:
+        start = datetime.combine(start.date(), time())
+    if end is not None and end.time() != time():
+        end = datetime.combine(end.date() + timedelta(days=1), time())
+    return start, end
+
+
+def resolve_destination(destination: str) -> Tuple[pafs.FileSystem, str]:
+    """Return the filesystem and base path of a local directory or s3:// URI."""
+    if destination.startswith("s3://"):
+        options = {"region": settings.AWS_REGION}
+        if settings.AWS_ACCESS_KEY_ID and settings.AWS_SECRET_ACCESS_KEY:
+            options["access_key"] = settings.AWS_ACCESS_KEY_ID
+            options["secret_key"] = settings.AWS_SECRET_ACCESS_KEY
+        if settings.S3_ENDPOINT_URL:
+            options["endpoint_override"] = settings.S3_ENDPOINT_URL
+        return pafs.S3FileSystem(**options), destination[len("s3://"):].rstrip("/")
+    return pafs.LocalFileSystem(), os.path.abspath(destination)
+
+
+def partition_path(base: str, table: str, key: Tuple[Optional[date], Optional[int]]) -> str:
+    """Directory of a (date, vehicle_id) partition."""
+    day, vehicle_id = key
+    day_part = day.isoformat() if day else NULL_PARTITION
+    vehicle_part = NULL_PARTITION if vehicle_id is None else str(vehicle_id)
+    return f"{base}/{table}/date={day_part}/vehicle_id={vehicle_part}"
+
+
+class PartitionedParquetWriter:
+    """Writes contiguous runs of rows to one Parquet file per partition."""
+
+    def __init__(self, table: ExportTable, filesystem: pafs.FileSystem, base: str):
+        self.table = table
+        self.filesystem = filesystem
+        self.base = base
+        self.rows = 0
+        self.files: List[str] = []
+        self._key = None
+        self._writer: Optional[pq.ParquetWriter] = None
+
+    def write_rows(self, rows: Sequence):
+        """Write a chunk of rows, splitting it where the partition changes."""
+        keys = [self.table.partition_key(row) for row in rows]
+        start = 0
+        for i in range(1, len(rows) + 1):
+            if i == len(rows) or keys[i] != keys[start]:
+                self._write_run(keys[start], rows[start:i])
+                start = i
+
+    def _write_run(self, key, rows: Sequence):
+        if key != self._key:
+            self.close()
+            directory = partition_path(self.base, self.table.name, key)
+            self.filesystem.create_dir(directory, recursive=True)
+            path = f"{directory}/part-0.parquet"
+            self._writer = pq.ParquetWriter(
+                path, self.table.schema, filesystem=self.filesystem,
+                compression=settings.COLUMNAR_EXPORT_COMPRESSION,
+            )
+            self._key = key
+            self.files.append(path)
+        self._writer.write_batch(self.table.to_arrow(rows))
+        self.rows += len(rows)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+            self._key = None
+
+
+async def export_table(
+    table: ExportTable,
+    filesystem: pafs.FileSystem,
+    base: str,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    bind: Optional[AsyncEngine] = None,
+) -> dict:
+    """Export one table in chunks; conversion and writes run off the event loop."""
+    writer = PartitionedParquetWriter(table, filesystem, base)
+    stmt = table.query(start, end).execution_options(yield_per=settings.COLUMNAR_EXPORT_CHUNK_SIZE)
+    try:
+        async with (bind or engine).connect() as conn:
+            result = await conn.stream(stmt)
+            async for rows in result.partitions():
+                await asyncio.to_thread(writer.write_rows, rows)
+    finally:
+        await asyncio.to_thread(writer.close)
+    return {"rows": writer.rows, "files": len(writer.files)}
+
+
+async def run_columnar_export(
+    tables: Sequence[str] = tuple(EXPORT_TABLES),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    destination: Optional[str] = None,
+    bind: Optional[AsyncEngine] = None,
+) -> dict:
+    """Export the given tables to Parquet over whole days of [start, end) and report rows and files per table."""
+    destination = destination or settings.COLUMNAR_EXPORT_DESTINATION
+    filesystem, base = resolve_destination(destination)
+    start, end = whole_days(start, end)
+    summary = {"destination": destination, "start": start, "end": end, "tables": {}}
+    for name in tables:
+        summary["tables"][name] = await export_table(
+            EXPORT_TABLES[name], filesystem, base, start, end, bind=bind
+        )
+    return summary
@@ -0,0 +1,290 @@
+"""
+Background persistence of uploaded video frames and segments.
+
+The segmenter creates the video_archives row of a closed segment and
+queues its bytes; a pool of FRAME_STORAGE_WORKERS workers writes queued
+files to the backend and sets stored_at on their rows, in batches. Writes
+run on a thread pool of the same size, and the S3 client keeps one pooled
+connection per worker, so a slow backend holds at most that many requests
+open while the queue (FRAME_STORAGE_QUEUE_SIZE files) absorbs bursts.
+When the queue is full uploads are refused with 503 instead of piling up.
+
+FRAME_STORAGE_BACKEND selects the backend: "local" writes under
+FRAME_STORAGE_PATH, "s3" writes to S3_BUCKET_FRAMES on AWS or any
+S3-compatible store at S3_ENDPOINT_URL. Rows whose write failed after
+FRAME_STORAGE_RETRIES retries keep stored_at NULL.
+"""
+
+import asyncio
+import logging
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, List, Optional
+
+from sqlalchemy import func, update
+
+from ..config import settings
+from ..database import AsyncSessionLocal
+
+logger = logging.getLogger(__name__)
+
+StoredMarker = Callable[[List[int]], Awaitable[None]]
+
+
+CONTENT_TYPES = {".jpg": "image/jpeg", ".mjpeg": "video/x-motion-jpeg"}
+
+
+class StorageFullError(Exception):
+    """Raised when the storage queue cannot accept more frames."""
+
+
+class LocalFrameBackend:
+    """Frames as files under a directory, at their archive path."""
+
+    def __init__(self, root: Optional[str] = None):
+        self.root = os.path.abspath(root or settings.FRAME_STORAGE_PATH)
+
+    def path(self, key: str) -> str:
+        path = os.path.abspath(os.path.join(self.root, key))
+        if not path.startswith(self.root + os.sep):
+            raise ValueError(f"Frame path outside storage root: {key}")
+        return path
+
+    def write(self, key: str, data: bytes):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write then rename, so readers never see a partial frame
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    def read(self, key: str, start: int = 0, end: Optional[int] = None) -> bytes:
+        """Bytes start..end (inclusive) of a stored file, or all of it."""
+        with open(self.path(key), "rb") as f:
+            f.seek(start)
+            return f.read() if end is None else f.read(end - start + 1)
+
+
+class S3FrameBackend:
+    """Frames as objects in an S3 or S3-compatible bucket, keyed by archive path."""
+
+    def __init__(self, bucket: Optional[str] = None, client=None, max_connections: Optional[int] = None):
+        self.bucket = bucket or settings.S3_BUCKET_FRAMES
+        self.max_connections = max_connections or settings.FRAME_STORAGE_WORKERS
+        self._client = client
+
+    @property
+    def client(self):
+        if self._client is None:
+            import boto3
+            from botocore.config import Config
+
+            self._client = boto3.client(
+                "s3",
+                region_name=settings.AWS_REGION,
+                endpoint_url=settings.S3_ENDPOINT_URL,
+                aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
+                aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
+                config=Config(max_pool_connections=self.max_connections),
+            )
+        return self._client
+
+    def write(self, key: str, data: bytes):
+        content_type = CONTENT_TYPES.get(os.path.splitext(key)[1], "application/octet-stream")
+        self.client.put_object(Bucket=self.bucket, Key=key, Body=data, ContentType=content_type)
+
+    def read(self, key: str, start: int = 0, end: Optional[int] = None) -> bytes:
+        options = {"Bucket": self.bucket, "Key": key}
+        if start or end is not None:
+            options["Range"] = f"bytes={start}-{'' if end is None else end}"
+        try:
+            response = self.client.get_object(**options)
+        except Exception as e:
+            code = getattr(e, "response", {}).get("Error", {}).get("Code")
+            if code in ("404", "NoSuchKey", "NotFound"):
+                raise FileNotFoundError(key)
+            raise
+        return response["Body"].read()
+
+
+def create_frame_backend():
+    """Create the backend selected by FRAME_STORAGE_BACKEND."""
+    if settings.FRAME_STORAGE_BACKEND == "s3":
+        return S3FrameBackend()
+    return LocalFrameBackend()
+
+
+async def mark_frames_stored(archive_ids: List[int]):
+    """Set stored_at on the archive rows of written frames."""
+    from ..models.video import VideoArchive
+
+    async with AsyncSessionLocal() as db:
+        await db.execute(
+            update(VideoArchive).where(VideoArchive.id.in_(archive_ids)).values(stored_at=func.now())
+        )
+        await db.commit()
+
+
+class FrameStorage:
+    """Bounded queue of frames written to a backend by a pool of workers."""
+
+    def __init__(
+        self,
+        backend=None,
+        workers: Optional[int] = None,
+        max_size: Optional[int] = None,
+        retries: Optional[int] = None,
+        mark_interval_ms: int = 500,
+        marker: Optional[StoredMarker] = None,
+    ):
+        self.backend = backend
+        self.workers = workers or settings.FRAME_STORAGE_WORKERS
+        self.max_size = max_size or settings.FRAME_STORAGE_QUEUE_SIZE
+        self.retries = retries if retries is not None else settings.FRAME_STORAGE_RETRIES
+        self.mark_interval = mark_interval_ms / 1000
+        self.marker = marker or mark_frames_stored
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._tasks: List[asyncio.Task] = []
+        self._marker_task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self._stored: List[int] = []  # Written, not yet marked
+
+        # Counters
+        self.queued = 0
+        self.written = 0
+        self.failed = 0
+        self.rejected = 0
+        self.retried = 0
+        self.last_write_ms: Optional[float] = None
+
+    @property
+    def running(self) -> bool:
+        """True while workers are accepting frames."""
+        return bool(self._tasks) and not self._stopping
+
+    def start(self):
+        """Start the worker pool."""
+        if self._tasks:
+            return
+        if self.backend is None:
+            self.backend = create_frame_backend()
+        self._queue = asyncio.Queue(maxsize=self.max_size)
+        self._stopping = False
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="frame-storage")
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+        self._marker_task = asyncio.create_task(self._mark_periodically())
+        logger.info(f"Frame storage started (workers={self.workers}, max_size={self.max_size})")
+
+    async def stop(self):
+        """Stop accepting frames, write everything still queued and mark it stored."""
+        if not self._tasks:
+            return
+        self._stopping = True
+        await self._queue.join()
+        tasks, self._tasks = self._tasks, []
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        # The marker loop sees the pool stopped, marks what is left and exits
+        await self._marker_task
+        self._marker_task = None
+        self._executor.shutdown(wait=True)
+        self._executor = None
+        logger.info(f"Frame storage stopped (written={self.written}, failed={self.failed})")
+
+    def put(self, archive_id: int, path: str, data: bytes):
+        """Queue a frame for writing. Raises StorageFullError when the queue is full."""
+        if not self.running:
+            raise RuntimeError("Frame storage is not running")
+        try:
+            self._queue.put_nowait((archive_id, path, data))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise StorageFullError("Frame storage queue is full")
+        self.queued += 1
+
+    def full(self) -> bool:
+        return self._queue is not None and self._queue.full()
+
+    async def write(self, path: str, data: bytes):
+        """Write one frame without queueing (used when the pool is not running)."""
+        if self.backend is None:
+            self.backend = create_frame_backend()
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, self.backend.write, path, data)
+
+    async def read(self, path: str, start: int = 0, end: Optional[int] = None) -> bytes:
+        """Read back a stored file or a byte range of it; FileNotFoundError if it is missing."""
+        if self.backend is None:
+            self.backend = create_frame_backend()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self.backend.read, path, start, end)
+
+    def get_stats(self) -> dict:
+        return {
+            "running": self.running,
+            "workers": self.workers,
+            "depth": self._queue.qsize() if self._queue else 0,
+            "max_size": self.max_size,
+            "queued": self.queued,
+            "written": self.written,
+            "failed": self.failed,
+            "retried": self.retried,
+            "rejected": self.rejected,
+            "last_write_ms": self.last_write_ms,
+        }
+
+    async def _work(self):
+        while True:
+            archive_id, path, data = await self._queue.get()
+            try:
+                await self._store(archive_id, path, data)
+            finally:
+                self._queue.task_done()
+
+    async def _store(self, archive_id: int, path: str, data: bytes):
+        """Write a frame, retrying with backoff; failures are logged, not raised."""
+        for attempt in range(self.retries + 1):
+            started = time.perf_counter()
+            try:
+                await self.write(path, data)
+            except Exception as e:
+                if attempt < self.retries:
+                    self.retried += 1
+                    await asyncio.sleep(0.5 * 2 ** attempt)
+                    continue
+                self.failed += 1
+                logger.error(f"Failed to store frame {path} of archive {archive_id}: {e}")
+                return
+            self.last_write_ms = round((time.perf_counter() - started) * 1000, 2)
+            self.written += 1
+            self._stored.append(archive_id)
+            return
+
+    async def _mark_periodically(self):
+        while self._tasks:
+            await asyncio.sleep(self.mark_interval)
+            await self._mark()
+        await self._mark()
+
+    async def _mark(self):
+        if not self._stored:
+            return
+        archive_ids, self._stored = self._stored, []
+        try:
+            await self.marker(archive_ids)
+        except Exception as e:
+            logger.error(f"Failed to mark {len(archive_ids)} frames stored: {e}")
+
+
+# Global instance (started from the application lifespan)
+frame_storage = FrameStorage()
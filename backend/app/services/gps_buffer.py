@@ -0,0 +1,401 @@
+"""
+Write-behind buffer for GPS fixes.
+
+Fixes are queued in memory by the ingest endpoints and flushed to
+PostgreSQL in bulk by a background task, so ingest latency no longer
+depends on database commit latency.
+
+The endpoints have already answered 202 for queued fixes, so a failed
+flush is retried with backoff (GPS_FLUSH_RETRIES attempts) and, if the
+database is still unavailable, the batch is spilled to a file under
+GPS_SPILL_PATH and replayed after the next successful flush or restart.
+While the writer is failing new fixes are refused with 503 instead of
+being accepted.
+
+Every worker replays the same spill directory, so a file is first claimed
+by renaming it to a name of this process; a worker that loses the rename
+leaves the file alone. Claims older than SPILL_CLAIM_STALE_S (a worker that
+died mid-replay) can be taken over. Files that cannot be read are moved
+aside with a ".bad" suffix. If the flush task dies anyway, the buffer
+stops accepting fixes, so the endpoints fall back to synchronous inserts.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import secrets
+import tempfile
+import time
+from datetime import datetime
+from typing import Awaitable, Callable, List, Optional, Sequence
+
+from sqlalchemy import select
+
+from ..config import settings
+from ..database import engine
+
+logger = logging.getLogger(__name__)
+
+# Column order of the records handed to COPY
+GPS_COLUMNS = (
+    "vehicle_id",
+    "latitude",
+    "longitude",
+    "speed",
+    "heading",
+    "accuracy",
+    "altitude",
+    "device_id",
+    "timestamp",
+)
+
+RecordWriter = Callable[[List[tuple]], Awaitable[None]]
+
+SPILL_CLAIM_SUFFIX = ".claimed"
+SPILL_CLAIM_STALE_S = 600
+
+
+class BufferFullError(Exception):
+    """Raised when the buffer cannot accept more fixes."""
+
+
+def heading_degrees(heading: Optional[float]) -> Optional[int]:
+    """Heading as stored in the integer gps_locations.heading column (0-359)."""
+    return int(round(heading)) % 360 if heading is not None else None
+
+
+def to_record(row: dict) -> tuple:
+    """Convert a gps_locations row dict into a COPY record."""
+    return (
+        row["vehicle_id"],
+        row["latitude"],
+        row["longitude"],
+        row.get("speed"),
+        heading_degrees(row.get("heading")),
+        row.get("accuracy"),
+        row.get("altitude"),
+        row.get("device_id"),
+        row["timestamp"],
+    )
+
+
+async def copy_gps_records(records: List[tuple]) -> None:
+    """
+    Bulk insert records into gps_locations with asyncpg COPY.
+    If a vehicle was deleted since the fix was queued, the COPY fails on the
+    foreign key; in that case the orphaned records are dropped and the
+    remaining ones are written again.
+    """
+    import asyncpg
+    from ..models.vehicle import Vehicle
+
+    async with engine.connect() as conn:
+        raw = await conn.get_raw_connection()
+        try:
+            await raw.driver_connection.copy_records_to_table(
+                "gps_locations", records=records, columns=GPS_COLUMNS
+            )
+            return
+        except asyncpg.ForeignKeyViolationError:
+            pass
+
+        vehicle_ids = {record[0] for record in records}
+        result = await conn.execute(select(Vehicle.id).where(Vehicle.id.in_(vehicle_ids)))
+        known_ids = set(result.scalars().all())
+        await conn.rollback()
+
+        kept = [record for record in records if record[0] in known_ids]
+        logger.warning(f"Dropping {len(records) - len(kept)} GPS fixes for deleted vehicles")
+        if kept:
+            await raw.driver_connection.copy_records_to_table(
+                "gps_locations", records=kept, columns=GPS_COLUMNS
+            )
+
+
+class GPSWriteBuffer:
+    """
+    Bounded in-process queue of GPS fixes with a periodic bulk flush.
+    A flush happens every `flush_interval_ms` or as soon as `flush_rows`
+    fixes are waiting, whichever comes first.
+    """
+
+    def __init__(
+        self,
+        max_size: int = 50000,
+        flush_interval_ms: int = 500,
+        flush_rows: int = 5000,
+        writer: Optional[RecordWriter] = None,
+        retries: Optional[int] = None,
+        spill_path: Optional[str] = None,
+        backoff_s: float = 0.5,
+    ):
+        self.max_size = max_size
+        self.flush_interval = flush_interval_ms / 1000
+        self.flush_rows = flush_rows
+        self.writer = writer or copy_gps_records
+        self.retries = retries or settings.GPS_FLUSH_RETRIES
+        self.spill_path = os.path.abspath(spill_path or settings.GPS_SPILL_PATH)
+        self.backoff = backoff_s
+        self.failing = False  # The last write attempt failed; new fixes are refused
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._stopping = False
+        self._claim_id = f"{os.getpid()}-{secrets.token_hex(4)}"
+
+        # Counters
+        self.queued = 0
+        self.flushed = 0
+        self.failed = 0  # Fixes still unwritten after every retry (then spilled)
+        self.spilled = 0
+        self.replayed = 0
+        self.rejected = 0
+        self.last_flush_ms: Optional[float] = None
+
+    @property
+    def running(self) -> bool:
+        """True while the flush task is accepting fixes."""
+        return self._task is not None and not self._task.done() and not self._stopping
+
+    def start(self):
+        """Start the background flush task."""
+        if self._task is not None:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_size)
+        self._wake = asyncio.Event()
+        self._stopping = False
+        self.failing = False
+        self._task = asyncio.create_task(self._run())
+        self._task.add_done_callback(self._on_task_done)
+        logger.info(
+            f"GPS write-behind buffer started (max_size={self.max_size}, "
+            f"interval={self.flush_interval}s, rows={self.flush_rows})"
+        )
+
+    async def stop(self):
+        """Stop accepting fixes and flush everything still queued."""
+        if self._task is None:
+            return
+        self._stopping = True
+        self._wake.set()
+        # Wake the flush loop if it is waiting on an empty queue
+        try:
+            self._queue.put_nowait(None)
+        except asyncio.QueueFull:
+            pass
+        try:
+            await self._task
+        except Exception:
+            pass  # Already logged by _on_task_done
+        self._task = None
+        logger.info(f"GPS write-behind buffer stopped (flushed={self.flushed}, failed={self.failed})")
+
+    def put(self, row: dict):
+        """Queue a fix. Raises BufferFullError when the queue is full."""
+        if not self.running:
+            raise RuntimeError("GPS write-behind buffer is not running")
+        if self.failing:
+            self.rejected += 1
+            raise BufferFullError("GPS storage is unavailable")
+        try:
+            self._queue.put_nowait(to_record(row))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise BufferFullError("GPS ingest buffer is full")
+        self.queued += 1
+
+    def put_many(self, rows: Sequence[dict]) -> int:
+        """Queue as many fixes as fit. Returns how many were queued."""
+        for count, row in enumerate(rows):
+            try:
+                self.put(row)
+            except BufferFullError:
+                self.rejected += len(rows) - count - 1
+                return count
+        return len(rows)
+
+    def get_stats(self) -> dict:
+        """Get buffer statistics."""
+        return {
+            "running": self.running,
+            "depth": self._queue.qsize() if self._queue else 0,
+            "max_size": self.max_size,
+            "queued": self.queued,
+            "flushed": self.flushed,
+            "failed": self.failed,
+            "failing": self.failing,
+            "spilled": self.spilled,
+            "replayed": self.replayed,
+            "rejected": self.rejected,
+            "last_flush_ms": self.last_flush_ms,
+        }
+
+    def _on_task_done(self, task: asyncio.Task):
+        """Log a crashed flush task and spill what it left queued; running is False from now on."""
+        if task.cancelled() or task.exception() is None:
+            return
+        logger.critical(f"GPS flush task died, falling back to synchronous inserts: {task.exception()!r}")
+        batch = []
+        while not self._queue.empty():
+            record = self._queue.get_nowait()
+            if record is not None:
+                batch.append(record)
+        if batch:
+            self.failed += len(batch)
+            try:
+                self._spill(batch)
+                self.spilled += len(batch)
+            except Exception as e:
+                logger.critical(f"Lost {len(batch)} GPS fixes: could not spill them to {self.spill_path}: {e}")
+
+    async def _run(self):
+        """Collect fixes into batches and flush them until stopped and drained."""
+        await self._replay()  # Batches spilled before a restart
+        while True:
+            if self.failing and self._queue.empty():
+                if self._stopping:
+                    return
+                await self._recover()
+                continue
+            batch = await self._collect()
+            if batch:
+                await self._flush(batch)
+            if self._stopping and self._queue.empty():
+                return
+
+    async def _collect(self) -> List[tuple]:
+        """Wait for the first fix, then gather more until the batch is full or the interval passes."""
+        batch = []
+        first = await self._queue.get()
+        if first is not None:
+            batch.append(first)
+
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.flush_rows:
+            if self._stopping:
+                # Drain without waiting
+                try:
+                    record = self._queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    break
+            else:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    record = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+            if record is not None:
+                batch.append(record)
+        return batch
+
+    async def _flush(self, batch: List[tuple]):
+        """Write a batch, retrying with backoff and spilling it to disk if the database stays down."""
+        started = time.perf_counter()
+        for attempt in range(self.retries):
+            try:
+                await self.writer(batch)
+            except Exception as e:
+                self.failing = True
+                logger.error(f"Failed to flush {len(batch)} GPS fixes (attempt {attempt + 1}): {e}")
+                if attempt + 1 < self.retries:
+                    await asyncio.sleep(min(self.backoff * 2 ** attempt, 10))
+                continue
+            self.flushed += len(batch)
+            self.last_flush_ms = round((time.perf_counter() - started) * 1000, 2)
+            if self.failing:
+                self.failing = False
+                await self._replay()
+            return
+
+        self.failed += len(batch)
+        try:
+            self._spill(batch)
+            self.spilled += len(batch)
+        except Exception as e:
+            logger.critical(f"Lost {len(batch)} GPS fixes: could not spill them to {self.spill_path}: {e}")
+
+    async def _recover(self):
+        """With the writer failing and nothing queued, wait, then probe it by replaying spilled batches."""
+        try:
+            await asyncio.wait_for(self._wake.wait(), min(self.backoff * 2 ** self.retries, 10))
+        except asyncio.TimeoutError:
+            pass
+        if not self._stopping and await self._replay():
+            self.failing = False
+
+    def _spill(self, batch: List[tuple]):
+        """Write a batch to a new file under spill_path."""
+        os.makedirs(self.spill_path, exist_ok=True)
+        records = [list(record[:8]) + [record[8].isoformat()] for record in batch]
+        fd, tmp = tempfile.mkstemp(dir=self.spill_path, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(records, f)
+        os.replace(tmp, os.path.join(self.spill_path, f"gps-{time.time_ns()}.json"))
+        logger.warning(f"Spilled {len(batch)} GPS fixes to {self.spill_path}")
+
+    def _claim(self, name: str) -> Optional[str]:
+        """Take a spill file for this process by renaming it; None if it is not one or another worker has it."""
+        path = os.path.join(self.spill_path, name)
+        if name.endswith(".json"):
+            original = name
+        elif name.endswith(SPILL_CLAIM_SUFFIX) and ".json." in name:
+            try:
+                if time.time() - os.stat(path).st_mtime < SPILL_CLAIM_STALE_S:
+                    return None
+            except FileNotFoundError:
+                return None
+            original = name.split(".json.", 1)[0] + ".json"
+        else:
+            return None
+        claimed = os.path.join(self.spill_path, f"{original}.{self._claim_id}{SPILL_CLAIM_SUFFIX}")
+        try:
+            os.rename(path, claimed)
+            os.utime(claimed)
+        except OSError:
+            return None
+        return claimed
+
+    async def _replay(self) -> bool:
+        """Write spilled batches back, oldest first; False if one of them failed again."""
+        if not os.path.isdir(self.spill_path):
+            return True
+        for name in sorted(os.listdir(self.spill_path)):
+            claimed = self._claim(name)
+            if claimed is None:
+                continue
+            original = os.path.join(self.spill_path, name.split(".json", 1)[0] + ".json")
+            try:
+                with open(claimed) as f:
+                    batch = [tuple(record[:8]) + (datetime.fromisoformat(record[8]),) for record in json.load(f)]
+            except Exception as e:
+                logger.error(f"Unreadable GPS spill file {name}, moved aside: {e}")
+                try:
+                    os.rename(claimed, f"{original}.bad")
+                except OSError:
+                    pass
+                continue
+            try:
+                await self.writer(batch)
+            except Exception as e:
+                logger.error(f"Could not replay spilled GPS fixes from {name}: {e}")
+                try:
+                    os.rename(claimed, original)  # Give it back for the next attempt
+                except OSError:
+                    pass
+                return False
+            os.unlink(claimed)
+            self.replayed += len(batch)
+            logger.info(f"Replayed {len(batch)} spilled GPS fixes from {name}")
+        return True
+
+
+# Global buffer instance (started from the application lifespan)
+gps_buffer = GPSWriteBuffer(
+    max_size=settings.GPS_BUFFER_MAX_SIZE,
+    flush_interval_ms=settings.GPS_FLUSH_INTERVAL_MS,
+    flush_rows=settings.GPS_FLUSH_MAX_ROWS,
+)
@@ -0,0 +1,99 @@
+"""
+Streaming export of GPS history.
+
+Rows are read through a server-side cursor in chunks and formatted as
+NDJSON or CSV chunk by chunk, so an export of any size runs in constant
+memory. The generator opens its own database connection because it
+keeps running after the endpoint has returned its StreamingResponse.
+"""
+
+import csv
+import io
+import json
+from datetime import datetime, timezone
+from typing import AsyncIterator, Iterable, List, Optional
+
+from sqlalchemy import Select, select
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from ..config import settings
+from ..database import engine
+from ..models.tracking import GPSLocation
+
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+EXPORT_COLUMNS = (
+    "id", "vehicle_id", "latitude", "longitude", "speed", "heading",
+    "accuracy", "altitude", "device_id", "timestamp",
+)
+
+
+def naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    """Normalize an optional timestamp to naive UTC, as stored fixes are compared."""
+    if value is not None and value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def export_query(
+    vehicle_ids: Optional[List[int]] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+) -> Select:
+    """Build the export query, oldest fix first."""
+    stmt = select(*(getattr(GPSLocation, column) for column in EXPORT_COLUMNS))
+    if vehicle_ids:
+        stmt = stmt.where(GPSLocation.vehicle_id.in_(vehicle_ids))
+    if start is not None:
+        stmt = stmt.where(GPSLocation.timestamp >= naive_utc(start))
+    if end is not None:
+        stmt = stmt.where(GPSLocation.timestamp < naive_utc(end))
+    return stmt.order_by(GPSLocation.timestamp, GPSLocation.id)
+
+
+def _value(value):
+    """Convert a column value to a JSON/CSV friendly value."""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if value is None or isinstance(value, (int, str)):
+        return value
+    return float(value)  # Numeric columns arrive as Decimal
+
+
+def format_ndjson(rows: Iterable) -> str:
+    """Format rows as newline-delimited JSON objects."""
+    return "".join(
+        json.dumps(dict(zip(EXPORT_COLUMNS, map(_value, row))), separators=(",", ":")) + "\n"
+        for row in rows
+    )
+
+
+def format_csv(rows: Iterable, header: bool = False) -> str:
+    """Format rows as CSV lines, optionally preceded by the header line."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    if header:
+        writer.writerow(EXPORT_COLUMNS)
+    writer.writerows([_value(value) for value in row] for row in rows)
+    return buffer.getvalue()
+
+
+async def stream_export(
+    stmt: Select,
+    export_format: str,
+    bind: Optional[AsyncEngine] = None,
+) -> AsyncIterator[str]:
+    """Yield the formatted export one chunk of rows at a time."""
+    if export_format == "csv":
+        yield format_csv((), header=True)
+
+    async with (bind or engine).connect() as conn:
+        result = await conn.stream(stmt.execution_options(yield_per=settings.GPS_EXPORT_CHUNK_SIZE))
+        async for rows in result.partitions():
+            if export_format == "csv":
+                yield format_csv(rows)
+            else:
+                yield format_ndjson(rows)
@@ -0,0 +1,229 @@
+"""
+Partition management for the time-partitioned gps_locations table.
+
+gps_locations is range-partitioned on timestamp (see migration
+002_partition_gps_locations). This module pre-creates partitions ahead of
+time and drops the ones older than the retention period, so old fixes
+are removed by dropping a table instead of running huge DELETEs.
+Fixes stored while no partition covered them sit in the default partition;
+they are moved into a partition's range when it is created, since
+PostgreSQL refuses to create a partition over rows in the default one.
+Creating and dropping run in separate transactions, so a failure in one
+does not hold up the other. It is a no-op when gps_locations is not
+partitioned (e.g. tables created with create_all in development).
+"""
+
+import asyncio
+import logging
+import re
+from datetime import date, datetime, timedelta
+from typing import List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from ..config import settings
+from ..database import engine
+
+logger = logging.getLogger(__name__)
+
+PARENT_TABLE = "gps_locations"
+PARTITION_NAME = re.compile(r"^gps_locations_p(\d{8})$")
+DEFAULT_PARTITION = "gps_locations_default"
+# Arbitrary key so concurrent workers do not run maintenance at the same time
+ADVISORY_LOCK_ID = 726_001
+
+
+def period_start(day: date, interval: str) -> date:
+    """Get the first day of the partition period containing `day`."""
+    if interval == "week":
+        return day - timedelta(days=day.weekday())  # Monday
+    if interval == "day":
+        return day
+    raise ValueError(f"Unsupported partition interval: {interval}")
+
+
+def partition_bounds(day: date, interval: str) -> Tuple[str, date, date]:
+    """Get (name, start, end) of the partition holding `day`."""
+    start = period_start(day, interval)
+    end = start + timedelta(days=7 if interval == "week" else 1)
+    return f"{PARENT_TABLE}_p{start:%Y%m%d}", start, end
+
+
+def partition_ddl(day: date, interval: str) -> str:
+    """CREATE statement for the partition holding `day`."""
+    name, start, end = partition_bounds(day, interval)
+    return (
+        f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {PARENT_TABLE} "
+        f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+    )
+
+
+async def is_partitioned(conn: AsyncConnection) -> bool:
+    """Check whether gps_locations is a partitioned table."""
+    result = await conn.execute(text(
+        "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table pt "
+        "JOIN pg_class c ON c.oid = pt.partrelid WHERE c.relname = :name)"
+    ), {"name": PARENT_TABLE})
+    return bool(result.scalar())
+
+
+async def list_partitions(conn: AsyncConnection) -> List[str]:
+    """Names of the dated partitions of gps_locations."""
+    result = await conn.execute(text(
+        "SELECT c.relname FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid "
+        "JOIN pg_class p ON p.oid = i.inhparent "
+        "WHERE p.relname = :name ORDER BY c.relname"
+    ), {"name": PARENT_TABLE})
+    return [name for name in result.scalars() if PARTITION_NAME.match(name)]
+
+
+async def create_partition(conn: AsyncConnection, day: date, interval: str) -> int:
+    """
+    Create the partition holding `day`, moving its rows out of the default
+    partition. Returns the number of rows moved.
+    """
+    name, start, end = partition_bounds(day, interval)
+    in_range = f"timestamp >= '{start.isoformat()}' AND timestamp < '{end.isoformat()}'"
+    moved = 0
+    default = await conn.execute(text("SELECT to_regclass(:name)"), {"name": DEFAULT_PARTITION})
+    if default.scalar():
+        count = await conn.execute(
+            text(f"SELECT count(*) FROM {DEFAULT_PARTITION} WHERE {in_range}")
+        )
+        moved = count.scalar()
+    if moved:
+        await conn.execute(text(f"CREATE TEMP TABLE {name}_moved (LIKE {PARENT_TABLE})"))
+        await conn.execute(text(
+            f"WITH rows AS (DELETE FROM {DEFAULT_PARTITION} WHERE {in_range} RETURNING *) "
+            f"INSERT INTO {name}_moved SELECT * FROM rows"
+        ))
+    await conn.execute(text(partition_ddl(day, interval)))
+    if moved:
+        await conn.execute(text(f"INSERT INTO {PARENT_TABLE} SELECT * FROM {name}_moved"))
+        await conn.execute(text(f"DROP TABLE {name}_moved"))
+        logger.warning(f"Moved {moved} GPS fixes from {DEFAULT_PARTITION} into {name}")
+    return moved
+
+
+async def ensure_partitions(
+    conn: AsyncConnection,
+    days_ahead: int,
+    interval: str,
+    today: Optional[date] = None,
+) -> List[str]:
+    """
+    Create the partitions covering today through today + days_ahead. Returns
+    new names. Each is created in its own savepoint: one that fails is logged
+    and retried on the next run without holding up the others.
+    """
+    today = today or datetime.utcnow().date()
+    existing = set(await list_partitions(conn))
+    created = []
+    day = period_start(today, interval)
+    while day <= today + timedelta(days=days_ahead):
+        name, _, end = partition_bounds(day, interval)
+        if name not in existing:
+            try:
+                async with conn.begin_nested():
+                    await create_partition(conn, day, interval)
+                created.append(name)
+            except Exception as e:
+                logger.error(f"Failed to create GPS partition {name}: {e}")
+        day = end
+    return created
+
+
+async def drop_expired_partitions(
+    conn: AsyncConnection,
+    retention_days: int,
+    interval: str,
+    today: Optional[date] = None,
+) -> List[str]:
+    """Drop partitions wholly older than the retention period. Returns the dropped names."""
+    if retention_days <= 0:
+        return []
+    today = today or datetime.utcnow().date()
+    cutoff = today - timedelta(days=retention_days)
+    dropped = []
+    for name in await list_partitions(conn):
+        start = datetime.strptime(PARTITION_NAME.match(name).group(1), "%Y%m%d").date()
+        _, _, end = partition_bounds(start, interval)
+        if end <= cutoff:
+            await conn.execute(text(f"ALTER TABLE {PARENT_TABLE} DETACH PARTITION {name}"))
+            await conn.execute(text(f"DROP TABLE {name}"))
+            dropped.append(name)
+    return dropped
+
+
+async def run_partition_maintenance() -> dict:
+    """Create upcoming partitions and drop expired ones, each step in its own transaction."""
+    result = {"partitioned": True, "created": [], "dropped": [], "errors": []}
+    async with engine.connect() as conn:
+        if not await is_partitioned(conn):
+            return {"partitioned": False, "created": [], "dropped": []}
+
+        # Session-level lock, held across both transactions
+        locked = await conn.execute(
+            text("SELECT pg_try_advisory_lock(:id)"), {"id": ADVISORY_LOCK_ID}
+        )
+        locked = locked.scalar()
+        await conn.commit()
+        if not locked:
+            return {"partitioned": True, "created": [], "dropped": [], "skipped": True}
+
+        try:
+            steps = [
+                ("created", ensure_partitions, settings.GPS_PARTITION_PREMAKE_DAYS),
+                ("dropped", drop_expired_partitions, settings.GPS_RETENTION_DAYS),
+            ]
+            for key, step, days in steps:
+                try:
+                    async with conn.begin():
+                        result[key] = await step(conn, days, settings.GPS_PARTITION_INTERVAL)
+                except Exception as e:
+                    result["errors"].append(f"{step.__name__}: {e}")
+                    logger.error(f"GPS partition maintenance step {step.__name__} failed: {e}")
+        finally:
+            await conn.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": ADVISORY_LOCK_ID})
+            await conn.commit()
+
+    if result["created"] or result["dropped"]:
+        logger.info(f"GPS partitions created: {result['created']}, dropped: {result['dropped']}")
+    return result
+
+
+class PartitionMaintainer:
+    """Runs partition maintenance periodically in the background."""
+
+    def __init__(self, interval_hours: float):
+        self.interval = interval_hours * 3600
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        """Start the maintenance loop."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the maintenance loop."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await run_partition_maintenance()
+            except Exception as e:
+                logger.error(f"GPS partition maintenance failed: {e}", exc_info=True)
+            await asyncio.sleep(self.interval)
+
+
+# Global maintainer instance (started from the application lifespan)
+partition_maintainer = PartitionMaintainer(settings.GPS_PARTITION_MAINTENANCE_HOURS)
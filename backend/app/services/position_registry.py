@@ -0,0 +1,198 @@
+"""
+Last-known-position registry.
+
+Keeps the newest GPS fix of every vehicle in memory, updated on each
+ingested fix and seeded from the database on startup. The live map, the
+tracking WebSocket snapshot and trip dispatch read from here instead of
+running a GROUP BY over the whole gps_locations table.
+"""
+
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..config import settings
+from ..models.tracking import GPSLocation
+from .spatial_index import GridIndex
+
+logger = logging.getLogger(__name__)
+
+
+def _naive_utc(value: datetime) -> datetime:
+    """Normalize a timestamp to naive UTC so fixes from any source compare."""
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _float(value) -> Optional[float]:
+    return float(value) if value is not None else None
+
+
+class Position:
+    """Compact record of a vehicle's newest fix."""
+
+    __slots__ = (
+        "vehicle_id", "latitude", "longitude", "speed", "heading",
+        "accuracy", "device_id", "timestamp", "id",
+    )
+
+    def __init__(
+        self,
+        vehicle_id: int,
+        latitude: float,
+        longitude: float,
+        timestamp: datetime,
+        speed: Optional[float] = None,
+        heading: Optional[float] = None,
+        accuracy: Optional[float] = None,
+        device_id: Optional[str] = None,
+        id: Optional[int] = None,
+    ):
+        self.vehicle_id = vehicle_id
+        self.latitude = latitude
+        self.longitude = longitude
+        self.timestamp = timestamp
+        self.speed = speed
+        self.heading = heading
+        self.accuracy = accuracy
+        self.device_id = device_id
+        self.id = id
+
+    def to_message(self) -> dict:
+        """Build the WebSocket payload for this position."""
+        return {
+            "id": self.id,
+            "vehicle_id": self.vehicle_id,
+            "latitude": self.latitude,
+            "longitude": self.longitude,
+            "speed": self.speed,
+            "heading": self.heading,
+            "timestamp": self.timestamp.isoformat(),
+        }
+
+    def __repr__(self) -> str:
+        return f"<Position(vehicle_id={self.vehicle_id}, lat={self.latitude}, lng={self.longitude})>"
+
+
+class PositionRegistry:
+    """
+    Newest position per vehicle_id, plus a grid index of those positions
+    for radius and nearest-vehicle queries.
+    Positions are per-process; every worker sees the fixes it ingests.
+    """
+
+    def __init__(self):
+        self._positions: Dict[int, Position] = {}
+        self.index = GridIndex(cell_size_deg=settings.SPATIAL_INDEX_CELL_DEG)
+        self.seeded = False
+
+    def __len__(self) -> int:
+        return len(self._positions)
+
+    def get(self, vehicle_id: int) -> Optional[Position]:
+        """Get the newest position of a vehicle."""
+        return self._positions.get(vehicle_id)
+
+    def update(self, row: dict, location_id: Optional[int] = None) -> Optional[Position]:
+        """
+        Record a fix. Returns the new Position, or None if the registry
+        already holds a newer fix for the vehicle (e.g. a late batch upload).
+        """
+        timestamp = _naive_utc(row["timestamp"])
+        current = self._positions.get(row["vehicle_id"])
+        if current is not None and current.timestamp > timestamp:
+            return None
+
+        position = Position(
+            vehicle_id=row["vehicle_id"],
+            latitude=float(row["latitude"]),
+            longitude=float(row["longitude"]),
+            timestamp=timestamp,
+            speed=_float(row.get("speed")),
+            heading=_float(row.get("heading")),
+            accuracy=_float(row.get("accuracy")),
+            device_id=row.get("device_id"),
+            id=location_id,
+        )
+        self._positions[position.vehicle_id] = position
+        self.index.upsert(position.vehicle_id, position.latitude, position.longitude)
+        return position
+
+    def remove(self, vehicle_id: int):
+        """Forget a vehicle (e.g. after it was deleted)."""
+        self._positions.pop(vehicle_id, None)
+        self.index.remove(vehicle_id)
+
+    def snapshot(self, max_age_seconds: Optional[float] = None) -> List[Position]:
+        """Get all positions, newest first, optionally only those newer than max_age_seconds."""
+        positions = self._positions.values()
+        if max_age_seconds is not None:
+            cutoff = datetime.utcnow() - timedelta(seconds=max_age_seconds)
+            positions = [p for p in positions if p.timestamp >= cutoff]
+        return sorted(positions, key=lambda p: p.timestamp, reverse=True)
+
+    async def nearest_confirmed(
+        self,
+        lat: float,
+        lng: float,
+        confirm: Callable[[List[int]], Awaitable[Dict[int, Any]]],
+        k: int = 8,
+    ) -> Optional[Tuple[int, Any]]:
+        """
+        Get (vehicle_id, value) of the nearest vehicle that `confirm` accepts.
+        The k nearest vehicles are passed to `confirm` (e.g. one database
+        query for the available ones), which returns a value per accepted
+        ID; if none is accepted, the next candidates are tried with k
+        growing fourfold until the index runs out.
+        """
+        rejected = set()
+        while True:
+            hits = self.index.nearest(lat, lng, k=k, predicate=lambda vehicle_id: vehicle_id not in rejected)
+            if not hits:
+                return None
+            candidates = [vehicle_id for vehicle_id, _ in hits]
+            accepted = await confirm(candidates)
+            for vehicle_id in candidates:
+                if vehicle_id in accepted:
+                    return vehicle_id, accepted[vehicle_id]
+            if len(hits) < k:
+                return None
+            rejected.update(candidates)
+            k *= 4
+
+    async def seed(self, db: AsyncSession):
+        """Load the newest fix per vehicle from the last POSITION_SEED_HOURS."""
+        cutoff = datetime.utcnow() - timedelta(hours=settings.POSITION_SEED_HOURS)
+        stmt = (
+            select(GPSLocation)
+            .where(GPSLocation.timestamp >= cutoff)
+            .order_by(GPSLocation.vehicle_id, GPSLocation.timestamp.desc())
+            .distinct(GPSLocation.vehicle_id)
+        )
+        result = await db.execute(stmt)
+        for location in result.scalars():
+            self.update({
+                "vehicle_id": location.vehicle_id,
+                "latitude": location.latitude,
+                "longitude": location.longitude,
+                "speed": location.speed,
+                "heading": location.heading,
+                "accuracy": location.accuracy,
+                "device_id": location.device_id,
+                "timestamp": location.timestamp,
+            }, location.id)
+        self.seeded = True
+        logger.info(f"Position registry seeded with {len(self)} vehicles")
+
+    async def ensure_seeded(self, db: AsyncSession):
+        """Seed on first use when the lifespan did not run (e.g. Lambda)."""
+        if not self.seeded:
+            await self.seed(db)
+
+
+# Global registry instance
+position_registry = PositionRegistry()
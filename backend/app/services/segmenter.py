@@ -0,0 +1,264 @@
+"""
+Packing of uploaded frames into fixed-duration video segments.
+
+One archive object and row per frame would mean 86,400 of each per camera
+and day at 1 fps. Frames uploaded to /video/frames/upload are instead
+gathered per vehicle, camera and trip into segments of
+VIDEO_SEGMENT_SECONDS: the JPEGs concatenated as-is into an MJPEG stream
+(playable with `ffmpeg -f mjpeg`), plus an index of
+[time offset ms, byte offset, length] per frame kept in the archive row's
+metadata, so a frame can be found by time and read with one ranged GET.
+
+A segment is closed by the first frame past its duration, by the sweeper
+once it is that old, or early when open segments outgrow
+VIDEO_SEGMENT_MEMORY_MB (largest first). A closed segment becomes one
+VideoArchive row, its bytes are written by frame storage and its first
+frame is queued for a thumbnail. Segments are per process: with several
+workers a camera's frames may be split across shorter segments.
+"""
+
+import asyncio
+import bisect
+import logging
+import math
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from ..config import settings
+from ..database import AsyncSessionLocal
+from .blob_store import blob_key
+from .frame_storage import StorageFullError, frame_storage, mark_frames_stored
+from .thumbnails import thumbnailer
+
+logger = logging.getLogger(__name__)
+
+SegmentKey = Tuple[int, str, Optional[int]]  # vehicle_id, camera position, trip_id
+SegmentSink = Callable[["Segment"], Awaitable[None]]
+
+
+class Segment:
+    """Frames of one camera concatenated in upload order, with their offsets."""
+
+    __slots__ = (
+        "vehicle_id", "camera_position", "trip_id", "device_id", "started_at", "ended_at", "chunks", "index", "size"
+    )
+
+    def __init__(
+        self,
+        vehicle_id: int,
+        camera_position: str,
+        started_at: datetime,
+        trip_id: Optional[int] = None,
+        device_id: Optional[str] = None,
+    ):
+        self.vehicle_id = vehicle_id
+        self.camera_position = camera_position
+        self.trip_id = trip_id
+        self.device_id = device_id
+        self.started_at = started_at
+        self.ended_at = started_at
+        self.chunks: List[bytes] = []
+        self.index: List[List[int]] = []  # [time offset ms, byte offset, length] per frame
+        self.size = 0
+
+    def add(self, jpeg: bytes, timestamp: datetime):
+        offset_ms = max(int((timestamp - self.started_at).total_seconds() * 1000), 0)
+        self.index.append([offset_ms, self.size, len(jpeg)])
+        self.chunks.append(jpeg)
+        self.size += len(jpeg)
+        self.ended_at = max(self.ended_at, timestamp)
+
+    @property
+    def duration(self) -> int:
+        """Seconds from the first to the last frame, rounded up."""
+        return math.ceil((self.ended_at - self.started_at).total_seconds())
+
+    @property
+    def retention_until(self) -> datetime:
+        return self.started_at + timedelta(days=7)
+
+    @property
+    def path(self) -> str:
+        """S3 key or path under FRAME_STORAGE_PATH."""
+        return (
+            f"segments/vehicle_{self.vehicle_id}/{self.camera_position}/"
+            f"{self.started_at.strftime('%Y%m%d_%H%M%S_%f')}.mjpeg"
+        )
+
+    def payload(self) -> bytes:
+        return b"".join(self.chunks)
+
+    def metadata(self, index: bool = True) -> dict:
+        metadata = {
+            "type": "segment",
+            "format": "mjpeg",
+            "device_id": self.device_id,
+            "trip_id": self.trip_id,
+            "frames": len(self.index),
+        }
+        if index:
+            metadata["index"] = self.index
+        return metadata
+
+
+def frame_at(index: List[List[int]], seconds: float) -> List[int]:
+    """Index entry of the frame shown at a time offset: the last one at or before it."""
+    position = bisect.bisect_right([entry[0] for entry in index], seconds * 1000)
+    return index[max(position - 1, 0)]
+
+
+async def archive_segment(segment: Segment):
+    """Record a closed segment as a VideoArchive and hand its bytes to frame storage."""
+    from ..models.video import VideoArchive
+
+    data = segment.payload()
+    archive = VideoArchive(
+        vehicle_id=segment.vehicle_id,
+        camera_position=segment.camera_position,
+        file_path=segment.path,
+        file_size=segment.size,
+        duration=segment.duration,
+        extra_metadata=segment.metadata(),
+        retention_until=segment.retention_until,
+    )
+    if not frame_storage.running:
+        # No worker pool (e.g. scripts): write before recording the row
+        await frame_storage.write(segment.path, data)
+        archive.stored_at = datetime.now(timezone.utc)
+
+    async with AsyncSessionLocal() as db:
+        db.add(archive)
+        await db.commit()
+        await db.refresh(archive)
+
+    if archive.stored_at is None:
+        try:
+            frame_storage.put(archive.id, segment.path, data)
+        except StorageFullError:
+            # Segments are not refused like single uploads; write this one here instead
+            await frame_storage.write(segment.path, data)
+            await mark_frames_stored([archive.id])
+
+    first = segment.chunks[0]
+    thumbnailer.submit(blob_key(first), first, archive_id=archive.id)
+
+
+class Segmenter:
+    """Open segments per vehicle, camera and trip, closed by duration, age or memory budget."""
+
+    def __init__(
+        self,
+        seconds: Optional[int] = None,
+        memory_bytes: Optional[int] = None,
+        sink: Optional[SegmentSink] = None,
+    ):
+        self.seconds = seconds or settings.VIDEO_SEGMENT_SECONDS
+        self.memory_bytes = memory_bytes or settings.VIDEO_SEGMENT_MEMORY_MB * 1024 * 1024
+        self.sink = sink or archive_segment
+        self.open: Dict[SegmentKey, Segment] = {}
+        self.bytes = 0
+        self._task: Optional[asyncio.Task] = None
+        self._archiving: Set[asyncio.Task] = set()
+
+        # Counters
+        self.frames = 0
+        self.closed = 0
+        self.closed_early = 0  # Closed before their duration to stay within the memory budget
+        self.failed = 0
+
+    def start(self):
+        """Start the sweeper that closes segments whose camera went quiet."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the sweeper and archive every open segment."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for key in list(self.open):
+            self.close(key)
+        await asyncio.gather(*self._archiving)
+
+    def add(
+        self,
+        vehicle_id: int,
+        camera_position: str,
+        jpeg: bytes,
+        timestamp: datetime,
+        trip_id: Optional[int] = None,
+        device_id: Optional[str] = None,
+    ) -> Segment:
+        """Append a frame to its camera's open segment, closing that first if the frame is past its end."""
+        camera_position = getattr(camera_position, "value", camera_position)
+        key = (vehicle_id, camera_position, trip_id)
+        segment = self.open.get(key)
+        if segment is not None and (timestamp - segment.started_at).total_seconds() >= self.seconds:
+            self.close(key)
+            segment = None
+        if segment is None:
+            segment = self.open[key] = Segment(vehicle_id, camera_position, timestamp, trip_id, device_id)
+        segment.add(jpeg, timestamp)
+        self.bytes += len(jpeg)
+        self.frames += 1
+
+        while self.bytes > self.memory_bytes:
+            self.closed_early += 1
+            self.close(max(self.open, key=lambda k: self.open[k].size))
+        return segment
+
+    def close(self, key: SegmentKey):
+        """Take a segment out of the open ones and archive it in the background."""
+        segment = self.open.pop(key, None)
+        if segment is None:
+            return
+        self.bytes -= segment.size
+        self.closed += 1
+        task = asyncio.create_task(self._archive(segment))
+        self._archiving.add(task)
+        task.add_done_callback(self._archiving.discard)
+
+    def sweep(self, now: Optional[datetime] = None):
+        """Close segments that are at least a segment long, even without a newer frame."""
+        now = now or datetime.utcnow()
+        for key, segment in list(self.open.items()):
+            if (now - segment.started_at).total_seconds() >= self.seconds:
+                self.close(key)
+
+    def get_stats(self) -> dict:
+        return {
+            "open": len(self.open),
+            "bytes": self.bytes,
+            "memory_budget": self.memory_bytes,
+            "seconds": self.seconds,
+            "archiving": len(self._archiving),
+            "frames": self.frames,
+            "closed": self.closed,
+            "closed_early": self.closed_early,
+            "failed": self.failed,
+        }
+
+    async def _archive(self, segment: Segment):
+        """Hand a closed segment to the sink, logging (not raising) failures; its frames are then lost."""
+        try:
+            await self.sink(segment)
+        except Exception as e:
+            self.failed += 1
+            logger.error(f"Failed to archive segment {segment.path} ({len(segment.index)} frames): {e}")
+
+    async def _run(self):
+        period = max(self.seconds / 4, 1)
+        while True:
+            await asyncio.sleep(period)
+            try:
+                self.sweep()
+            except Exception as e:
+                logger.error(f"Segment sweep error: {e}")
+
+
+# Global instance (started from the application lifespan)
+segmenter = Segmenter()
@@ -0,0 +1,288 @@
+"""
+Uniform lat/lng grid index of current vehicle positions.
+
+Positions are bucketed into square cells of `cell_size_deg` degrees, so
+radius and k-nearest queries only look at the cells around the query
+point instead of every vehicle in the fleet.
+"""
+
+import math
+from typing import Callable, Dict, Hashable, Iterator, List, Optional, Set, Tuple
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEG_LAT = math.pi * EARTH_RADIUS_KM / 180  # ~111.195 km
+
+Cell = Tuple[int, int]
+
+
+def haversine_km(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """Great-circle distance between two coordinates in kilometers."""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = math.radians(lat2 - lat1)
+    dlambda = math.radians(lng2 - lng1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def _km_per_deg_lng(lat: float) -> float:
+    """Length of one degree of longitude at a latitude (floored near the poles)."""
+    return KM_PER_DEG_LAT * max(math.cos(math.radians(min(abs(lat), 89.0))), 0.01)
+
+
+class GridIndex:
+    """Grid of cell buckets mapping keys (e.g. vehicle IDs) to positions."""
+
+    def __init__(self, cell_size_deg: float = 0.01):
+        self.cell_size = cell_size_deg
+        self._cells: Dict[Cell, Set[Hashable]] = {}
+        self._positions: Dict[Hashable, Tuple[float, float, Cell]] = {}
+
+    def __len__(self) -> int:
+        return len(self._positions)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._positions
+
+    def cell_of(self, lat: float, lng: float) -> Cell:
+        """Get the cell containing a coordinate."""
+        return (math.floor(lat / self.cell_size), math.floor(lng / self.cell_size))
+
+    def cells_in_bbox(self, min_lat: float, min_lng: float, max_lat: float, max_lng: float) -> Iterator[Cell]:
+        """Iterate over the cells overlapping a bounding box."""
+        lat0, lng0 = self.cell_of(min_lat, min_lng)
+        lat1, lng1 = self.cell_of(max_lat, max_lng)
+        for i in range(lat0, lat1 + 1):
+            for j in range(lng0, lng1 + 1):
+                yield (i, j)
+
+    def position(self, key: Hashable) -> Optional[Tuple[float, float]]:
+        """Get the indexed position of a key."""
+        entry = self._positions.get(key)
+        return (entry[0], entry[1]) if entry else None
+
+    def upsert(self, key: Hashable, lat: float, lng: float):
+        """Insert or move a key."""
+        cell = self.cell_of(lat, lng)
+        entry = self._positions.get(key)
+        if entry is not None and entry[2] != cell:
+            self._discard_from_cell(key, entry[2])
+        self._positions[key] = (lat, lng, cell)
+        self._cells.setdefault(cell, set()).add(key)
+
+    def remove(self, key: Hashable):
+        """Remove a key from the index."""
+        entry = self._positions.pop(key, None)
+        if entry is not None:
+            self._discard_from_cell(key, entry[2])
+
+    def _discard_from_cell(self, key: Hashable, cell: Cell):
+        bucket = self._cells.get(cell)
+        if bucket is not None:
+            bucket.discard(key)
+            if not bucket:
+                del self._cells[cell]
+
+    def within_radius(
+        self,
+        lat: float,
+        lng: float,
+        radius_km: float,
+        predicate: Optional[Callable[[Hashable], bool]] = None,
+    ) -> List[Tuple[Hashable, float]]:
+        """
+        Get (key, distance_km) pairs within radius_km, nearest first.
+        Cells overlapping the bounding box of the circle are scanned, each
+        candidate is checked against the box and then by exact haversine.
+        """
+        dlat = radius_km / KM_PER_DEG_LAT
+        dlng = radius_km / _km_per_deg_lng(abs(lat) + dlat)
+        min_lat, max_lat = lat - dlat, lat + dlat
+        min_lng, max_lng = lng - dlng, lng + dlng
+
+        lat0, lng0 = self.cell_of(min_lat, min_lng)
+        lat1, lng1 = self.cell_of(max_lat, max_lng)
+        if (lat1 - lat0 + 1) * (lng1 - lng0 + 1) > len(self._cells):
+            # Wider than the occupied area: walk the occupied cells instead
+            cells = [cell for cell in self._cells if lat0 <= cell[0] <= lat1 and lng0 <= cell[1] <= lng1]
+        else:
+            cells = self.cells_in_bbox(min_lat, min_lng, max_lat, max_lng)
+
+        hits = []
+        for cell in cells:
+            for key in self._cells.get(cell, ()):
+                key_lat, key_lng, _ = self._positions[key]
+                if not (min_lat <= key_lat <= max_lat and min_lng <= key_lng <= max_lng):
+                    continue
+                if predicate is not None and not predicate(key):
+                    continue
+                distance = haversine_km(lat, lng, key_lat, key_lng)
+                if distance <= radius_km:
+                    hits.append((key, distance))
+        hits.sort(key=lambda hit: hit[1])
+        return hits
+
+    def nearest(
+        self,
+        lat: float,
+        lng: float,
+        k: int = 1,
+        max_radius_km: Optional[float] = None,
+        predicate: Optional[Callable[[Hashable], bool]] = None,
+    ) -> List[Tuple[Hashable, float]]:
+        """
+        Get up to k (key, distance_km) pairs nearest to a coordinate.
+        Rings of cells around the query cell are searched outwards until
+        no unvisited cell can hold anything closer than the k-th hit.
+        """
+        center_i, center_j = self.cell_of(lat, lng)
+        hits: List[Tuple[Hashable, float]] = []
+        seen = 0
+        ring = 0
+
+        while True:
+            if 8 * ring > len(self._cells):
+                # The ring has more cells than are occupied: a full scan is cheaper
+                return self._scan_all(lat, lng, k, max_radius_km, predicate)
+
+            for cell in self._ring_cells(center_i, center_j, ring):
+                for key in self._cells.get(cell, ()):
+                    seen += 1
+                    if predicate is not None and not predicate(key):
+                        continue
+                    key_lat, key_lng, _ = self._positions[key]
+                    distance = haversine_km(lat, lng, key_lat, key_lng)
+                    if max_radius_km is None or distance <= max_radius_km:
+                        hits.append((key, distance))
+
+            # Anything outside the rings searched so far is at least this far away
+            reach_deg = ring * self.cell_size
+            reach_km = min(
+                reach_deg * KM_PER_DEG_LAT,
+                reach_deg * _km_per_deg_lng(abs(lat) + reach_deg + self.cell_size),
+            )
+            hits.sort(key=lambda hit: hit[1])
+            if len(hits) >= k and hits[k - 1][1] <= reach_km:
+                break
+            if seen >= len(self._positions):
+                break
+            if max_radius_km is not None and reach_km > max_radius_km:
+                break
+            ring += 1
+
+        return hits[:k]
+
+    def _scan_all(
+        self,
+        lat: float,
+        lng: float,
+        k: int,
+        max_radius_km: Optional[float],
+        predicate: Optional[Callable[[Hashable], bool]],
+    ) -> List[Tuple[Hashable, float]]:
+        """Nearest-k by checking every indexed key."""
+        hits = []
+        for key, (key_lat, key_lng, _) in self._positions.items():
+            if predicate is not None and not predicate(key):
+                continue
+            distance = haversine_km(lat, lng, key_lat, key_lng)
+            if max_radius_km is None or distance <= max_radius_km:
+                hits.append((key, distance))
+        hits.sort(key=lambda hit: hit[1])
+        return hits[:k]
+
+    @staticmethod
+    def _ring_cells(center_i: int, center_j: int, ring: int) -> Iterator[Cell]:
+        """Iterate over the cells at Chebyshev distance `ring` from the center cell."""
+        if ring == 0:
+            yield (center_i, center_j)
+            return
+        for j in range(center_j - ring, center_j + ring + 1):
+            yield (center_i - ring, j)
+            yield (center_i + ring, j)
+        for i in range(center_i - ring + 1, center_i + ring):
+            yield (i, center_j - ring)
+            yield (i, center_j + ring)
+
+
+BBox = Tuple[float, float, float, float]  # (min_lat, min_lng, max_lat, max_lng)
+
+
+class BoxIndex:
+    """
+    Grid of cell buckets mapping keys (e.g. map viewports) to bounding boxes.
+
+    A box is registered in every cell it overlaps, so finding the boxes that
+    contain a point only checks the boxes of that point's cell. Boxes that
+    would span more than `max_cells` cells are kept aside and checked on
+    every lookup instead.
+    """
+
+    def __init__(self, cell_size_deg: float = 0.05, max_cells: int = 400):
+        self.cell_size = cell_size_deg
+        self.max_cells = max_cells
+        self._cells: Dict[Cell, Set[Hashable]] = {}
+        self._boxes: Dict[Hashable, BBox] = {}
+        self._oversized: Set[Hashable] = set()
+
+    def __len__(self) -> int:
+        return len(self._boxes)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._boxes
+
+    def _cell_range(self, box: BBox) -> Tuple[int, int, int, int]:
+        min_lat, min_lng, max_lat, max_lng = box
+        return (
+            math.floor(min_lat / self.cell_size), math.floor(min_lng / self.cell_size),
+            math.floor(max_lat / self.cell_size), math.floor(max_lng / self.cell_size),
+        )
+
+    def _cells_of(self, box: BBox) -> Iterator[Cell]:
+        lat0, lng0, lat1, lng1 = self._cell_range(box)
+        for i in range(lat0, lat1 + 1):
+            for j in range(lng0, lng1 + 1):
+                yield (i, j)
+
+    def _is_oversized(self, box: BBox) -> bool:
+        lat0, lng0, lat1, lng1 = self._cell_range(box)
+        return (lat1 - lat0 + 1) * (lng1 - lng0 + 1) > self.max_cells
+
+    def upsert(self, key: Hashable, box: BBox):
+        """Insert or replace the box of a key."""
+        self.remove(key)
+        self._boxes[key] = box
+        if self._is_oversized(box):
+            self._oversized.add(key)
+            return
+        for cell in self._cells_of(box):
+            self._cells.setdefault(cell, set()).add(key)
+
+    def remove(self, key: Hashable):
+        """Remove a key from the index."""
+        box = self._boxes.pop(key, None)
+        if box is None:
+            return
+        if key in self._oversized:
+            self._oversized.discard(key)
+            return
+        for cell in self._cells_of(box):
+            bucket = self._cells.get(cell)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del self._cells[cell]
+
+    def get(self, key: Hashable) -> Optional[BBox]:
+        """Get the box of a key."""
+        return self._boxes.get(key)
+
+    def containing(self, lat: float, lng: float) -> Set[Hashable]:
+        """Get the keys whose box contains a coordinate."""
+        cell = (math.floor(lat / self.cell_size), math.floor(lng / self.cell_size))
+        hits = set()
+        for candidates in (self._cells.get(cell, ()), self._oversized):
+            for key in candidates:
+                min_lat, min_lng, max_lat, max_lng = self._boxes[key]
+                if min_lat <= lat <= max_lat and min_lng <= lng <= max_lng:
+                    hits.add(key)
+        return hits
@@ -0,0 +1,216 @@
+"""
+Downscaled JPEG previews of trip images and video frames.
+
+Overview screens show dozens of tiles, for which a full VGA frame is
+mostly wasted bytes. Previews are THUMBNAIL_WIDTHS pixels wide and are
+rendered in a pool of THUMBNAIL_PROCESSES worker processes, so decoding
+and resizing never run on the event loop or compete for its GIL.
+
+Previews of trip images and archived frames are stored in the blob store
+under derived_key(source key, "w<width>"): they are found from the source
+key without a lookup and are as cacheable as the source. New uploads are
+queued for rendering in the background; when the queue is full the work is
+dropped and the previews are rendered on their first request instead.
+Previews of live frames are only kept on the frame itself, for as long as
+the FrameStore holds it.
+"""
+
+import asyncio
+import io
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence
+
+from sqlalchemy import update
+
+from ..config import settings
+from ..database import AsyncSessionLocal
+from .blob_store import blob_store, derived_key
+
+logger = logging.getLogger(__name__)
+
+ArchiveUpdater = Callable[[int, str], Awaitable[None]]
+
+
+def render(jpeg: bytes, widths: Sequence[int], quality: int) -> Dict[int, bytes]:
+    """Encode a JPEG preview per width (runs in a worker process). Images are never upscaled."""
+    from PIL import Image
+
+    previews = {}
+    with Image.open(io.BytesIO(jpeg)) as image:
+        largest = max(widths)
+        if largest < image.width:
+            # Let libjpeg decode straight to a smaller scale instead of resizing the full image
+            image.draft("RGB", (largest, max(1, image.height * largest // image.width)))
+        image = image.convert("RGB")
+        for width in widths:
+            if width < image.width:
+                height = max(1, round(image.height * width / image.width))
+                resized = image.resize((width, height), Image.Resampling.LANCZOS, reducing_gap=2.0)
+            else:
+                resized = image
+            out = io.BytesIO()
+            resized.save(out, "JPEG", quality=quality, optimize=True)
+            previews[width] = out.getvalue()
+    return previews
+
+
+def preview_key(source_key: str, width: int) -> str:
+    """Blob key of the preview of a stored image."""
+    return derived_key(source_key, f"w{width}")
+
+
+def preview_url(source_key: str, width: int) -> str:
+    return f"/api/v1/images/blobs/{preview_key(source_key, width)}"
+
+
+async def set_archive_thumbnail(archive_id: int, url: str):
+    """Point a video archive at its thumbnail."""
+    from ..models.video import VideoArchive
+
+    async with AsyncSessionLocal() as db:
+        await db.execute(update(VideoArchive).where(VideoArchive.id == archive_id).values(thumbnail_url=url))
+        await db.commit()
+
+
+class Thumbnailer:
+    """Renders previews in a process pool, in the background for uploads or on demand."""
+
+    def __init__(
+        self,
+        widths: Optional[List[int]] = None,
+        quality: Optional[int] = None,
+        processes: Optional[int] = None,
+        max_size: Optional[int] = None,
+        store=None,
+        archive_updater: Optional[ArchiveUpdater] = None,
+    ):
+        self.widths = sorted(widths or settings.THUMBNAIL_WIDTHS)
+        self.quality = quality or settings.THUMBNAIL_QUALITY
+        self.processes = processes or settings.THUMBNAIL_PROCESSES
+        self.max_size = max_size or settings.THUMBNAIL_QUEUE_SIZE
+        self.store = store or blob_store
+        self.archive_updater = archive_updater or set_archive_thumbnail
+
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._inflight: Dict[str, asyncio.Future] = {}  # Source -> render shared by concurrent requests
+
+        # Counters
+        self.rendered = 0
+        self.failed = 0
+        self.dropped = 0
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    def start(self):
+        """Start the worker processes and the background queue."""
+        if self._tasks:
+            return
+        self._pool = ProcessPoolExecutor(max_workers=self.processes)
+        self._queue = asyncio.Queue(maxsize=self.max_size)
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.processes)]
+        logger.info(f"Thumbnailer started (processes={self.processes}, widths={self.widths})")
+
+    async def stop(self):
+        """Stop the workers; queued uploads are left for on-demand rendering."""
+        if not self._tasks:
+            return
+        tasks, self._tasks = self._tasks, []
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.dropped += self._queue.qsize()
+        self._pool.shutdown(wait=True, cancel_futures=True)
+        self._pool = None
+        logger.info(f"Thumbnailer stopped (rendered={self.rendered}, failed={self.failed})")
+
+    def submit(self, source_key: str, jpeg: bytes, archive_id: Optional[int] = None) -> bool:
+        """Queue previews of a stored image; False if they were left for on-demand rendering."""
+        if not self.running:
+            return False
+        try:
+            self._queue.put_nowait((source_key, jpeg, archive_id))
+        except asyncio.QueueFull:
+            self.dropped += 1
+            return False
+        return True
+
+    def check_width(self, width: int):
+        if width not in self.widths:
+            raise ValueError(f"size must be one of {', '.join(map(str, self.widths))}")
+
+    async def render(self, jpeg: bytes) -> Dict[int, bytes]:
+        """Previews of a JPEG in every width, from a worker process (or a thread before start)."""
+        loop = asyncio.get_running_loop()
+        try:
+            previews = await loop.run_in_executor(self._pool, render, jpeg, self.widths, self.quality)
+        except Exception:
+            self.failed += 1
+            raise
+        self.rendered += 1
+        return previews
+
+    async def store_previews(self, source_key: str, jpeg: bytes):
+        """Render and store every preview of an image in the blob store."""
+        for width, preview in (await self.render(jpeg)).items():
+            await self.store.put_derived(preview_key(source_key, width), preview)
+
+    async def preview(self, source_key: str, width: int, jpeg: Optional[bytes] = None) -> str:
+        """
+        Key of the preview of a stored image, rendering it first if needed.
+        The source is read from the blob store unless given; BlobNotFound
+        propagates if it is not there.
+        """
+        self.check_width(width)
+        key = preview_key(source_key, width)
+        if await self.store.exists(key):
+            return key
+        if jpeg is None:
+            jpeg = await self.store.get(source_key)
+        await self._once(source_key, lambda: self.store_previews(source_key, jpeg))
+        return key
+
+    async def frame_preview(self, frame, width: int) -> bytes:
+        """Preview of a live frame, rendered once and kept on the frame."""
+        self.check_width(width)
+        if frame.previews is None:
+            frame.previews = await self._once(f"frame:{frame.route_id}:{frame.seq}", lambda: self.render(frame.jpeg))
+        return frame.previews[width]
+
+    async def _once(self, name: str, make: Callable[[], Awaitable]):
+        """Run make() once for concurrent callers asking for the same source."""
+        future = self._inflight.get(name)
+        if future is None:
+            future = self._inflight[name] = asyncio.ensure_future(make())
+            future.add_done_callback(lambda _: self._inflight.pop(name, None))
+        return await asyncio.shield(future)
+
+    def get_stats(self) -> dict:
+        return {
+            "running": self.running,
+            "processes": self.processes,
+            "widths": self.widths,
+            "depth": self._queue.qsize() if self._queue else 0,
+            "max_size": self.max_size,
+            "rendered": self.rendered,
+            "failed": self.failed,
+            "dropped": self.dropped,
+        }
+
+    async def _work(self):
+        while True:
+            source_key, jpeg, archive_id = await self._queue.get()
+            try:
+                await self._once(source_key, lambda: self.store_previews(source_key, jpeg))
+                if archive_id is not None:
+                    await self.archive_updater(archive_id, preview_url(source_key, self.widths[0]))
+            except Exception as e:
+                logger.error(f"Failed to make previews of {source_key}: {e}")
+
+
+# Global instance (started from the application lifespan)
+thumbnailer = Thumbnailer()
@@ -0,0 +1,191 @@
+"""
+Trajectory simplification for GPS location history.
+
+Reduces a vehicle trace to the points that matter for drawing it on a
+map, using Douglas-Peucker on NumPy arrays. Segments are split in order
+of their largest deviation, so the same pass serves a distance
+tolerance (stop when no point deviates more than `tolerance_m`), a point
+budget (stop after `max_points`), or both.
+
+Rows are fed in chunks as they are streamed from the database. With a
+tolerance, each chunk is simplified on arrival and only the kept points
+are retained, so memory stays bounded by the chunk size plus the output.
+With a point budget, the retained points are reduced to twice the budget
+whenever they reach COMPACT_FACTOR times it, so a long range with only
+max_points set holds at most that many points plus a chunk. The final
+pass then picks the budget from points that already survived earlier
+passes, which may differ slightly from simplifying the whole trace at once.
+"""
+
+import heapq
+import math
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+from .spatial_index import KM_PER_DEG_LAT
+
+METERS_PER_DEG_LAT = KM_PER_DEG_LAT * 1000
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+COMPACT_FACTOR = 4
+
+
+def to_local_xy(lats: np.ndarray, lngs: np.ndarray) -> np.ndarray:
+    """Project coordinates to planar meters (equirectangular around the mean latitude)."""
+    scale_x = METERS_PER_DEG_LAT * math.cos(math.radians(float(np.mean(lats))))
+    return np.column_stack((lngs * scale_x, lats * METERS_PER_DEG_LAT))
+
+
+def segment_distances(points: np.ndarray, start: np.ndarray, end: np.ndarray) -> np.ndarray:
+    """Distance from each point to the segment start-end (not the infinite line)."""
+    direction = end - start
+    length_sq = float(direction @ direction)
+    if length_sq == 0.0:
+        return np.hypot(*(points - start).T)
+    t = np.clip(((points - start) @ direction) / length_sq, 0.0, 1.0)
+    nearest = start + t[:, None] * direction
+    return np.hypot(*(points - nearest).T)
+
+
+def simplify(
+    xy: np.ndarray,
+    tolerance_m: Optional[float] = None,
+    max_points: Optional[int] = None,
+) -> np.ndarray:
+    """
+    Douglas-Peucker simplification. Returns the sorted indices of kept points.
+
+    The first and last points are always kept. Splitting stops when the
+    largest remaining deviation is within tolerance_m or when max_points
+    points are kept, whichever comes first.
+    """
+    n = len(xy)
+    if n <= 2 or (max_points is not None and max_points >= n and tolerance_m is None):
+        return np.arange(n)
+
+    kept = [0, n - 1]
+    heap = []
+
+    def push(start: int, end: int):
+        if end - start < 2:
+            return
+        distances = segment_distances(xy[start + 1:end], xy[start], xy[end])
+        worst = int(np.argmax(distances))
+        heapq.heappush(heap, (-float(distances[worst]), start, end, start + 1 + worst))
+
+    push(0, n - 1)
+    while heap:
+        if max_points is not None and len(kept) >= max_points:
+            break
+        negative_distance, start, end, split = heapq.heappop(heap)
+        if tolerance_m is not None and -negative_distance <= tolerance_m:
+            break
+        kept.append(split)
+        push(start, split)
+        push(split, end)
+
+    return np.sort(np.array(kept))
+
+
+class TraceSimplifier:
+    """
+    Accumulates a trace chunk by chunk and simplifies it.
+    Chunks must arrive in trace order (either direction).
+    """
+
+    def __init__(self, tolerance_m: Optional[float] = None, max_points: Optional[int] = None):
+        self.tolerance_m = tolerance_m
+        self.max_points = max_points
+        self.total_points = 0
+        # Columns: lat, lng, speed, heading (NaN when missing), timestamp in epoch microseconds
+        self._coords: List[np.ndarray] = []
+        self._timestamps: List[np.ndarray] = []
+
+    def add(self, rows: Sequence):
+        """Add rows with latitude, longitude, speed, heading and timestamp attributes."""
+        if not rows:
+            return
+        self.total_points += len(rows)
+        coords = np.array(
+            [(row.latitude, row.longitude, _nan(row.speed), _nan(row.heading)) for row in rows],
+            dtype=np.float64,
+        )
+        timestamps = np.array([_epoch_us(row.timestamp) for row in rows], dtype=np.int64)
+
+        if self.tolerance_m is not None:
+            coords, timestamps = self._simplify_chunk(coords, timestamps)
+        self._coords.append(coords)
+        self._timestamps.append(timestamps)
+        if self.max_points is not None:
+            self._compact()
+
+    @property
+    def held_points(self) -> int:
+        """Points currently retained."""
+        return sum(len(coords) for coords in self._coords)
+
+    def _compact(self):
+        """Reduce the retained points to twice the budget once they reach COMPACT_FACTOR times it."""
+        if self.held_points < COMPACT_FACTOR * self.max_points:
+            return
+        coords = np.vstack(self._coords)
+        timestamps = np.concatenate(self._timestamps)
+        kept = simplify(
+            to_local_xy(coords[:, 0], coords[:, 1]),
+            tolerance_m=self.tolerance_m,
+            max_points=2 * self.max_points,
+        )
+        self._coords, self._timestamps = [coords[kept]], [timestamps[kept]]
+
+    def _simplify_chunk(self, coords: np.ndarray, timestamps: np.ndarray):
+        """Simplify a chunk, anchored on the last kept point of the previous chunk."""
+        if self._coords:
+            coords = np.vstack((self._coords[-1][-1:], coords))
+            timestamps = np.concatenate((self._timestamps[-1][-1:], timestamps))
+            anchored = True
+        else:
+            anchored = False
+
+        kept = simplify(to_local_xy(coords[:, 0], coords[:, 1]), tolerance_m=self.tolerance_m)
+        if anchored:
+            kept = kept[1:]  # The anchor is already stored
+        return coords[kept], timestamps[kept]
+
+    def finish(self) -> List[dict]:
+        """Simplify what was collected and return the kept points as dicts."""
+        if not self._coords:
+            return []
+        coords = np.vstack(self._coords)
+        timestamps = np.concatenate(self._timestamps)
+        self._coords, self._timestamps = [], []
+
+        if self.max_points is not None and len(coords) > self.max_points:
+            kept = simplify(
+                to_local_xy(coords[:, 0], coords[:, 1]),
+                tolerance_m=self.tolerance_m,
+                max_points=self.max_points,
+            )
+            coords, timestamps = coords[kept], timestamps[kept]
+
+        return [
+            {
+                "latitude": float(lat),
+                "longitude": float(lng),
+                "speed": None if math.isnan(speed) else float(speed),
+                "heading": None if math.isnan(heading) else float(heading),
+                "timestamp": EPOCH + timedelta(microseconds=int(ts)),
+            }
+            for (lat, lng, speed, heading), ts in zip(coords, timestamps)
+        ]
+
+
+def _nan(value) -> float:
+    return float("nan") if value is None else float(value)
+
+
+def _epoch_us(value: datetime) -> int:
+    """Timestamp as integer microseconds since the epoch (naive values are UTC)."""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return (value - EPOCH) // timedelta(microseconds=1)
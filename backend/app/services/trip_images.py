@@ -0,0 +1,107 @@
+"""
+Trip images in the blob store.
+
+Rows written before the blob store have the JPEG base64 encoded in
+trip_images.image_data. Each such row is decoded, stored under its
+SHA-256 key and updated to keep only blob_key and size, one committed
+batch at a time, so the job can be stopped and rerun at any point.
+
+Blobs are shared by rows with the same bytes, so deleting a row only
+deletes its blob and previews once no other row references the key.
+Storing a blob and inserting its row, and counting a key's references and
+deleting its blob, each happen under a transaction advisory lock on the
+key (lock_blob), so an upload of the same bytes cannot land between the
+count and the delete and be left pointing at a missing blob.
+"""
+
+import base64
+import binascii
+import logging
+from typing import Optional
+
+from sqlalchemy import func, select, text, update
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+
+from ..database import engine
+from ..models.image import TripImage
+from ..models.video import VideoArchive
+from .blob_store import BlobStore, blob_key, blob_store
+from .thumbnails import preview_key, preview_url, thumbnailer
+
+logger = logging.getLogger(__name__)
+
+
+def decode_image(image_data: str) -> bytes:
+    """Decode a base64 image, with or without a data: URL prefix."""
+    if image_data.startswith("data:"):
+        image_data = image_data.split(",", 1)[-1]
+    return base64.b64decode(image_data, validate=True)
+
+
+async def lock_blob(db, key: str):
+    """Hold a Postgres advisory lock on a blob key until the transaction ends."""
+    await db.execute(text("SELECT pg_advisory_xact_lock(hashtext(:key))"), {"key": key})
+
+
+async def migrate_trip_images(
+    batch_size: int = 100,
+    bind: Optional[AsyncEngine] = None,
+    store: Optional[BlobStore] = None,
+) -> dict:
+    """Move every base64 image to the blob store; returns moved and skipped counts."""
+    store = store or blob_store
+    moved = skipped = 0
+    last_id = 0
+    async with (bind or engine).connect() as conn:
+        while True:
+            stmt = (
+                select(TripImage.id, TripImage.image_data)
+                .where(TripImage.image_data.isnot(None), TripImage.id > last_id)
+                .order_by(TripImage.id)
+                .limit(batch_size)
+            )
+            rows = (await conn.execute(stmt)).all()
+            if not rows:
+                break
+            for row in rows:
+                last_id = row.id
+                try:
+                    data = decode_image(row.image_data)
+                except (binascii.Error, ValueError):
+                    logger.warning(f"Skipping trip image {row.id}: invalid base64")
+                    skipped += 1
+                    continue
+                await lock_blob(conn, blob_key(data))
+                key, size = await store.put(data)
+                await conn.execute(
+                    update(TripImage)
+                    .where(TripImage.id == row.id)
+                    .values(blob_key=key, size=size, image_data=None)
+                )
+                moved += 1
+            await conn.commit()
+            logger.info(f"Moved {moved} trip images to the blob store")
+    return {"moved": moved, "skipped": skipped}
+
+
+async def release_blob(db: AsyncSession, key: Optional[str], store: Optional[BlobStore] = None) -> bool:
+    """
+    Delete a trip image blob and its previews if no trip image references
+    the key any more (call after the row is deleted, and commit afterwards
+    to release the key's lock). Previews also used as a video archive
+    thumbnail are kept. Returns whether the blob was deleted.
+    """
+    if key is None:
+        return False
+    store = store or blob_store
+    await lock_blob(db, key)
+    references = await db.scalar(select(func.count()).select_from(TripImage).where(TripImage.blob_key == key))
+    if references:
+        return False
+    previews = [preview_key(key, width) for width in thumbnailer.widths]
+    thumbnail = await db.scalar(
+        select(func.count()).select_from(VideoArchive)
+        .where(VideoArchive.thumbnail_url == preview_url(key, thumbnailer.widths[0]))
+    )
+    await store.delete(key, *([] if thumbnail else previews))
+    return True
@@ -0,0 +1,131 @@
+"""
+Compact binary location frames for /ws/tracking.
+
+Clients that request the "taxiwatch.msgpack.v1" WebSocket subprotocol get
+location data as msgpack binary frames instead of JSON text. Control
+messages (subscribed, error) stay JSON text. Each position is an array:
+
+    [vehicle_id, lat_e7, lng_e7, speed_dkmh, heading, timestamp_ms]
+
+where coordinates are degrees * 1e7, speed is km/h * 10 and the timestamp
+is milliseconds since the Unix epoch. Frames are maps with a type key "t":
+
+    {"t": "s", "v": [position, ...]}  snapshot of last known positions
+    {"t": "k", "v": position}         keyframe: absolute position of one vehicle
+    {"t": "d", "v": [vehicle_id, dlat, dlng, speed_dkmh, heading, dts_ms]}
+                                      delta from that vehicle's last keyframe
+    {"t": "b", "v": [position, ...]}  tick batch (absolute positions)
+    {"t": "r", "v": [position, ...]}  replay of missed updates, oldest first
+
+Frames that end at a point of the update stream carry its sequence number
+in "s", which a client passes back as ?since= when it reconnects.
+Snapshot and replay frames also carry the server's epoch in "e", passed
+back as ?epoch= (see ConnectionManager.resume).
+
+Deltas are relative to the vehicle's keyframe, not to the previous delta,
+so a dropped delta loses only that fix. A vehicle gets a new keyframe every
+WS_MSGPACK_KEYFRAME_EVERY updates; a client that has not seen a vehicle's
+current keyframe is sent it just before the delta. Keyframes are never
+dropped from a client's queue.
+"""
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+import msgpack
+
+from ..config import settings
+
+SUBPROTOCOL = "taxiwatch.msgpack.v1"
+
+# Outbound message types, for the queue overflow policy
+KEYFRAME_TYPE = "keyframe"
+DELTA_TYPE = "location_update"
+
+_INT32 = 2**31 - 1
+
+
+def _epoch_ms(value) -> int:
+    """Milliseconds since the epoch of an ISO string or datetime (naive = UTC)."""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return int(value.timestamp() * 1000)
+
+
+def pack_position(data: dict) -> List[int]:
+    """Fixed-point array for a location message's data."""
+    return [
+        data["vehicle_id"],
+        round(data["latitude"] * 1e7),
+        round(data["longitude"] * 1e7),
+        round((data.get("speed") or 0) * 10),
+        round(data.get("heading") or 0),
+        _epoch_ms(data["timestamp"]),
+    ]
+
+
+def pack(frame_type: str, value, seq: Optional[int] = None, epoch: Optional[str] = None) -> bytes:
+    frame = {"t": frame_type, "v": value}
+    if seq is not None:
+        frame["s"] = seq
+    if epoch is not None:
+        frame["e"] = epoch
+    return msgpack.packb(frame)
+
+
+def pack_positions(
+    frame_type: str, items: List[dict], seq: Optional[int] = None, epoch: Optional[str] = None
+) -> bytes:
+    """Snapshot, batch or replay frame of absolute positions."""
+    return pack(frame_type, [pack_position(data) for data in items], seq, epoch)
+
+
+class CompactEncoder:
+    """Per-vehicle keyframes shared by every binary client, and which keyframe each client has."""
+
+    def __init__(self, keyframe_every: Optional[int] = None):
+        self.keyframe_every = keyframe_every or settings.WS_MSGPACK_KEYFRAME_EVERY
+        # vehicle_id -> (generation, keyframe position, packed keyframe, deltas since keyframe)
+        self._keyframes: Dict[int, Tuple[int, List[int], bytes, int]] = {}
+        # client -> vehicle_id -> generation of the keyframe it was sent
+        self._seen: Dict[object, Dict[int, int]] = {}
+
+    def forget(self, client):
+        """Drop the state of a disconnected client."""
+        self._seen.pop(client, None)
+
+    def encode(self, data: dict, seq: Optional[int] = None) -> Tuple[int, bytes, Optional[bytes]]:
+        """
+        Encode an update as (generation, keyframe payload, delta payload).
+
+        The keyframe payload is the vehicle's current base. The delta is None
+        when this update starts a new keyframe, in which case the keyframe
+        payload is the update itself.
+        """
+        position = pack_position(data)
+        vehicle_id = position[0]
+        keyframe = self._keyframes.get(vehicle_id)
+        if keyframe is not None:
+            generation, base, payload, deltas = keyframe
+            delta = [
+                vehicle_id, position[1] - base[1], position[2] - base[2],
+                position[3], position[4], position[5] - base[5],
+            ]
+            if deltas < self.keyframe_every and all(abs(v) <= _INT32 for v in delta[1:]):
+                self._keyframes[vehicle_id] = (generation, base, payload, deltas + 1)
+                return generation, payload, pack("d", delta, seq)
+            generation += 1
+        else:
+            generation = 0
+        payload = pack("k", position, seq)
+        self._keyframes[vehicle_id] = (generation, position, payload, 0)
+        return generation, payload, None
+
+    def needs_keyframe(self, client, vehicle_id: int, generation: int) -> bool:
+        """Whether a client has yet to be sent the vehicle's current keyframe; marks it as sent."""
+        seen = self._seen.setdefault(client, {})
+        if seen.get(vehicle_id) == generation:
+            return False
+        seen[vehicle_id] = generation
+        return True
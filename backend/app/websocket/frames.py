@@ -0,0 +1,234 @@
+"""
+Buffered camera frames and their wire formats.
+
+Each frame keeps the uploaded JPEG bytes as-is. For viewers of the
+"taxiwatch.jpeg.v1" subprotocol it is sent as one binary message: a
+16-byte big-endian header, the route id and trip id as UTF-8, then the
+original JPEG bytes.
+
+    version u8 | route_id length u8 | trip_id length u16 | seq u32 | timestamp ms u64
+
+Other viewers get the legacy JSON message with the JPEG base64 encoded in
+"image". Each format is built on first use and shared by every viewer, as
+are the downscaled previews served to dashboards (see thumbnails.py).
+
+FrameStore keeps the last VIDEO_FRAMES_PER_ROUTE frames of each route.
+Memory is bounded by VIDEO_FRAME_MEMORY_MB across routes, counting each
+frame's cached encodings and previews from when they are built (the
+budget is enforced on the next upload). Over budget, the
+rewind frames of the least recently updated routes go first, then those
+routes entirely. Routes without uploads for VIDEO_ROUTE_TTL_S are
+forgotten; a route that comes back starts again at seq 1.
+"""
+import base64
+import struct
+import time
+from collections import OrderedDict, deque
+from datetime import datetime, timezone
+from typing import Deque, Dict, List, Optional
+
+from ..config import settings
+from .outbound import encode
+
+FRAME_HEADER = struct.Struct(">BBHIQ")
+FRAME_VERSION = 1
+
+
+class VideoFrame:
+    """One uploaded JPEG and its per-format encodings, built on first use."""
+
+    __slots__ = (
+        "route_id", "seq", "jpeg", "timestamp", "trip_id", "_previews", "_base64", "_json", "_binary", "store",
+    )
+
+    def __init__(self, route_id: str, seq: int, jpeg: bytes, timestamp: str, trip_id: Optional[str] = None):
+        self.route_id = route_id
+        self.seq = seq
+        self.jpeg = jpeg
+        self.timestamp = timestamp
+        self.trip_id = trip_id
+        self._previews: Optional[Dict[int, bytes]] = None  # Width -> JPEG, once rendered
+        self._base64: Optional[str] = None
+        self._json: Optional[str] = None
+        self._binary: Optional[bytes] = None
+        self.store: Optional["FrameStore"] = None  # Charged for the cached encodings while it holds the frame
+
+    @property
+    def nbytes(self) -> int:
+        """Size of the JPEG plus every cached encoding and preview."""
+        size = len(self.jpeg)
+        for cached in (self._base64, self._json, self._binary):
+            if cached is not None:
+                size += len(cached)
+        if self._previews:
+            size += sum(len(preview) for preview in self._previews.values())
+        return size
+
+    def _cached(self, size: int):
+        if self.store is not None:
+            self.store.bytes += size
+
+    @property
+    def previews(self) -> Optional[Dict[int, bytes]]:
+        return self._previews
+
+    @previews.setter
+    def previews(self, previews: Optional[Dict[int, bytes]]):
+        old = sum(len(p) for p in self._previews.values()) if self._previews else 0
+        self._previews = previews
+        self._cached((sum(len(p) for p in previews.values()) if previews else 0) - old)
+
+    @property
+    def image_base64(self) -> str:
+        if self._base64 is None:
+            self._base64 = base64.b64encode(self.jpeg).decode("ascii")
+            self._cached(len(self._base64))
+        return self._base64
+
+    def as_dict(self, width: Optional[int] = None) -> dict:
+        """Legacy JSON frame message, with the preview of the given width if rendered."""
+        preview = self.previews.get(width) if width and self.previews else None
+        return {
+            "type": "frame",
+            "route_id": self.route_id,
+            "seq": self.seq,
+            "image": self.image_base64 if preview is None else base64.b64encode(preview).decode("ascii"),
+            "timestamp": self.timestamp,
+            "size": len(self.jpeg if preview is None else preview),
+            "trip_id": self.trip_id,
+        }
+
+    def json_payload(self) -> str:
+        if self._json is None:
+            self._json = encode(self.as_dict())
+            self._cached(len(self._json))
+        return self._json
+
+    def binary_payload(self) -> bytes:
+        if self._binary is None:
+            route = self.route_id.encode()[:255]
+            trip = (self.trip_id or "").encode()[:65535]
+            moment = datetime.fromisoformat(self.timestamp)
+            if moment.tzinfo is None:
+                moment = moment.replace(tzinfo=timezone.utc)
+            header = FRAME_HEADER.pack(
+                FRAME_VERSION, len(route), len(trip), self.seq & 0xFFFFFFFF, int(moment.timestamp() * 1000)
+            )
+            self._binary = b"".join((header, route, trip, self.jpeg))
+            self._cached(len(self._binary))
+        return self._binary
+
+
+class RouteFrames:
+    """Ring buffer of one route's recent frames."""
+
+    __slots__ = ("frames", "next_seq", "updated_at")
+
+    def __init__(self, size: int):
+        self.frames: Deque[VideoFrame] = deque(maxlen=size)
+        self.next_seq = 1
+        self.updated_at = 0.0
+
+
+class FrameStore:
+    """Recent frames per route, bounded in count per route, total bytes and idle time."""
+
+    def __init__(
+        self,
+        frames_per_route: Optional[int] = None,
+        memory_bytes: Optional[int] = None,
+        ttl_seconds: Optional[float] = None,
+    ):
+        self.frames_per_route = frames_per_route or settings.VIDEO_FRAMES_PER_ROUTE
+        self.memory_bytes = memory_bytes or settings.VIDEO_FRAME_MEMORY_MB * 1024 * 1024
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else settings.VIDEO_ROUTE_TTL_S
+        # Least recently updated first
+        self.routes: "OrderedDict[str, RouteFrames]" = OrderedDict()
+        self.bytes = 0
+        self.evicted = 0  # Frames dropped to stay within the memory budget
+        self.expired = 0  # Routes forgotten after ttl_seconds without uploads
+
+    def append(self, route_id: str, jpeg: bytes, timestamp: str, trip_id: Optional[str] = None) -> VideoFrame:
+        """Store a new frame of a route, numbered after the previous one."""
+        now = time.monotonic()
+        self.expire(now)
+        route = self.routes.get(route_id)
+        if route is None:
+            route = self.routes[route_id] = RouteFrames(self.frames_per_route)
+        self.routes.move_to_end(route_id)
+        route.updated_at = now
+
+        frame = VideoFrame(route_id, route.next_seq, jpeg, timestamp, trip_id)
+        frame.store = self
+        route.next_seq += 1
+        if len(route.frames) == route.frames.maxlen:
+            self._release(route.frames[0])
+        route.frames.append(frame)
+        self.bytes += len(jpeg)
+        self._enforce_budget(route_id)
+        return frame
+
+    def latest(self, route_id: str) -> Optional[VideoFrame]:
+        """Newest frame of a route, if it has a live one."""
+        frames = self.recent(route_id, 1)
+        return frames[0] if frames else None
+
+    def recent(self, route_id: str, count: int) -> List[VideoFrame]:
+        """Up to count newest frames of a route, oldest first."""
+        self.expire()
+        route = self.routes.get(route_id)
+        if route is None or count <= 0:
+            return []
+        return list(route.frames)[-count:]
+
+    def route_ids(self) -> List[str]:
+        """Routes with buffered frames, most recently updated first."""
+        self.expire()
+        return list(reversed(self.routes))
+
+    def expire(self, now: Optional[float] = None):
+        """Forget routes that have not uploaded within the TTL."""
+        if not self.ttl_seconds:
+            return
+        cutoff = (now if now is not None else time.monotonic()) - self.ttl_seconds
+        while self.routes:
+            route_id, route = next(iter(self.routes.items()))
+            if route.updated_at >= cutoff:
+                break
+            self._remove(route_id)
+            self.expired += 1
+
+    def _enforce_budget(self, current: str):
+        """Drop rewind frames of idle routes first, then whole routes, keeping the current one."""
+        for route in self.routes.values():
+            while self.bytes > self.memory_bytes and len(route.frames) > 1:
+                self._release(route.frames.popleft())
+                self.evicted += 1
+            if self.bytes <= self.memory_bytes:
+                return
+        for route_id in list(self.routes):
+            if self.bytes <= self.memory_bytes:
+                return
+            if route_id != current:
+                self.evicted += len(self.routes[route_id].frames)
+                self._remove(route_id)
+
+    def _remove(self, route_id: str):
+        route = self.routes.pop(route_id)
+        for frame in route.frames:
+            self._release(frame)
+
+    def _release(self, frame: VideoFrame):
+        """Stop counting a frame that leaves the store (viewers may still be sending it)."""
+        self.bytes -= frame.nbytes
+        frame.store = None
+
+    def stats(self) -> dict:
+        return {
+            "routes": len(self.routes),
+            "frames": sum(len(route.frames) for route in self.routes.values()),
+            "bytes": self.bytes,
+            "memory_budget": self.memory_bytes,
+            "evicted": self.evicted,
+            "expired_routes": self.expired,
+        }
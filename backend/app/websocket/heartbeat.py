@@ -0,0 +1,117 @@
+"""
+Liveness and admission control for WebSocket connections.
+
+A half-open TCP connection never raises on send until the kernel buffer
+fills, so dead clients would stay in every fan-out set. The heartbeat task
+sends {"type": "ping"} to clients silent for WS_PING_INTERVAL_S and closes
+those that stay silent for WS_PING_TIMEOUT_S more; any message from the
+client, usually {"type": "pong"}, counts as a sign of life.
+
+ConnectionLimits caps open connections across all endpoints, in total and
+per client address, before the handshake is accepted.
+"""
+import asyncio
+import logging
+from typing import Dict, List, Optional
+
+from fastapi import WebSocket
+
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def client_address(websocket: WebSocket) -> str:
+    """Peer address of a connection (the proxy's, unless uvicorn runs with --proxy-headers)."""
+    client = getattr(websocket, "client", None)
+    return client.host if client else "unknown"
+
+
+class ConnectionLimits:
+    """Counts open WebSocket connections, in total and per client address."""
+
+    def __init__(self):
+        self.addresses: Dict[WebSocket, str] = {}
+        self.per_address: Dict[str, int] = {}
+        self.rejected = 0
+
+    def acquire(self, websocket: WebSocket) -> bool:
+        """Reserve a slot for a connection; False if a cap is reached."""
+        if websocket in self.addresses:
+            return True
+        address = client_address(websocket)
+        if (
+            settings.WS_MAX_CONNECTIONS and len(self.addresses) >= settings.WS_MAX_CONNECTIONS
+            or settings.WS_MAX_CONNECTIONS_PER_IP
+            and self.per_address.get(address, 0) >= settings.WS_MAX_CONNECTIONS_PER_IP
+        ):
+            self.rejected += 1
+            logger.warning(f"Rejecting WebSocket from {address}: connection limit reached")
+            return False
+        self.addresses[websocket] = address
+        self.per_address[address] = self.per_address.get(address, 0) + 1
+        return True
+
+    def release(self, websocket: WebSocket):
+        """Free the slot of a closed connection (idempotent)."""
+        address = self.addresses.pop(websocket, None)
+        if address is None:
+            return
+        self.per_address[address] -= 1
+        if not self.per_address[address]:
+            del self.per_address[address]
+
+    def stats(self) -> dict:
+        busiest = sorted(self.per_address.items(), key=lambda item: item[1], reverse=True)[:10]
+        return {
+            "connections": len(self.addresses),
+            "max_connections": settings.WS_MAX_CONNECTIONS,
+            "max_connections_per_ip": settings.WS_MAX_CONNECTIONS_PER_IP,
+            "addresses": len(self.per_address),
+            "busiest_addresses": dict(busiest),
+            "rejected": self.rejected,
+        }
+
+
+class Heartbeat:
+    """Periodically pings idle connections of the given channel groups and reaps dead ones."""
+
+    def __init__(self):
+        self.groups: List = []
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self, groups: List):
+        if self._task is not None:
+            return
+        self.groups = list(groups)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def beat(self):
+        """Ping and reap every group once."""
+        interval, timeout = settings.WS_PING_INTERVAL_S, settings.WS_PING_TIMEOUT_S
+        for group in self.groups:
+            group.heartbeat(interval, timeout)
+
+    async def _run(self):
+        period = min(settings.WS_PING_INTERVAL_S, settings.WS_PING_TIMEOUT_S) / 2
+        while True:
+            await asyncio.sleep(period)
+            try:
+                self.beat()
+            except Exception as e:
+                logger.error(f"WebSocket heartbeat error: {e}")
+
+
+# Global instances
+connection_limits = ConnectionLimits()
+heartbeat = Heartbeat()
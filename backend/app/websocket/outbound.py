@@ -0,0 +1,257 @@
+"""
+Bounded outbound queues for WebSocket clients.
+
+Producers never write to a socket: they put an encoded message on the
+client's queue and return. A writer task per connection drains the queue,
+so a client on a slow network only ever delays itself.
+
+When a queue is full, message types listed in WS_DROP_OLDEST_TYPES
+(location updates, video frames) evict the oldest droppable message, since
+a newer one supersedes it. Every other type (trip events, snapshots) is
+never dropped: if no droppable message can make room, the client is too
+far behind to be useful and is disconnected instead.
+
+Channels also track when the client last sent anything, for the heartbeat
+(see heartbeat.py), and hold the connection's slot under the connection
+limits until they are closed.
+"""
+import asyncio
+import json
+import logging
+from collections import deque
+from typing import Callable, Deque, Dict, Iterable, Optional, Tuple, Union
+
+from fastapi import WebSocket
+
+from ..config import settings
+from .heartbeat import connection_limits
+
+logger = logging.getLogger(__name__)
+
+Payload = Union[str, bytes]
+
+
+def encode(message: dict) -> str:
+    """Serialize a message once for every recipient."""
+    return json.dumps(message, separators=(",", ":"))
+
+
+def is_droppable(message_type: str) -> bool:
+    """Whether a queued message of this type may be replaced by newer ones."""
+    return message_type in settings.ws_drop_oldest_types
+
+
+PING = encode({"type": "ping"})
+
+
+def is_pong(text: str) -> bool:
+    """Whether a client message is a heartbeat reply."""
+    if '"pong"' not in text:
+        return False
+    try:
+        return json.loads(text).get("type") == "pong"
+    except (ValueError, AttributeError):
+        return False
+
+
+class ClientChannel:
+    """Outbound queue and writer task of one WebSocket connection."""
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        max_size: int,
+        on_close: Optional[Callable[[WebSocket], None]] = None,
+    ):
+        self.websocket = websocket
+        self.max_size = max_size
+        self.on_close = on_close
+        self.queue: Deque[Tuple[Payload, bool]] = deque()
+        self.sent = 0
+        self.dropped = 0
+        self.closed = False
+        self.last_seen = asyncio.get_running_loop().time()
+        self.pinged_at: Optional[float] = None
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._writer())
+
+    def put(self, payload: Payload, droppable: bool) -> bool:
+        """Queue a payload; returns False if it was dropped or the client was closed."""
+        if self.closed:
+            return False
+        if len(self.queue) >= self.max_size and not self._make_room():
+            if droppable:
+                self.dropped += 1
+                return False
+            logger.warning("Closing WebSocket client: outbound queue full of undroppable messages")
+            self.close(code=1013)
+            return False
+        self.queue.append((payload, droppable))
+        self._wakeup.set()
+        return True
+
+    def _make_room(self) -> bool:
+        """Evict the oldest droppable message, if any."""
+        for i, (_, queued_droppable) in enumerate(self.queue):
+            if queued_droppable:
+                del self.queue[i]
+                self.dropped += 1
+                return True
+        return False
+
+    async def _writer(self):
+        try:
+            while True:
+                while not self.queue:
+                    self._wakeup.clear()
+                    await self._wakeup.wait()
+                payload, _ = self.queue.popleft()
+                if isinstance(payload, bytes):
+                    send = self.websocket.send_bytes(payload)
+                else:
+                    send = self.websocket.send_text(payload)
+                await asyncio.wait_for(send, settings.WS_SEND_TIMEOUT_MS / 1000)
+                self.sent += 1
+        except asyncio.CancelledError:
+            return
+        except asyncio.TimeoutError:
+            logger.warning("Closing WebSocket client: send timed out")
+            self.close(code=1013)
+        except Exception as e:
+            logger.info(f"WebSocket writer stopped: {e}")
+            self.close()
+
+    def close(self, code: Optional[int] = None):
+        """Stop the writer and notify the owner; closes the socket when a code is given."""
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.clear()
+        if self._task is not None and self._task is not asyncio.current_task():
+            self._task.cancel()
+        if code is not None:
+            asyncio.create_task(self._close_socket(code))
+        if self.on_close is not None:
+            self.on_close(self.websocket)
+
+    async def _close_socket(self, code: int):
+        """Close the socket so the client reconnects instead of waiting on a dead stream."""
+        try:
+            await asyncio.wait_for(self.websocket.close(code=code), settings.WS_SEND_TIMEOUT_MS / 1000)
+        except Exception:
+            pass
+
+
+class ChannelGroup:
+    """Outbound channels of one manager's connections, with aggregated counters."""
+
+    def __init__(self, max_size: Optional[int] = None):
+        self.max_size = max_size
+        self.channels: Dict[WebSocket, ClientChannel] = {}
+        self._dropped_closed = 0  # Drops counted by channels that are gone
+        self._sent_closed = 0
+        self.reaped = 0
+
+    async def admit(self, websocket: WebSocket, subprotocol: Optional[str] = None) -> bool:
+        """
+        Reserve a connection slot and accept the handshake. False if no slot
+        is left (the handshake is rejected) or the client went away while
+        being accepted (the slot is released again).
+        """
+        if not connection_limits.acquire(websocket):
+            await websocket.close(code=1013)
+            return False
+        try:
+            await websocket.accept(subprotocol=subprotocol)
+        except Exception as e:
+            connection_limits.release(websocket)
+            logger.info(f"WebSocket handshake failed: {e}")
+            return False
+        return True
+
+    def open(
+        self,
+        websocket: WebSocket,
+        on_close: Optional[Callable[[WebSocket], None]] = None,
+    ) -> ClientChannel:
+        """Create and start the channel of a newly accepted connection."""
+        self.close(websocket)
+        channel = ClientChannel(websocket, self.max_size or settings.WS_QUEUE_MAX_SIZE, on_close)
+        self.channels[websocket] = channel
+        channel.start()
+        return channel
+
+    def close(self, websocket: WebSocket, code: Optional[int] = None):
+        """Stop and forget the channel of a connection."""
+        connection_limits.release(websocket)
+        channel = self.channels.pop(websocket, None)
+        if channel is not None:
+            self._dropped_closed += channel.dropped
+            self._sent_closed += channel.sent
+            channel.on_close = None  # The owner is already removing it
+            channel.close(code)
+
+    def send(self, websocket: WebSocket, payload: Payload, message_type: str) -> bool:
+        """Queue an encoded payload for one connection."""
+        channel = self.channels.get(websocket)
+        return channel.put(payload, is_droppable(message_type)) if channel is not None else False
+
+    def broadcast(self, websockets: Iterable[WebSocket], payload: Payload, message_type: str) -> int:
+        """Queue one encoded payload for many connections; returns how many accepted it."""
+        droppable = is_droppable(message_type)
+        queued = 0
+        for websocket in list(websockets):
+            channel = self.channels.get(websocket)
+            if channel is not None and channel.put(payload, droppable):
+                queued += 1
+        return queued
+
+    def send_json(self, websocket: WebSocket, message: dict) -> bool:
+        """Encode and queue a message for one connection."""
+        return self.send(websocket, encode(message), message.get("type", ""))
+
+    async def receive_text(self, websocket: WebSocket) -> str:
+        """Wait for the next client message, recording it as a sign of life and skipping pongs."""
+        while True:
+            text = await websocket.receive_text()
+            channel = self.channels.get(websocket)
+            if channel is not None:
+                channel.last_seen = asyncio.get_running_loop().time()
+            if not is_pong(text):
+                return text
+
+    async def drain(self, websocket: WebSocket):
+        """Read and discard client messages until it disconnects (keeps pongs flowing)."""
+        try:
+            while True:
+                await self.receive_text(websocket)
+        except Exception:
+            return
+
+    def heartbeat(self, interval: float, timeout: float):
+        """Ping clients silent for interval seconds; close those silent for interval + timeout."""
+        now = asyncio.get_running_loop().time()
+        for channel in list(self.channels.values()):
+            idle = now - channel.last_seen
+            if idle >= interval + timeout:
+                logger.info("Closing WebSocket client: no reply to ping")
+                self.reaped += 1
+                channel.close(code=1001)
+            elif idle >= interval and (channel.pinged_at is None or channel.pinged_at < channel.last_seen):
+                channel.pinged_at = now
+                channel.put(PING, droppable=False)
+
+    def stats(self) -> dict:
+        """Connection count, queue depths and sent/dropped counters."""
+        depths = [len(channel.queue) for channel in self.channels.values()]
+        return {
+            "connections": len(self.channels),
+            "queued": sum(depths),
+            "max_queue_depth": max(depths, default=0),
+            "sent": self._sent_closed + sum(c.sent for c in self.channels.values()),
+            "dropped": self._dropped_closed + sum(c.dropped for c in self.channels.values()),
+            "reaped": self.reaped,
+        }
@@ -1,76 +1,366 @@
 """
 WebSocket consumer for real-time GPS tracking.
+
+Clients receive every location update until they subscribe. A subscribe
+message narrows the stream to a set of vehicle IDs and/or a map bounding
+box (see TrackingSubscription); updates are then routed through the
+vehicle subscriber map and a grid index of viewports, so each update is
+only encoded for and queued on the clients that want it.
+
+A client may connect with ?tick_ms=N to receive, every N ms, one
+"location_batch" frame holding the newest position of each vehicle that
+moved since the previous tick, instead of one frame per fix. Clients
+requesting the msgpack subprotocol get location data as compact binary
+frames (see compact.py).
+
+Every location update gets a sequence number and is kept in a short
+replay buffer. Clients get a snapshot of last known positions on connect;
+one that reconnects with ?since=<seq>&epoch=<epoch> instead gets only the
+updates it missed, or a snapshot if they are no longer buffered.
+Sequence numbers are counted per process, so snapshot and replay messages
+carry the process's random epoch; a client resuming on another worker, or
+after a restart, passes a different epoch and gets a snapshot.
+
+Updates are published through the broker, so clients connected to any
+worker receive fixes ingested by every other worker.
 """
 from fastapi import WebSocket, WebSocketDisconnect
-from typing import Dict, Set
-import json
+from pydantic import ValidationError
+from datetime import datetime
+from collections import deque
+from typing import Deque, Dict, List, Optional, Set, Tuple
 import asyncio
 import logging
+import secrets
+
+from ..config import settings
+from ..schemas.tracking import TrackingSubscription
+from ..services.broker import TRACKING_CHANNEL, broker
+from ..services.position_registry import Position, position_registry
+from ..services.spatial_index import BBox, BoxIndex
+from .compact import (
+    DELTA_TYPE, KEYFRAME_TYPE, SUBPROTOCOL, CompactEncoder, pack_positions
+)
+from .outbound import ChannelGroup, encode
 
 logger = logging.getLogger(__name__)
 
 
+class TickGroup:
+    """Clients sharing a tick interval and the updates coalesced since the last tick."""
+
+    def __init__(self, interval_ms: int):
+        self.interval_ms = interval_ms
+        self.members: Set[WebSocket] = set()
+        # Newest update per vehicle, for the unfiltered members (encoded once per tick)
+        self.shared: Dict[int, dict] = {}
+        # Newest update per vehicle, per filtered member
+        self.pending: Dict[WebSocket, Dict[int, dict]] = {}
+        self.task: Optional[asyncio.Task] = None
+
+
 class ConnectionManager:
     """Manages WebSocket connections for tracking updates."""
 
     def __init__(self):
         # Store active connections
         self.active_connections: Set[WebSocket] = set()
-        # Store connections by vehicle_id
+        # Connections without a subscription receive every update
+        self.unfiltered: Set[WebSocket] = set()
+        # Store connections by vehicle_id, and vehicle_ids by connection
         self.vehicle_subscribers: Dict[int, Set[WebSocket]] = {}
+        self.subscribed_vehicles: Dict[WebSocket, Set[int]] = {}
+        # Map viewports by connection
+        self.viewports = BoxIndex(cell_size_deg=settings.WS_VIEWPORT_CELL_DEG)
+        # Viewport connections that last saw each vehicle inside their box
+        self.viewport_members: Dict[int, Set[WebSocket]] = {}
+        # Tick interval of clients receiving coalesced batches, and their groups
+        self.tick_intervals: Dict[WebSocket, int] = {}
+        self.tick_groups: Dict[int, TickGroup] = {}
+        # Clients receiving msgpack location frames, and their keyframe state
+        self.binary: Set[WebSocket] = set()
+        self.compact = CompactEncoder()
+        # Sequence number of the newest location update, and the recent updates.
+        # Numbers are only meaningful together with the epoch of this process.
+        self.epoch = secrets.token_hex(4)
+        self.seq = 0
+        self.replay: Deque[Tuple[int, dict]] = deque(maxlen=settings.WS_REPLAY_BUFFER_SIZE)
+        # Outbound queue and writer task per connection
+        self.outbound = ChannelGroup()
 
-    async def connect(self, websocket: WebSocket):
-        """Accept new WebSocket connection."""
-        await websocket.accept()
-        self.active_connections.add(websocket)
+    async def connect(self, websocket: WebSocket, tick_ms: int = 0) -> bool:
+        """Accept new WebSocket connection, with the msgpack subprotocol if requested."""
+        binary = SUBPROTOCOL in websocket.scope.get("subprotocols", ())
+        if not await self.outbound.admit(websocket, SUBPROTOCOL if binary else None):
+            return False
+        self.register(websocket, tick_ms, binary)
         logger.info(f"New WebSocket connection. Total: {len(self.active_connections)}")
+        return True
+
+    def register(self, websocket: WebSocket, tick_ms: int = 0, binary: bool = False):
+        """Start delivering updates to an accepted connection, per fix or every tick_ms."""
+        self.active_connections.add(websocket)
+        self.unfiltered.add(websocket)
+        if binary:
+            self.binary.add(websocket)
+        self.outbound.open(websocket, on_close=self.disconnect)
+        if tick_ms > 0:
+            self._join_tick_group(websocket, max(tick_ms, settings.WS_TICK_MIN_MS))
 
     def disconnect(self, websocket: WebSocket):
         """Remove WebSocket connection."""
+        if websocket not in self.active_connections:
+            return
         self.active_connections.discard(websocket)
-        # Remove from vehicle subscriptions
-        for vehicle_id, subscribers in list(self.vehicle_subscribers.items()):
-            subscribers.discard(websocket)
-            if not subscribers:
-                del self.vehicle_subscribers[vehicle_id]
+        self.outbound.close(websocket)
+        self._clear_subscription(websocket)
+        self.unfiltered.discard(websocket)
+        self._leave_tick_group(websocket)
+        self.binary.discard(websocket)
+        self.compact.forget(websocket)
         logger.info(f"WebSocket disconnected. Total: {len(self.active_connections)}")
 
-    async def broadcast(self, message: dict):
-        """Broadcast message to all connected clients."""
-        disconnected = set()
-        for connection in self.active_connections:
-            try:
-                await connection.send_json(message)
-            except Exception as e:
-                logger.error(f"Error sending to client: {e}")
-                disconnected.add(connection)
+    def send_snapshot(self, websocket: WebSocket):
+        """Queue the last known position of every vehicle the client follows."""
+        positions = [p for p in position_registry.snapshot() if self._follows(websocket, p)]
+        data = [position.to_message() for position in positions]
+        if websocket in self.binary:
+            self.outbound.send(websocket, pack_positions("s", data, self.seq, self.epoch), "snapshot")
+        else:
+            self.outbound.send_json(websocket, {
+                "type": "snapshot", "seq": self.seq, "epoch": self.epoch, "data": data,
+            })
+
+    def resume(self, websocket: WebSocket, since: Optional[int] = None, epoch: Optional[str] = None):
+        """
+        Bring a new connection up to date: the updates after sequence number
+        since if it was counted by this process (same epoch) and they are all
+        still buffered, otherwise a full snapshot.
+        """
+        oldest = self.replay[0][0] if self.replay else self.seq + 1
+        if since is None or epoch != self.epoch or not oldest - 1 <= since <= self.seq:
+            self.send_snapshot(websocket)
+            return
+        data = [update for seq, update in self.replay if seq > since]
+        if websocket in self.binary:
+            self.outbound.send(websocket, pack_positions("r", data, self.seq, self.epoch), "replay")
+        else:
+            self.outbound.send_json(websocket, {
+                "type": "replay", "seq": self.seq, "epoch": self.epoch, "data": data,
+            })
 
-        # Clean up disconnected clients
-        for conn in disconnected:
-            self.disconnect(conn)
+    def broadcast(self, message: dict):
+        """
+        Queue a message for all connected clients.
 
-    async def send_to_vehicle_subscribers(self, vehicle_id: int, message: dict):
-        """Send message to clients subscribed to specific vehicle."""
-        if vehicle_id not in self.vehicle_subscribers:
+        The message is serialized once; each client's writer task sends it, so
+        a slow client never delays the caller or the other clients.
+        """
+        self.outbound.broadcast(self.active_connections, encode(message), message["type"])
+
+    def publish_location(self, message: dict):
+        """Queue a location update for the clients following its vehicle or area."""
+        self.seq += 1
+        message = {**message, "seq": self.seq}
+        data = message["data"]
+        self.replay.append((self.seq, data))
+        vehicle_id = data["vehicle_id"]
+        if len(self.unfiltered) == len(self.active_connections):
+            recipients = self.unfiltered
+        else:
+            recipients = self.unfiltered | self.vehicle_subscribers.get(vehicle_id, set())
+            inside = self.viewports.containing(data["latitude"], data["longitude"])
+            # Clients it just left get one last update, so the marker leaves their map
+            recipients |= inside | self.viewport_members.pop(vehicle_id, set())
+            if inside:
+                self.viewport_members[vehicle_id] = inside
+
+        if self.tick_intervals:
+            # Ticking clients get the update with their next batch instead
+            for group in self.tick_groups.values():
+                group.shared[vehicle_id] = data
+            immediate: List[WebSocket] = []
+            for websocket in recipients:
+                interval = self.tick_intervals.get(websocket)
+                if interval is None:
+                    immediate.append(websocket)
+                elif websocket not in self.unfiltered:
+                    self.tick_groups[interval].pending.setdefault(websocket, {})[vehicle_id] = data
+            recipients = immediate
+
+        if self.binary:
+            text_recipients = []
+            generation, keyframe, delta = self.compact.encode(data, self.seq)
+            for websocket in recipients:
+                if websocket not in self.binary:
+                    text_recipients.append(websocket)
+                    continue
+                if self.compact.needs_keyframe(websocket, vehicle_id, generation):
+                    self.outbound.send(websocket, keyframe, KEYFRAME_TYPE)
+                if delta is not None:
+                    self.outbound.send(websocket, delta, DELTA_TYPE)
+            recipients = text_recipients
+        self.outbound.broadcast(recipients, encode(message), message["type"])
+
+    def _join_tick_group(self, websocket: WebSocket, interval_ms: int):
+        self.tick_intervals[websocket] = interval_ms
+        group = self.tick_groups.get(interval_ms)
+        if group is None:
+            group = self.tick_groups[interval_ms] = TickGroup(interval_ms)
+            group.task = asyncio.create_task(self._run_ticks(group))
+        group.members.add(websocket)
+
+    def _leave_tick_group(self, websocket: WebSocket):
+        interval_ms = self.tick_intervals.pop(websocket, None)
+        group = self.tick_groups.get(interval_ms)
+        if group is None:
             return
+        group.members.discard(websocket)
+        group.pending.pop(websocket, None)
+        if not group.members:
+            group.task.cancel()
+            del self.tick_groups[interval_ms]
 
-        disconnected = set()
-        for connection in self.vehicle_subscribers[vehicle_id]:
+    async def _run_ticks(self, group: TickGroup):
+        while True:
+            await asyncio.sleep(group.interval_ms / 1000)
             try:
-                await connection.send_json(message)
+                self.flush_tick(group)
             except Exception as e:
-                logger.error(f"Error sending to subscriber: {e}")
-                disconnected.add(connection)
+                logger.error(f"Error flushing {group.interval_ms} ms location batch: {e}")
+
+    def flush_tick(self, group: TickGroup):
+        """Send each member of a tick group one batch of the updates coalesced since the last tick."""
+        shared, group.shared = group.shared, {}
+        pending, group.pending = group.pending, {}
+        if shared:
+            unfiltered = [websocket for websocket in group.members if websocket in self.unfiltered]
+            text = [websocket for websocket in unfiltered if websocket not in self.binary]
+            binary = [websocket for websocket in unfiltered if websocket in self.binary]
+            if text:
+                payload = encode({"type": "location_batch", "seq": self.seq, "data": list(shared.values())})
+                self.outbound.broadcast(text, payload, "location_batch")
+            if binary:
+                payload = pack_positions("b", list(shared.values()), self.seq)
+                self.outbound.broadcast(binary, payload, "location_batch")
+        for websocket, updates in pending.items():
+            if websocket in self.binary:
+                self.outbound.send(websocket, pack_positions("b", list(updates.values()), self.seq), "location_batch")
+            else:
+                self.outbound.send_json(websocket, {
+                    "type": "location_batch", "seq": self.seq, "data": list(updates.values()),
+                })
 
-        # Clean up disconnected clients
-        for conn in disconnected:
-            self.disconnect(conn)
+    def send_to_vehicle_subscribers(self, vehicle_id: int, message: dict):
+        """Queue a message for clients subscribed to specific vehicle."""
+        if vehicle_id not in self.vehicle_subscribers:
+            return
+        self.outbound.broadcast(self.vehicle_subscribers[vehicle_id], encode(message), message["type"])
 
     def subscribe_to_vehicle(self, websocket: WebSocket, vehicle_id: int):
         """Subscribe a WebSocket to updates for a specific vehicle."""
         if vehicle_id not in self.vehicle_subscribers:
             self.vehicle_subscribers[vehicle_id] = set()
         self.vehicle_subscribers[vehicle_id].add(websocket)
+        self.subscribed_vehicles.setdefault(websocket, set()).add(vehicle_id)
+        self.unfiltered.discard(websocket)
+
+    def unsubscribe_from_vehicle(self, websocket: WebSocket, vehicle_id: int):
+        """Stop updates for a specific vehicle."""
+        subscribers = self.vehicle_subscribers.get(vehicle_id)
+        if subscribers is not None:
+            subscribers.discard(websocket)
+            if not subscribers:
+                del self.vehicle_subscribers[vehicle_id]
+        vehicles = self.subscribed_vehicles.get(websocket)
+        if vehicles is not None:
+            vehicles.discard(vehicle_id)
+            if not vehicles:
+                del self.subscribed_vehicles[websocket]
+
+    def set_viewport(self, websocket: WebSocket, bbox: Optional[BBox]):
+        """Replace (or with None, clear) the map viewport of a WebSocket."""
+        self._clear_viewport(websocket)
+        if bbox is None:
+            return
+        self.viewports.upsert(websocket, bbox)
+        self.unfiltered.discard(websocket)
+        min_lat, min_lng, max_lat, max_lng = bbox
+        for position in position_registry.snapshot():
+            if min_lat <= position.latitude <= max_lat and min_lng <= position.longitude <= max_lng:
+                self.viewport_members.setdefault(position.vehicle_id, set()).add(websocket)
+
+    def handle_message(self, websocket: WebSocket, text: str):
+        """Apply a subscribe/unsubscribe message and confirm it with a filtered snapshot."""
+        try:
+            request = TrackingSubscription.model_validate_json(text)
+        except ValidationError as e:
+            self.outbound.send_json(websocket, {
+                "type": "error",
+                "detail": e.errors(include_url=False, include_context=False, include_input=False),
+            })
+            return
+
+        if request.action == "subscribe":
+            for vehicle_id in request.vehicle_ids or ():
+                self.subscribe_to_vehicle(websocket, vehicle_id)
+            if "bbox" in request.model_fields_set:
+                self.set_viewport(websocket, request.bbox.as_tuple() if request.bbox else None)
+        elif request.vehicle_ids:
+            for vehicle_id in request.vehicle_ids:
+                self.unsubscribe_from_vehicle(websocket, vehicle_id)
+        else:
+            self._clear_subscription(websocket)
+
+        if websocket not in self.subscribed_vehicles and websocket not in self.viewports:
+            self.unfiltered.add(websocket)
+
+        bbox = self.viewports.get(websocket)
+        self.outbound.send_json(websocket, {
+            "type": "subscribed",
+            "vehicle_ids": sorted(self.subscribed_vehicles.get(websocket, ())),
+            "bbox": dict(zip(("min_lat", "min_lng", "max_lat", "max_lng"), bbox)) if bbox else None,
+        })
+        self.send_snapshot(websocket)
+
+    def _follows(self, websocket: WebSocket, position: Position) -> bool:
+        """Whether a client receives updates for a position."""
+        if websocket in self.unfiltered:
+            return True
+        if position.vehicle_id in self.subscribed_vehicles.get(websocket, ()):
+            return True
+        bbox = self.viewports.get(websocket)
+        return bbox is not None and (
+            bbox[0] <= position.latitude <= bbox[2] and bbox[1] <= position.longitude <= bbox[3]
+        )
+
+    def _clear_viewport(self, websocket: WebSocket):
+        if websocket not in self.viewports:
+            return
+        self.viewports.remove(websocket)
+        for vehicle_id, members in list(self.viewport_members.items()):
+            members.discard(websocket)
+            if not members:
+                del self.viewport_members[vehicle_id]
+
+    def _clear_subscription(self, websocket: WebSocket):
+        for vehicle_id in list(self.subscribed_vehicles.get(websocket, ())):
+            self.unsubscribe_from_vehicle(websocket, vehicle_id)
+        self._clear_viewport(websocket)
+
+    def get_stats(self) -> dict:
+        """Get connection, subscription and outbound queue statistics."""
+        return {
+            "unfiltered": len(self.unfiltered),
+            "vehicle_subscriptions": len(self.subscribed_vehicles),
+            "viewports": len(self.viewports),
+            "binary": len(self.binary),
+            "epoch": self.epoch,
+            "seq": self.seq,
+            "replay_buffered": len(self.replay),
+            "tick_groups": {interval: len(g.members) for interval, g in self.tick_groups.items()},
+            **self.outbound.stats(),
+        }
 
 
 # Global connection manager instance
@@ -79,11 +369,24 @@ tracking_manager = ConnectionManager()
 
 async def broadcast_location_update(location_data: dict):
     """
-    Broadcast GPS location update to all connected clients.
+    Send a GPS location update to the clients following its vehicle or area.
     Called when new GPS data is received.
     """
     message = {
         "type": "location_update",
         "data": location_data
     }
-    await tracking_manager.broadcast(message)
+    await broker.publish(TRACKING_CHANNEL, message)
+
+
+def deliver_location_update(message: dict):
+    """Broker handler: record a fix from any worker and route it to this worker's clients."""
+    data = message["data"]
+    timestamp = datetime.fromisoformat(data["timestamp"])
+    current = position_registry.get(data["vehicle_id"])
+    if current is None or current.timestamp < timestamp:
+        position_registry.update({**data, "timestamp": timestamp}, data.get("id"))
+    tracking_manager.publish_location(message)
+
+
+broker.subscribe(TRACKING_CHANNEL, deliver_location_update)
@@ -1,13 +1,19 @@
 """
 WebSocket manager for real-time trip notifications.
 Broadcasts trip updates to drivers and customers.
+
+Trip events are published through the broker and delivered by every
+worker to the drivers and customers connected to it.
 """
 
 from fastapi import WebSocket
-from typing import Dict, Set
+from typing import Dict, Optional, Set
 import json
 import logging
 
+from ..services.broker import TRIPS_CHANNEL, broker
+from .outbound import ChannelGroup, encode
+
 logger = logging.getLogger(__name__)
 
 
@@ -28,30 +34,53 @@ class TripConnectionManager:
         # Trip subscriptions (who is watching which trip)
         self.trip_watchers: Dict[int, Set[WebSocket]] = {}  # trip_id -> set of websockets
 
-    async def connect_driver(self, websocket: WebSocket, driver_id: int):
-        """Connect a driver to receive trip requests."""
-        await websocket.accept()
+        # Outbound queue and writer task per connection; trip events are never dropped
+        self.outbound = ChannelGroup()
+
+    async def connect_driver(self, websocket: WebSocket, driver_id: int) -> bool:
+        """Connect a driver to receive trip requests; False if the connection was refused."""
+        if not await self.outbound.admit(websocket):
+            return False
         self.driver_connections[driver_id] = websocket
+        self.outbound.open(websocket, on_close=lambda ws: self.disconnect_driver(driver_id, ws))
         logger.info(f"🚗 Driver {driver_id} connected. Total drivers: {len(self.driver_connections)}")
+        return True
 
-    async def connect_customer(self, websocket: WebSocket, customer_id: int):
-        """Connect a customer to receive trip updates."""
-        await websocket.accept()
+    async def connect_customer(self, websocket: WebSocket, customer_id: int) -> bool:
+        """Connect a customer to receive trip updates; False if the connection was refused."""
+        if not await self.outbound.admit(websocket):
+            return False
         self.customer_connections[customer_id] = websocket
+        self.outbound.open(websocket, on_close=lambda ws: self.disconnect_customer(customer_id, ws))
         logger.info(f"👤 Customer {customer_id} connected. Total customers: {len(self.customer_connections)}")
-
-    def disconnect_driver(self, driver_id: int):
-        """Disconnect a driver."""
-        if driver_id in self.driver_connections:
+        return True
+
+    def disconnect_driver(self, driver_id: int, websocket: Optional[WebSocket] = None):
+        """Disconnect a driver; with a websocket, only if it is still the driver's connection."""
+        current = self.driver_connections.get(driver_id)
+        if websocket is not None:
+            self._forget(websocket)
+        if current is not None and websocket in (None, current):
+            self._forget(current)
             del self.driver_connections[driver_id]
             logger.info(f"🚗 Driver {driver_id} disconnected. Total drivers: {len(self.driver_connections)}")
 
-    def disconnect_customer(self, customer_id: int):
-        """Disconnect a customer."""
-        if customer_id in self.customer_connections:
+    def disconnect_customer(self, customer_id: int, websocket: Optional[WebSocket] = None):
+        """Disconnect a customer; with a websocket, only if it is still the customer's connection."""
+        current = self.customer_connections.get(customer_id)
+        if websocket is not None:
+            self._forget(websocket)
+        if current is not None and websocket in (None, current):
+            self._forget(current)
             del self.customer_connections[customer_id]
             logger.info(f"👤 Customer {customer_id} disconnected. Total customers: {len(self.customer_connections)}")
 
+    def _forget(self, websocket: WebSocket):
+        """Stop a connection's writer and remove it from trip subscriptions."""
+        self.outbound.close(websocket)
+        for trip_id in list(self.trip_watchers):
+            self.unsubscribe_from_trip(trip_id, websocket)
+
     def subscribe_to_trip(self, trip_id: int, websocket: WebSocket):
         """Subscribe to updates for a specific trip."""
         if trip_id not in self.trip_watchers:
@@ -71,76 +100,66 @@ class TripConnectionManager:
         Broadcast a new trip request to ALL connected drivers.
         This is the key feature - all drivers see new requests in real-time.
         """
-        message = {
-            "type": "new_trip",
-            "trip": trip_data
-        }
-
-        disconnected = []
-        for driver_id, websocket in self.driver_connections.items():
-            try:
-                await websocket.send_json(message)
-                logger.info(f"📤 Sent new trip {trip_data.get('id')} to driver {driver_id}")
-            except Exception as e:
-                logger.error(f"Error sending to driver {driver_id}: {e}")
-                disconnected.append(driver_id)
-
-        # Clean up disconnected drivers
-        for driver_id in disconnected:
-            self.disconnect_driver(driver_id)
-
-        logger.info(f"📢 Broadcasted trip to {len(self.driver_connections)} drivers")
+        await broker.publish(TRIPS_CHANNEL, {"event": "new_trip", "trip": trip_data})
 
     async def notify_trip_update(self, trip_id: int, trip_data: dict, event_type: str = "trip_update"):
         """
         Notify all watchers of a trip about an update.
         Used when trip status changes (accepted, arrived, started, completed).
         """
+        await broker.publish(TRIPS_CHANNEL, {
+            "event": "trip_update",
+            "trip_id": trip_id,
+            "trip": trip_data,
+            "event_type": event_type,
+        })
+
+    async def notify_trip_accepted(self, trip_data: dict):
+        """Notify when a trip is accepted by a driver."""
+        await broker.publish(TRIPS_CHANNEL, {"event": "trip_accepted", "trip": trip_data})
+
+    def deliver(self, event: dict):
+        """Broker handler: deliver a trip event to this worker's connections."""
+        if event["event"] == "new_trip":
+            self._deliver_new_trip(event["trip"])
+        elif event["event"] == "trip_accepted":
+            self._deliver_trip_accepted(event["trip"])
+        else:
+            self._deliver_trip_update(event["trip_id"], event["trip"], event["event_type"])
+
+    def _deliver_new_trip(self, trip_data: dict):
+        message = {
+            "type": "new_trip",
+            "trip": trip_data
+        }
+
+        queued = self.outbound.broadcast(self.driver_connections.values(), encode(message), "new_trip")
+        logger.info(f"📢 Broadcasted trip {trip_data.get('id')} to {queued} drivers")
+
+    def _deliver_trip_update(self, trip_id: int, trip_data: dict, event_type: str):
         message = {
             "type": event_type,
             "trip": trip_data
         }
+        payload = encode(message)
+
+        # Notify trip watchers, the customer and the assigned driver, once each
+        recipients = set(self.trip_watchers.get(trip_id, ()))
 
-        # Notify trip watchers
-        if trip_id in self.trip_watchers:
-            disconnected = []
-            for websocket in self.trip_watchers[trip_id]:
-                try:
-                    await websocket.send_json(message)
-                except Exception as e:
-                    logger.error(f"Error notifying trip watcher: {e}")
-                    disconnected.append(websocket)
-
-            for ws in disconnected:
-                self.trip_watchers[trip_id].discard(ws)
-
-        # Also notify the customer directly if connected
         customer_id = trip_data.get("customer_id")
         if customer_id and customer_id in self.customer_connections:
-            try:
-                await self.customer_connections[customer_id].send_json(message)
-                logger.info(f"📤 Sent {event_type} to customer {customer_id}")
-            except Exception as e:
-                logger.error(f"Error sending to customer {customer_id}: {e}")
-                self.disconnect_customer(customer_id)
-
-        # Notify the assigned driver
+            recipients.add(self.customer_connections[customer_id])
+            logger.info(f"📤 Sent {event_type} to customer {customer_id}")
+
         driver_id = trip_data.get("driver_id")
         if driver_id and driver_id in self.driver_connections:
-            try:
-                await self.driver_connections[driver_id].send_json(message)
-                logger.info(f"📤 Sent {event_type} to driver {driver_id}")
-            except Exception as e:
-                logger.error(f"Error sending to driver {driver_id}: {e}")
-                self.disconnect_driver(driver_id)
+            recipients.add(self.driver_connections[driver_id])
+            logger.info(f"📤 Sent {event_type} to driver {driver_id}")
 
-    async def notify_trip_accepted(self, trip_data: dict):
-        """Notify when a trip is accepted by a driver."""
-        await self.notify_trip_update(
-            trip_data["id"],
-            trip_data,
-            event_type="trip_accepted"
-        )
+        self.outbound.broadcast(recipients, payload, event_type)
+
+    def _deliver_trip_accepted(self, trip_data: dict):
+        self._deliver_trip_update(trip_data["id"], trip_data, "trip_accepted")
 
         # Also broadcast to all drivers that this trip is no longer available
         remove_message = {
@@ -149,12 +168,11 @@ class TripConnectionManager:
             "driver_id": trip_data.get("driver_id")
         }
 
-        for driver_id, websocket in self.driver_connections.items():
-            if driver_id != trip_data.get("driver_id"):
-                try:
-                    await websocket.send_json(remove_message)
-                except:
-                    pass
+        other_drivers = [
+            websocket for driver_id, websocket in self.driver_connections.items()
+            if driver_id != trip_data.get("driver_id")
+        ]
+        self.outbound.broadcast(other_drivers, encode(remove_message), "trip_taken")
 
     def get_stats(self):
         """Get connection statistics."""
@@ -163,9 +181,11 @@ class TripConnectionManager:
             "connected_customers": len(self.customer_connections),
             "active_trip_watchers": len(self.trip_watchers),
             "driver_ids": list(self.driver_connections.keys()),
-            "customer_ids": list(self.customer_connections.keys())
+            "customer_ids": list(self.customer_connections.keys()),
+            "outbound": self.outbound.stats()
         }
 
 
 # Global instance
 trip_manager = TripConnectionManager()
+broker.subscribe(TRIPS_CHANNEL, trip_manager.deliver)
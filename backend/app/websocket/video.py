@@ -1,50 +1,95 @@
 """
 WebSocket for real-time video streaming from ESP32-CAM devices.
+
+Frames are pushed as they are uploaded: each new frame of a route gets the
+next sequence number, is encoded once and queued for that route's viewers,
+so every viewer receives each frame at most once and idle routes cost
+nothing. A viewer joining a route is sent the route's latest frame.
+
+Viewers that request the "taxiwatch.jpeg.v1" subprotocol receive frames as
+binary messages, others as JSON with the JPEG base64 encoded (see
+frames.py). The last VIDEO_FRAMES_PER_ROUTE frames of each route are kept
+in a FrameStore, and a viewer connecting with ?rewind=N first gets the last
+N of them.
 """
-from fastapi import WebSocket, WebSocketDisconnect
-from typing import Dict, Set
-import asyncio
+from fastapi import WebSocket
+from typing import Dict, Optional, Set
 import logging
 
+from .frames import FrameStore, VideoFrame
+from .outbound import ChannelGroup
+
 logger = logging.getLogger(__name__)
 
+SUBPROTOCOL = "taxiwatch.jpeg.v1"
+
 
 class VideoStreamManager:
     """Manages WebSocket connections for video streaming."""
 
     def __init__(self):
         self.connections: Dict[str, Set[WebSocket]] = {}  # route_id -> connections
+        self.binary: Set[WebSocket] = set()  # Viewers receiving raw JPEG messages
+        self.outbound = ChannelGroup()  # Outbound queue and writer task per connection
+        self.frames = FrameStore()  # Recent frames per route
 
-    async def connect(self, websocket: WebSocket, route_id: str):
-        """Accept connection and subscribe to route."""
-        await websocket.accept()
+    async def connect(self, websocket: WebSocket, route_id: str, rewind: int = 0) -> bool:
+        """
+        Accept connection, with the binary subprotocol if requested, and
+        subscribe to route. The viewer first gets the route's last rewind
+        frames, or at least its newest one.
+        """
+        binary = SUBPROTOCOL in websocket.scope.get("subprotocols", ())
+        if not await self.outbound.admit(websocket, SUBPROTOCOL if binary else None):
+            return False
+        if binary:
+            self.binary.add(websocket)
         if route_id not in self.connections:
             self.connections[route_id] = set()
         self.connections[route_id].add(websocket)
+        self.outbound.open(websocket, on_close=lambda ws: self.disconnect(ws, route_id))
+        for frame in self.frames.recent(route_id, max(rewind, 1)):
+            payload = frame.binary_payload() if binary else frame.json_payload()
+            self.outbound.send(websocket, payload, "frame")
         logger.info(f"Client connected to stream: {route_id}")
+        return True
 
     def disconnect(self, websocket: WebSocket, route_id: str):
         """Remove connection."""
+        self.outbound.close(websocket)
+        self.binary.discard(websocket)
         if route_id in self.connections:
             self.connections[route_id].discard(websocket)
             if not self.connections[route_id]:
                 del self.connections[route_id]
         logger.info(f"Client disconnected from stream: {route_id}")
 
-    async def broadcast_frame(self, route_id: str, frame_data: dict):
-        """Send frame to all clients watching this route."""
-        if route_id not in self.connections:
-            return
+    def send(self, websocket: WebSocket, message: dict) -> bool:
+        """Queue a message for one viewer; older frames are dropped if it falls behind."""
+        return self.outbound.send_json(websocket, message)
 
-        disconnected = set()
-        for ws in self.connections[route_id]:
-            try:
-                await ws.send_json(frame_data)
-            except Exception:
-                disconnected.add(ws)
+    def broadcast_frame(
+        self, route_id: str, jpeg: bytes, timestamp: str, trip_id: Optional[str] = None
+    ) -> VideoFrame:
+        """Store a new frame of a route and queue it once for each of its viewers."""
+        frame = self.frames.append(route_id, jpeg, timestamp, trip_id)
+        viewers = self.connections.get(route_id, ())
+        binary = [websocket for websocket in viewers if websocket in self.binary]
+        text = [websocket for websocket in viewers if websocket not in self.binary]
+        if binary:
+            self.outbound.broadcast(binary, frame.binary_payload(), "frame")
+        if text:
+            self.outbound.broadcast(text, frame.json_payload(), "frame")
+        return frame
 
-        for ws in disconnected:
-            self.disconnect(ws, route_id)
+    def get_stats(self) -> dict:
+        """Get connection and outbound queue statistics."""
+        return {
+            "routes": len(self.connections),
+            "binary": len(self.binary),
+            "frames": self.frames.stats(),
+            **self.outbound.stats(),
+        }
 
 
 # Global instance
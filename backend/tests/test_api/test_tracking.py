@@ -0,0 +1,195 @@
+"""
+Tests for GPS tracking endpoints.
+"""
+import json
+from datetime import datetime, timedelta
+
+import pytest
+from httpx import AsyncClient
+
+from app.models.user import User
+
+
+async def create_test_vehicle(client: AsyncClient, token: str, plate: str, vin: str) -> int:
+    """Create a vehicle and return its ID."""
+    response = await client.post(
+        "/api/v1/vehicles",
+        headers={"Authorization": f"Bearer {token}"},
+        json={
+            "license_plate": plate,
+            "make": "Toyota",
+            "model": "Prius",
+            "year": 2022,
+            "color": "White",
+            "vin": vin,
+            "capacity": 4,
+            "status": "ACTIVE"
+        }
+    )
+    return response.json()["id"]
+
+
+@pytest.mark.asyncio
+async def test_batch_upload_mixed_results(client: AsyncClient, admin_user: User, admin_token: str):
+    """Test batch upload accepts valid fixes and rejects invalid ones per item."""
+    vehicle_a = await create_test_vehicle(client, admin_token, "GPS-001", "44444444444444444")
+    vehicle_b = await create_test_vehicle(client, admin_token, "GPS-002", "55555555555555555")
+    recent = (datetime.utcnow() - timedelta(days=1)).isoformat() + "Z"
+    too_old = (datetime.utcnow() - timedelta(days=400)).isoformat() + "Z"
+
+    response = await client.post(
+        "/api/v1/tracking/locations:batch",
+        json=[
+            {"vehicle_id": vehicle_a, "latitude": 40.71, "longitude": -74.00, "speed": 30},
+            {"vehicle_id": vehicle_b, "latitude": 40.72, "longitude": -74.01,
+             "timestamp": recent},
+            {"vehicle_id": vehicle_a, "latitude": 123.0, "longitude": -74.00},  # Invalid latitude
+            {"vehicle_id": 999999, "latitude": 40.70, "longitude": -74.02},  # Unknown vehicle
+            {"vehicle_id": vehicle_a, "latitude": 40.70, "longitude": -74.02, "timestamp": too_old},
+        ]
+    )
+
+    assert response.status_code == 200
+    data = response.json()
+
+    assert data["accepted"] == 2
+    assert data["rejected"] == 3
+    results = data["results"]
+    assert [r["accepted"] for r in results] == [True, True, False, False, False]
+    assert results[0]["id"] is not None
+    assert "latitude" in results[2]["error"]
+    assert results[3]["error"] == "Vehicle not found"
+    assert "retention" in results[4]["error"]
+
+
+@pytest.mark.asyncio
+async def test_batch_upload_too_large(client: AsyncClient):
+    """Test batch upload rejects batches over the configured limit."""
+    from app.config import settings
+
+    fixes = [{"vehicle_id": 1, "latitude": 0, "longitude": 0}] * (settings.GPS_BATCH_MAX_SIZE + 1)
+    response = await client.post("/api/v1/tracking/locations:batch", json=fixes)
+
+    assert response.status_code == 413
+
+
+@pytest.mark.asyncio
+async def test_live_locations_from_registry(client: AsyncClient, admin_user: User, admin_token: str):
+    """Test a received fix is immediately visible on the live endpoint."""
+    vehicle_id = await create_test_vehicle(client, admin_token, "LIVE-001", "66666666666666666")
+
+    response = await client.post(
+        "/api/v1/tracking/location",
+        json={"vehicle_id": vehicle_id, "latitude": 40.75, "longitude": -73.98, "speed": 20}
+    )
+    assert response.status_code == 201
+    location_id = response.json()["id"]
+
+    response = await client.get(
+        "/api/v1/tracking/live",
+        headers={"Authorization": f"Bearer {admin_token}"}
+    )
+
+    assert response.status_code == 200
+    live = {item["vehicle_id"]: item for item in response.json()}
+    assert live[vehicle_id]["latitude"] == 40.75
+    assert live[vehicle_id]["id"] == location_id
+
+
+@pytest.mark.asyncio
+async def test_history_compact(client: AsyncClient, admin_user: User, admin_token: str):
+    """Test compact history returns the newest fixes first with only the indexed columns."""
+    vehicle_id = await create_test_vehicle(client, admin_token, "GPS-004", "77777777777777777")
+    now = datetime.utcnow()
+    await client.post(
+        "/api/v1/tracking/locations:batch",
+        json=[
+            {"vehicle_id": vehicle_id, "latitude": latitude, "longitude": -74.00, "speed": 20,
+             "heading": 90, "timestamp": (now - timedelta(minutes=minutes)).isoformat()}
+            for minutes, latitude in ((5, 40.71), (1, 40.72))
+        ]
+    )
+
+    response = await client.get(
+        f"/api/v1/tracking/vehicle/{vehicle_id}/history",
+        headers={"Authorization": f"Bearer {admin_token}"},
+        params={"compact": True}
+    )
+
+    assert response.status_code == 200
+    data = response.json()
+    assert [p["latitude"] for p in data] == [40.72, 40.71]
+    assert data[0]["heading"] == 90
+    assert data[0]["id"] is None
+
+
+@pytest.mark.asyncio
+async def test_history_simplified(client: AsyncClient, admin_user: User, admin_token: str):
+    """Test a straight trace is simplified to its endpoints and max_points is honored."""
+    vehicle_id = await create_test_vehicle(client, admin_token, "GPS-005", "88888888888888888")
+    now = datetime.utcnow()
+    await client.post(
+        "/api/v1/tracking/locations:batch",
+        json=[
+            {"vehicle_id": vehicle_id, "latitude": 40.70 + i * 0.0001, "longitude": -74.00,
+             "timestamp": (now - timedelta(minutes=200 - i)).isoformat()}
+            for i in range(200)
+        ]
+    )
+    headers = {"Authorization": f"Bearer {admin_token}"}
+    url = f"/api/v1/tracking/vehicle/{vehicle_id}/history"
+
+    response = await client.get(url, headers=headers, params={"hours": 24, "tolerance_m": 1})
+    assert response.status_code == 200
+    data = response.json()
+    assert [p["latitude"] for p in data] == pytest.approx([40.7199, 40.70])
+
+    response = await client.get(url, headers=headers, params={"hours": 24, "max_points": 1})
+    assert response.status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_export_vehicle_ndjson_and_csv(client: AsyncClient, admin_user: User, admin_token: str):
+    """Test a vehicle export streams every fix in the range, oldest first."""
+    vehicle_id = await create_test_vehicle(client, admin_token, "GPS-006", "99999999999999999")
+    start = datetime.utcnow().replace(microsecond=0) - timedelta(hours=1)
+    await client.post(
+        "/api/v1/tracking/locations:batch",
+        json=[
+            {"vehicle_id": vehicle_id, "latitude": 40.70 + i * 0.001, "longitude": -74.00,
+             "device_id": "ESP32-X", "timestamp": (start + timedelta(minutes=i)).isoformat()}
+            for i in range(5)
+        ]
+    )
+    headers = {"Authorization": f"Bearer {admin_token}"}
+    url = f"/api/v1/tracking/vehicle/{vehicle_id}/export"
+    params = {
+        "start": (start + timedelta(minutes=1)).isoformat() + "Z",
+        "end": (start + timedelta(minutes=4)).isoformat() + "Z",
+    }
+
+    response = await client.get(url, headers=headers, params=params)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert [row["latitude"] for row in rows] == pytest.approx([40.701, 40.702, 40.703])
+    assert rows[0]["device_id"] == "ESP32-X"
+
+    response = await client.get(url, headers=headers, params={**params, "format": "csv"})
+    assert response.status_code == 200
+    lines = response.text.splitlines()
+    assert lines[0].startswith("id,vehicle_id,latitude,longitude")
+    assert len(lines) == 4
+
+    response = await client.get(url, headers=headers, params={"format": "xml"})
+    assert response.status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_export_fleet_requires_manager(client: AsyncClient, operator_user: User, operator_token: str):
+    """Test the fleet-wide export is limited to fleet managers and admins."""
+    response = await client.get(
+        "/api/v1/tracking/export",
+        headers={"Authorization": f"Bearer {operator_token}"}
+    )
+    assert response.status_code == 403
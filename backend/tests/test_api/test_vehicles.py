@@ -156,3 +156,58 @@ async def test_update_vehicle(client: AsyncClient, admin_user: User, admin_token
     assert data["status"] == "MAINTENANCE"
     assert data["color"] == "Gray"
     assert data["license_plate"] == "UPD-TEST"  # Unchanged fields remain
+
+
+@pytest.mark.asyncio
+async def test_available_drivers_within_radius(
+    client: AsyncClient, admin_user: User, operator_user: User, admin_token: str
+):
+    """Test available drivers are filtered by radius and sorted by distance."""
+    headers = {"Authorization": f"Bearer {admin_token}"}
+    placements = [
+        (admin_user, "LIC-NEAR-1", "NEAR-001", "77777777777777777", 40.7130, -74.0060),
+        (operator_user, "LIC-FAR-01", "FAR-0001", "88888888888888888", 40.9000, -74.0060),
+    ]
+
+    driver_ids = []
+    for user, license_number, plate, vin, lat, lng in placements:
+        driver = await client.post(
+            "/api/v1/drivers",
+            headers=headers,
+            json={
+                "user_id": user.id,
+                "license_number": license_number,
+                "license_expiry": "2030-01-01",
+                "status": "ON_DUTY"
+            }
+        )
+        driver_ids.append(driver.json()["id"])
+        vehicle = await client.post(
+            "/api/v1/vehicles",
+            headers=headers,
+            json={
+                "license_plate": plate,
+                "make": "Toyota",
+                "model": "Camry",
+                "year": 2022,
+                "vin": vin,
+                "current_driver_id": driver_ids[-1]
+            }
+        )
+        await client.post(
+            "/api/v1/tracking/location",
+            json={"vehicle_id": vehicle.json()["id"], "latitude": lat, "longitude": lng}
+        )
+
+    response = await client.get(
+        "/api/v1/drivers/available",
+        headers=headers,
+        params={"lat": 40.7128, "lng": -74.0060, "radius": 5}
+    )
+
+    assert response.status_code == 200
+    data = response.json()
+
+    assert [d["id"] for d in data] == [driver_ids[0]]
+    assert data[0]["distance_km"] < 0.1
+    assert data[0]["latitude"] == 40.7130
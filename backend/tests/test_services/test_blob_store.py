@@ -0,0 +1,157 @@
+"""
+Tests for content-addressed blob storage.
+"""
+import base64
+import hashlib
+
+import pytest
+from fastapi import HTTPException
+
+from app.api.v1.images import _byte_range
+from app.services.blob_store import BlobNotFound, BlobStore, LocalBlobStore, S3BlobStore
+from app.services.thumbnails import preview_key
+from app.services.trip_images import decode_image, release_blob
+
+JPEG = b"\xff\xd8\xff\xe0" + bytes(range(256)) * 8 + b"\xff\xd9"
+
+
+class FakeBody:
+    def __init__(self, data: bytes):
+        self.data = data
+
+    def read(self) -> bytes:
+        return self.data
+
+
+class FakeS3Client:
+    """In-process stand-in for the boto3 S3 calls used by S3BlobStore."""
+
+    class NotFound(Exception):
+        response = {"Error": {"Code": "404"}}
+
+    def __init__(self):
+        self.objects = {}
+        self.puts = 0
+
+    def head_object(self, Bucket, Key):
+        if (Bucket, Key) not in self.objects:
+            raise self.NotFound()
+        return {"ContentLength": len(self.objects[(Bucket, Key)])}
+
+    def get_object(self, Bucket, Key, Range=None):
+        if (Bucket, Key) not in self.objects:
+            raise self.NotFound()
+        data = self.objects[(Bucket, Key)]
+        if Range:
+            start, end = Range[len("bytes="):].split("-")
+            data = data[int(start):int(end) + 1 if end else None]
+        return {"Body": FakeBody(data)}
+
+    def put_object(self, Bucket, Key, Body):
+        self.puts += 1
+        self.objects[(Bucket, Key)] = Body
+
+    def delete_object(self, Bucket, Key):
+        self.objects.pop((Bucket, Key), None)
+
+
+class FakeSession:
+    """Answers the reference counts of release_blob: trip images, then archive thumbnails."""
+
+    def __init__(self, *counts: int):
+        self.counts = list(counts)
+        self.locked = []
+
+    async def execute(self, statement, params=None):
+        assert "pg_advisory_xact_lock" in str(statement)
+        self.locked.append(params["key"])
+
+    async def scalar(self, statement):
+        return self.counts.pop(0)
+
+
+@pytest.mark.asyncio
+async def test_local_store_dedupes_and_reads_ranges(tmp_path):
+    """Test identical images share one file keyed by SHA-256 and ranges read only those bytes."""
+    store = LocalBlobStore(str(tmp_path))
+
+    key, size = await store.put(JPEG)
+    assert (key, size) == (hashlib.sha256(JPEG).hexdigest(), len(JPEG))
+    assert await store.put(JPEG) == (key, size)
+    assert len(list(tmp_path.rglob("*"))) == 3  # Two fan-out directories and one blob
+
+    assert await store.get(key) == JPEG
+    assert await store.get(key, 4, 9) == JPEG[4:10]
+    assert await store.size(key) == len(JPEG)
+    with pytest.raises(BlobNotFound):
+        await store.get("0" * 64)
+
+
+@pytest.mark.asyncio
+async def test_s3_store_writes_once_under_prefix():
+    """Test the S3 backend skips uploads of stored content and maps missing objects to BlobNotFound."""
+    client = FakeS3Client()
+    store = S3BlobStore(bucket="frames", prefix="blobs/", client=client)
+
+    key, _ = await store.put(JPEG)
+    await store.put(JPEG)
+
+    assert client.puts == 1
+    assert list(client.objects) == [("frames", f"blobs/{key[:2]}/{key}")]
+    assert await store.get(key, 0, 3) == JPEG[:4]
+    assert not await store.exists("f" * 64)
+
+
+@pytest.mark.asyncio
+async def test_blob_deleted_with_previews_when_last_reference_goes(tmp_path):
+    """Test a blob still referenced is kept, and an unreferenced one is deleted with its previews."""
+    store = LocalBlobStore(str(tmp_path))
+    key, _ = await store.put(JPEG)
+    await store.put_derived(preview_key(key, 160), b"preview")
+
+    assert not await release_blob(FakeSession(1), key, store=store)
+    assert await store.exists(key)
+
+    session = FakeSession(0, 0)
+    assert await release_blob(session, key, store=store)
+    assert session.locked == [key]  # Counted and deleted under the key's lock
+    assert not await store.exists(key)
+    assert not await store.exists(preview_key(key, 160))
+    await store.delete(key)  # Already gone
+
+
+@pytest.mark.asyncio
+async def test_previews_used_as_archive_thumbnail_are_kept(tmp_path):
+    """Test previews shared with a video archive thumbnail outlive the trip image blob."""
+    store = S3BlobStore(bucket="frames", prefix="", client=FakeS3Client())
+    key, _ = await store.put(JPEG)
+    await store.put_derived(preview_key(key, 160), b"preview")
+
+    assert await release_blob(FakeSession(0, 1), key, store=store)
+    assert not await store.exists(key)
+    assert await store.exists(preview_key(key, 160))
+
+
+def test_blob_store_base_is_abstract():
+    """Test a store missing backend methods cannot be created."""
+    with pytest.raises(TypeError):
+        BlobStore()
+
+
+def test_byte_range_header_parsing():
+    """Test explicit, open-ended and suffix ranges, and unsatisfiable ones."""
+    assert _byte_range("bytes=0-99", 1000) == (0, 99)
+    assert _byte_range("bytes=900-", 1000) == (900, 999)
+    assert _byte_range("bytes=-100", 1000) == (900, 999)
+    assert _byte_range("bytes=500-5000", 1000) == (500, 999)
+    assert _byte_range("bytes=0-1,5-6", 1000) is None  # Multiple ranges: send everything
+    with pytest.raises(HTTPException) as error:
+        _byte_range("bytes=1000-", 1000)
+    assert error.value.status_code == 416
+
+
+def test_decode_image_accepts_data_urls():
+    """Test legacy rows stored with or without a data: prefix decode to the same bytes."""
+    encoded = base64.b64encode(JPEG).decode()
+    assert decode_image(encoded) == JPEG
+    assert decode_image(f"data:image/jpeg;base64,{encoded}") == JPEG
@@ -0,0 +1,184 @@
+"""
+Tests for the WebSocket fan-out broker.
+"""
+import asyncio
+
+import pytest
+
+from app.services.broker import Broker, InMemoryBroker, RedisBroker
+from app.websocket.trips import TripConnectionManager
+
+
+class FakeRedisServer:
+    """In-process stand-in for Redis pub/sub shared by several clients."""
+
+    def __init__(self):
+        self.subscribers = []
+
+    def client(self):
+        return FakeRedis(self)
+
+
+class FakeRedis:
+    def __init__(self, server: FakeRedisServer):
+        self.server = server
+
+    def pubsub(self):
+        return FakePubSub(self.server)
+
+    async def publish(self, channel: str, data: bytes) -> int:
+        receivers = [p for p in self.server.subscribers if channel in p.channels]
+        for pubsub in receivers:
+            pubsub.queue.put_nowait({"type": "message", "channel": channel.encode(), "data": data})
+        return len(receivers)
+
+
+class BrokenRedis:
+    """Client whose publishes fail or hang."""
+
+    def __init__(self, hang: bool = False):
+        self.hang = hang
+
+    async def publish(self, channel: str, data: bytes) -> int:
+        if self.hang:
+            await asyncio.sleep(10)
+        raise ConnectionError("Connection refused")
+
+
+class FakePubSub:
+    def __init__(self, server: FakeRedisServer):
+        self.server = server
+        self.channels = set()
+        self.queue = asyncio.Queue()
+
+    async def subscribe(self, *channels):
+        self.channels.update(channels)
+        self.server.subscribers.append(self)
+        for channel in channels:
+            self.queue.put_nowait({"type": "subscribe", "channel": channel.encode(), "data": 1})
+
+    async def unsubscribe(self):
+        self.channels.clear()
+
+    async def close(self):
+        self.server.subscribers.remove(self)
+
+    async def listen(self):
+        while True:
+            yield await self.queue.get()
+
+
+class FakeSocket:
+    def __init__(self):
+        self.frames = []
+
+    async def send_text(self, text: str):
+        self.frames.append(text)
+
+    async def close(self, code: int = 1000):
+        pass
+
+
+@pytest.mark.asyncio
+async def test_in_memory_broker_calls_sync_and_async_handlers():
+    """Test the in-memory broker delivers to every handler of the channel only."""
+    broker = InMemoryBroker()
+    received = []
+
+    async def async_handler(message):
+        received.append(("async", message))
+
+    broker.subscribe("a", lambda message: received.append(("sync", message)))
+    broker.subscribe("a", async_handler)
+    broker.subscribe("b", lambda message: received.append(("b", message)))
+
+    await broker.publish("a", {"n": 1})
+
+    assert received == [("sync", {"n": 1}), ("async", {"n": 1})]
+
+
+@pytest.mark.asyncio
+async def test_failing_handler_does_not_block_others():
+    """Test an exception in one handler is logged and the next still runs."""
+    broker = InMemoryBroker()
+    received = []
+
+    def failing(message):
+        raise RuntimeError("boom")
+
+    broker.subscribe("a", failing)
+    broker.subscribe("a", received.append)
+
+    await broker.publish("a", {"n": 1})
+
+    assert received == [{"n": 1}]
+
+
+@pytest.mark.asyncio
+async def test_redis_broker_fans_out_across_processes():
+    """Test a message published by one worker reaches the handlers of every worker once."""
+    server = FakeRedisServer()
+    workers = [RedisBroker(client=server.client()) for _ in range(2)]
+    received = {0: [], 1: []}
+    for i, broker in enumerate(workers):
+        broker.subscribe("trips", received[i].append)
+        await broker.start()
+
+    await workers[0].publish("trips", {"event": "new_trip", "trip": {"id": 7}})
+    await asyncio.sleep(0.01)
+
+    assert received[0] == [{"event": "new_trip", "trip": {"id": 7}}]
+    assert received[1] == [{"event": "new_trip", "trip": {"id": 7}}]
+
+    for broker in workers:
+        await broker.stop()
+    assert server.subscribers == []
+
+
+@pytest.mark.asyncio
+async def test_redis_publish_failures_are_counted_not_raised():
+    """Test an unreachable or hanging Redis does not fail or stall the publisher, and local handlers still run."""
+    received = []
+    broker = RedisBroker(client=BrokenRedis())
+    broker.subscribe("trips", received.append)
+    await broker.publish("trips", {"n": 1})
+
+    hanging = RedisBroker(client=BrokenRedis(hang=True), timeout_ms=20)
+    hanging.subscribe("trips", received.append)
+    await asyncio.wait_for(hanging.publish("trips", {"n": 2}), 1)
+
+    assert broker.stats()["failed"] == 1
+    assert hanging.stats()["failed"] == 1
+    assert broker.published == hanging.published == 0
+    assert received == [{"n": 1}, {"n": 2}]
+    assert broker.delivered == hanging.delivered == 1
+
+
+def test_broker_base_is_abstract():
+    """Test a broker without publish cannot be created."""
+    with pytest.raises(TypeError):
+        Broker()
+
+
+@pytest.mark.asyncio
+async def test_trip_event_reaches_driver_on_other_worker(monkeypatch):
+    """Test a trip created on one worker is pushed to a driver connected to another."""
+    server = FakeRedisServer()
+    producer = RedisBroker(client=server.client())
+    consumer = RedisBroker(client=server.client())
+    manager = TripConnectionManager()
+    consumer.subscribe("taxiwatch.trips", manager.deliver)
+    await consumer.start()
+    monkeypatch.setattr("app.websocket.trips.broker", producer)
+
+    driver = FakeSocket()
+    manager.driver_connections[1] = driver
+    manager.outbound.open(driver)
+
+    await manager.broadcast_new_trip({"id": 42, "status": "REQUESTED"})
+    await asyncio.sleep(0.01)
+
+    assert driver.frames == ['{"type":"new_trip","trip":{"id":42,"status":"REQUESTED"}}']
+
+    manager.outbound.close(driver)
+    await consumer.stop()
@@ -0,0 +1,95 @@
+"""
+Tests for the partitioned Parquet export.
+"""
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from types import SimpleNamespace
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+from app.services.columnar_export import EXPORT_TABLES, PartitionedParquetWriter, resolve_destination, whole_days
+
+
+def make_fixes(vehicle_id, start, count, minutes=1):
+    """Rows shaped like the GPS export query results."""
+    return [
+        SimpleNamespace(
+            id=vehicle_id * 1000 + i, vehicle_id=vehicle_id, device_id=f"ESP32-{vehicle_id}",
+            latitude=Decimal("40.71280000") + Decimal(i) / 10000, longitude=Decimal("-74.00600000"),
+            speed=Decimal("30.50"), heading=90, accuracy=None, altitude=Decimal("12.00"),
+            timestamp=start + timedelta(minutes=i * minutes),
+        )
+        for i in range(count)
+    ]
+
+
+def write(tmp_path, table, chunks):
+    filesystem, base = resolve_destination(str(tmp_path))
+    writer = PartitionedParquetWriter(EXPORT_TABLES[table], filesystem, base)
+    for rows in chunks:
+        writer.write_rows(rows)
+    writer.close()
+    return writer
+
+
+def test_gps_partitioned_by_date_and_vehicle(tmp_path):
+    """Test a run crossing midnight is split into one file per (date, vehicle)."""
+    start = datetime(2024, 12, 1, 23, 58, tzinfo=timezone.utc)
+    rows = make_fixes(1, start, 4) + make_fixes(2, start, 2)
+
+    writer = write(tmp_path, "gps_locations", [rows[:3], rows[3:]])
+
+    assert writer.rows == 6
+    assert sorted(p.split("gps_locations/")[1] for p in writer.files) == [
+        "date=2024-12-01/vehicle_id=1/part-0.parquet",
+        "date=2024-12-01/vehicle_id=2/part-0.parquet",
+        "date=2024-12-02/vehicle_id=1/part-0.parquet",
+    ]
+
+    table = ds.dataset(tmp_path / "gps_locations", partitioning="hive").to_table()
+    assert table.num_rows == 6
+    assert table.schema.field("latitude").type == pa.float32()
+    assert pa.types.is_dictionary(table.schema.field("device_id").type)
+    assert sorted(set(table.column("vehicle_id").to_pylist())) == [1, 2]
+
+
+def test_rerun_overwrites_partition(tmp_path):
+    """Test exporting the same range twice does not duplicate rows."""
+    rows = make_fixes(3, datetime(2024, 12, 1, 8, 0, tzinfo=timezone.utc), 5)
+
+    write(tmp_path, "gps_locations", [rows])
+    write(tmp_path, "gps_locations", [rows])
+
+    assert ds.dataset(tmp_path / "gps_locations", partitioning="hive").count_rows() == 5
+
+
+def test_window_widened_to_whole_utc_days():
+    """Test partial-day windows cover their whole days, in naive UTC, so reruns rewrite complete partitions."""
+    start = datetime(2024, 12, 1, 20, 30, tzinfo=timezone(timedelta(hours=-5)))  # 2024-12-02 01:30 UTC
+    assert whole_days(start, datetime(2024, 12, 3, 6, 0)) == (datetime(2024, 12, 2), datetime(2024, 12, 4))
+    assert whole_days(None, datetime(2024, 12, 3)) == (None, datetime(2024, 12, 3))
+    assert whole_days(None, None) == (None, None)
+
+
+def test_trip_locations_flattened(tmp_path):
+    """Test trip JSON locations become float columns and status is dictionary encoded."""
+    trip = SimpleNamespace(
+        id=7, vehicle_id=None, customer_id=2, driver_id=3, status=SimpleNamespace(value="COMPLETED"),
+        start_time=datetime(2024, 12, 1, 8, 5), end_time=None,
+        pickup_location={"lat": 40.7128, "lng": -74.006, "address": "A"}, destination={"lat": 40.75},
+        distance=Decimal("5.20"), duration=18, fare=Decimal("21.50"), estimated_fare=Decimal("20.00"),
+        identity_verified=True, verification_score=91, created_at=datetime(2024, 12, 1, 8, 0),
+    )
+
+    write(tmp_path, "trips", [[trip]])
+
+    partitioning = ds.partitioning(
+        pa.schema([("date", pa.string()), ("vehicle_id", pa.int32())]), flavor="hive"
+    )
+    table = ds.dataset(tmp_path / "trips", partitioning=partitioning).to_table()
+    row = table.to_pylist()[0]
+    assert row["vehicle_id"] is None
+    assert row["status"] == "COMPLETED"
+    assert row["destination_lng"] is None
+    assert abs(row["pickup_lat"] - 40.7128) < 1e-4
@@ -0,0 +1,157 @@
+"""
+Tests for the background frame storage workers.
+"""
+import asyncio
+import threading
+import time
+
+import pytest
+
+from app.services.frame_storage import FrameStorage, LocalFrameBackend, S3FrameBackend, StorageFullError
+
+
+class SlowBackend:
+    """Backend that blocks for a while on each write and records concurrency."""
+
+    def __init__(self, delay: float = 0.05, fail: int = 0):
+        self.delay = delay
+        self.fail = fail
+        self.written = {}
+        self.active = 0
+        self.peak = 0
+        self.lock = threading.Lock()
+
+    def write(self, key: str, data: bytes):
+        with self.lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        time.sleep(self.delay)
+        with self.lock:
+            self.active -= 1
+            if self.fail:
+                self.fail -= 1
+                raise IOError("backend unavailable")
+            self.written[key] = data
+
+
+class RecordingMarker:
+    def __init__(self):
+        self.batches = []
+
+    async def __call__(self, archive_ids):
+        self.batches.append(list(archive_ids))
+
+    @property
+    def ids(self):
+        return sorted(i for batch in self.batches for i in batch)
+
+
+class FakeS3Client:
+    def __init__(self):
+        self.objects = {}
+
+    def put_object(self, Bucket, Key, Body, ContentType=None):
+        self.objects[(Bucket, Key)] = Body
+
+
+@pytest.mark.asyncio
+async def test_put_returns_before_write_and_marks_rows_stored():
+    """Test queueing does not wait for the backend and written frames are marked in a batch."""
+    backend = SlowBackend(delay=0.05)
+    marker = RecordingMarker()
+    storage = FrameStorage(backend=backend, workers=4, max_size=100, mark_interval_ms=10, marker=marker)
+    storage.start()
+
+    started = time.perf_counter()
+    for i in range(8):
+        storage.put(i, f"frames/{i}.jpg", b"jpeg%d" % i)
+    assert time.perf_counter() - started < 0.01
+    assert backend.written == {}
+
+    await storage.stop()
+
+    assert backend.written["frames/3.jpg"] == b"jpeg3"
+    assert marker.ids == list(range(8))
+    # Four workers wrote in parallel instead of one after another
+    assert backend.peak == 4
+    assert storage.get_stats()["written"] == 8
+
+
+@pytest.mark.asyncio
+async def test_full_queue_rejects_instead_of_blocking():
+    """Test a slow backend makes put fail fast once the queue is full."""
+    storage = FrameStorage(
+        backend=SlowBackend(delay=0.2), workers=1, max_size=2, mark_interval_ms=10, marker=RecordingMarker()
+    )
+    storage.start()
+
+    storage.put(1, "a.jpg", b"a")
+    await asyncio.sleep(0.01)  # The worker takes the first frame
+    storage.put(2, "b.jpg", b"b")
+    storage.put(3, "c.jpg", b"c")
+    assert storage.full()
+    with pytest.raises(StorageFullError):
+        storage.put(4, "d.jpg", b"d")
+    assert storage.get_stats()["rejected"] == 1
+
+    await storage.stop()
+
+
+@pytest.mark.asyncio
+async def test_failed_writes_are_retried_then_left_unmarked(monkeypatch):
+    """Test a transient failure is retried and a persistent one is not marked stored."""
+    monkeypatch.setattr("app.services.frame_storage.asyncio.sleep", _no_sleep(asyncio.sleep))
+    backend = SlowBackend(delay=0, fail=1)
+    marker = RecordingMarker()
+    storage = FrameStorage(backend=backend, workers=1, max_size=10, retries=1, mark_interval_ms=10, marker=marker)
+    storage.start()
+    storage.put(1, "a.jpg", b"a")
+    await storage.stop()
+
+    assert marker.ids == [1]
+    assert storage.retried == 1
+
+    backend.fail = 5
+    marker.batches.clear()
+    storage.start()
+    storage.put(2, "b.jpg", b"b")
+    await storage.stop()
+
+    assert marker.ids == []
+    assert storage.failed == 1
+
+
+def _no_sleep(sleep):
+    async def short_sleep(delay):
+        await sleep(min(delay, 0.01))
+
+    return short_sleep
+
+
+def test_local_backend_writes_under_root(tmp_path):
+    """Test the local backend writes the frame at its path and refuses paths outside the root."""
+    backend = LocalFrameBackend(str(tmp_path))
+    backend.write("frames/vehicle_1/a.jpg", b"jpeg")
+
+    assert (tmp_path / "frames" / "vehicle_1" / "a.jpg").read_bytes() == b"jpeg"
+    with pytest.raises(ValueError):
+        backend.write("../escape.jpg", b"jpeg")
+
+
+def test_s3_backend_puts_object_at_archive_path():
+    """Test the S3 backend keys objects by the archive path."""
+    client = FakeS3Client()
+    S3FrameBackend(bucket="frames", client=client).write("frames/vehicle_1/a.jpg", b"jpeg")
+
+    assert client.objects == {("frames", "frames/vehicle_1/a.jpg"): b"jpeg"}
+
+
+def test_local_backend_reads_byte_ranges(tmp_path):
+    """Test a stored file can be read back whole or by inclusive byte range."""
+    backend = LocalFrameBackend(str(tmp_path))
+    backend.write("segments/a.mjpeg", b"0123456789")
+
+    assert backend.read("segments/a.mjpeg") == b"0123456789"
+    assert backend.read("segments/a.mjpeg", 2, 5) == b"2345"
+    with pytest.raises(FileNotFoundError):
+        backend.read("segments/missing.mjpeg")
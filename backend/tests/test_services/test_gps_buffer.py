@@ -0,0 +1,223 @@
+"""
+Tests for the GPS write-behind buffer.
+"""
+import asyncio
+from datetime import datetime
+
+import pytest
+
+from app.services.gps_buffer import GPSWriteBuffer, BufferFullError, to_record
+
+
+def make_row(vehicle_id: int = 1) -> dict:
+    """Build a minimal gps_locations row."""
+    return {
+        "vehicle_id": vehicle_id,
+        "latitude": 40.7128,
+        "longitude": -74.0060,
+        "speed": 30.0,
+        "heading": 90.0,
+        "timestamp": datetime.utcnow(),
+    }
+
+
+class RecordingWriter:
+    """Writer that records the batches it receives."""
+
+    def __init__(self, delay: float = 0):
+        self.batches = []
+        self.delay = delay
+
+    async def __call__(self, records):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        self.batches.append(list(records))
+
+
+@pytest.mark.asyncio
+async def test_flush_when_row_limit_reached():
+    """Test a batch is flushed as soon as flush_rows fixes are queued."""
+    writer = RecordingWriter()
+    buffer = GPSWriteBuffer(max_size=100, flush_interval_ms=10_000, flush_rows=5, writer=writer)
+    buffer.start()
+
+    for _ in range(5):
+        buffer.put(make_row())
+    await asyncio.sleep(0.05)
+
+    assert len(writer.batches) == 1
+    assert len(writer.batches[0]) == 5
+    # Heading is converted to the integer column type
+    assert writer.batches[0][0][4] == 90
+
+    await buffer.stop()
+
+
+@pytest.mark.asyncio
+async def test_flush_after_interval():
+    """Test a partial batch is flushed once the interval elapses."""
+    writer = RecordingWriter()
+    buffer = GPSWriteBuffer(max_size=100, flush_interval_ms=20, flush_rows=1000, writer=writer)
+    buffer.start()
+
+    buffer.put(make_row())
+    buffer.put(make_row(2))
+    await asyncio.sleep(0.1)
+
+    assert [len(batch) for batch in writer.batches] == [2]
+    await buffer.stop()
+
+
+@pytest.mark.asyncio
+async def test_backpressure_when_full():
+    """Test the buffer rejects fixes once the queue is full."""
+    writer = RecordingWriter(delay=1)
+    buffer = GPSWriteBuffer(max_size=3, flush_interval_ms=10_000, flush_rows=1000, writer=writer)
+    buffer.start()
+
+    assert buffer.put_many([make_row() for _ in range(5)]) == 3
+    with pytest.raises(BufferFullError):
+        buffer.put(make_row())
+    assert buffer.get_stats()["rejected"] == 3
+
+    writer.delay = 0
+    await buffer.stop()
+
+
+@pytest.mark.asyncio
+async def test_stop_drains_queue():
+    """Test stopping the buffer flushes every queued fix."""
+    writer = RecordingWriter()
+    buffer = GPSWriteBuffer(max_size=1000, flush_interval_ms=10_000, flush_rows=100, writer=writer)
+    buffer.start()
+
+    for _ in range(250):
+        buffer.put(make_row())
+    await buffer.stop()
+
+    assert sum(len(batch) for batch in writer.batches) == 250
+    assert buffer.get_stats()["flushed"] == 250
+    assert not buffer.running
+    with pytest.raises(RuntimeError):
+        buffer.put(make_row())
+
+
+class FlakyWriter(RecordingWriter):
+    """Writer that fails a number of times before it starts recording batches."""
+
+    def __init__(self, failures: int):
+        super().__init__()
+        self.failures = failures
+
+    async def __call__(self, records):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("database restarting")
+        await super().__call__(records)
+
+
+@pytest.mark.asyncio
+async def test_failed_flush_is_retried(tmp_path):
+    """Test a batch that fails once is written by the next attempt instead of dropped."""
+    writer = FlakyWriter(failures=1)
+    buffer = GPSWriteBuffer(
+        max_size=100, flush_interval_ms=10, flush_rows=1000, writer=writer,
+        retries=3, spill_path=str(tmp_path), backoff_s=0.01,
+    )
+    buffer.start()
+    buffer.put(make_row())
+    await buffer.stop()
+
+    assert [len(batch) for batch in writer.batches] == [1]
+    assert buffer.get_stats()["failed"] == 0
+    assert not buffer.failing
+
+
+@pytest.mark.asyncio
+async def test_unwritable_batch_is_spilled_and_replayed(tmp_path):
+    """Test a batch the database keeps refusing is spilled to disk, refused fixes get 503, and it is replayed later."""
+    writer = FlakyWriter(failures=2)
+    buffer = GPSWriteBuffer(
+        max_size=100, flush_interval_ms=10, flush_rows=1000, writer=writer,
+        retries=2, spill_path=str(tmp_path), backoff_s=0.01,
+    )
+    buffer.start()
+    buffer.put(make_row(7))
+    await asyncio.sleep(0.05)
+
+    assert buffer.failing
+    assert buffer.get_stats()["spilled"] == 1
+    with pytest.raises(BufferFullError):
+        buffer.put(make_row())
+
+    # The database is back: the spill is replayed and ingest resumes
+    for _ in range(50):
+        if not buffer.failing:
+            break
+        await asyncio.sleep(0.01)
+    assert not buffer.failing
+    assert list(tmp_path.iterdir()) == []
+    assert writer.batches[0][0][0] == 7
+    assert isinstance(writer.batches[0][0][8], datetime)
+    buffer.put(make_row())
+    await buffer.stop()
+    assert buffer.get_stats()["replayed"] == 1
+
+
+def test_heading_is_stored_as_whole_degrees():
+    """Test headings are rounded into the integer column range the same way on every path."""
+    from app.services.gps_buffer import heading_degrees, to_record
+
+    assert heading_degrees(90.4) == 90
+    assert heading_degrees(359.6) == 0
+    assert heading_degrees(None) is None
+    assert to_record({**make_row(), "heading": heading_degrees(180.7)})[4] == 181
+
+
+@pytest.mark.asyncio
+async def test_workers_sharing_a_spill_directory_replay_each_file_once(tmp_path):
+    """Test concurrent replays claim files so no batch is written twice, and bad files are set aside."""
+    writers = [RecordingWriter(delay=0.01), RecordingWriter(delay=0.01)]
+    buffers = [GPSWriteBuffer(writer=w, spill_path=str(tmp_path)) for w in writers]
+    for vehicle_id in range(1, 6):
+        buffers[0]._spill([to_record(make_row(vehicle_id))])
+    (tmp_path / "gps-0.json").write_text("[[1, 40.7")  # Truncated by a crash
+
+    assert all(await asyncio.gather(*(buffer._replay() for buffer in buffers)))
+
+    written = sorted(batch[0][0] for writer in writers for batch in writer.batches)
+    assert written == [1, 2, 3, 4, 5]
+    assert [p.name for p in tmp_path.iterdir()] == ["gps-0.json.bad"]
+
+
+@pytest.mark.asyncio
+async def test_failed_replay_gives_the_file_back(tmp_path):
+    """Test a spill file whose replay fails is left under its original name for the next attempt."""
+    buffer = GPSWriteBuffer(writer=FlakyWriter(failures=1), spill_path=str(tmp_path))
+    buffer._spill([to_record(make_row())])
+    name = next(tmp_path.iterdir()).name
+
+    assert not await buffer._replay()
+    assert [p.name for p in tmp_path.iterdir()] == [name]
+    assert await buffer._replay()
+    assert list(tmp_path.iterdir()) == []
+
+
+@pytest.mark.asyncio
+async def test_crashed_flush_task_stops_buffering(tmp_path):
+    """Test a flush task that dies marks the buffer not running and spills what was queued."""
+    buffer = GPSWriteBuffer(max_size=100, flush_interval_ms=10, spill_path=str(tmp_path))
+
+    async def broken():
+        await asyncio.sleep(0.01)
+        raise OSError("disk gone")
+
+    buffer._collect = broken
+    buffer.start()
+    buffer.put(make_row(3))
+    await asyncio.sleep(0.05)
+
+    assert not buffer.running
+    assert buffer.get_stats()["spilled"] == 1
+    assert len(list(tmp_path.iterdir())) == 1
+    await buffer.stop()
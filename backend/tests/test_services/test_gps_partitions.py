@@ -0,0 +1,99 @@
+"""
+Tests for gps_locations partition naming and bounds.
+"""
+from datetime import date, datetime, timedelta
+
+import pytest
+from pydantic import ValidationError
+
+from app.schemas.tracking import GPSLocationCreate
+from app.services.gps_partitions import create_partition, partition_bounds, partition_ddl, period_start
+
+
+class FakeResult:
+    def __init__(self, value):
+        self.value = value
+
+    def scalar(self):
+        return self.value
+
+
+class FakeConnection:
+    """Records statements; the default partition holds `stray` rows in any range."""
+
+    def __init__(self, stray: int):
+        self.stray = stray
+        self.statements = []
+
+    async def execute(self, statement, params=None):
+        sql = str(statement)
+        self.statements.append(sql)
+        if sql.startswith("SELECT to_regclass"):
+            return FakeResult("gps_locations_default")
+        if sql.startswith("SELECT count(*)"):
+            return FakeResult(self.stray)
+        return FakeResult(None)
+
+
+def test_daily_partition_bounds():
+    """Test a daily partition covers exactly one day."""
+    name, start, end = partition_bounds(date(2024, 12, 10), "day")
+    assert name == "gps_locations_p20241210"
+    assert start == date(2024, 12, 10)
+    assert end == date(2024, 12, 11)
+
+
+def test_weekly_partition_starts_on_monday():
+    """Test weekly partitions are aligned to Mondays."""
+    # 2024-12-12 is a Thursday
+    name, start, end = partition_bounds(date(2024, 12, 12), "week")
+    assert name == "gps_locations_p20241209"
+    assert start == date(2024, 12, 9)
+    assert end == date(2024, 12, 16)
+
+
+def test_partition_ddl():
+    """Test the generated CREATE statement."""
+    ddl = partition_ddl(date(2024, 12, 31), "day")
+    assert "gps_locations_p20241231 PARTITION OF gps_locations" in ddl
+    assert "FROM ('2024-12-31') TO ('2025-01-01')" in ddl
+
+
+def test_unknown_interval():
+    """Test an unsupported interval is rejected."""
+    with pytest.raises(ValueError):
+        period_start(date(2024, 12, 10), "month")
+
+
+@pytest.mark.asyncio
+async def test_create_partition_moves_rows_out_of_default_partition():
+    """Test stray rows in the new range are parked, the partition created, then the rows reinserted."""
+    conn = FakeConnection(stray=3)
+    assert await create_partition(conn, date(2024, 12, 10), "day") == 3
+
+    steps = [sql.split(" (")[0] for sql in conn.statements[2:]]
+    assert steps == [
+        "CREATE TEMP TABLE gps_locations_p20241210_moved",
+        "WITH rows AS",
+        "CREATE TABLE IF NOT EXISTS gps_locations_p20241210 PARTITION OF gps_locations FOR VALUES FROM",
+        "INSERT INTO gps_locations SELECT * FROM gps_locations_p20241210_moved",
+        "DROP TABLE gps_locations_p20241210_moved",
+    ]
+    assert "timestamp >= '2024-12-10' AND timestamp < '2024-12-11'" in conn.statements[3]
+
+    conn = FakeConnection(stray=0)
+    assert await create_partition(conn, date(2024, 12, 10), "day") == 0
+    assert conn.statements[2].startswith("CREATE TABLE IF NOT EXISTS")
+    assert len(conn.statements) == 3
+
+
+def test_fixes_outside_partitioned_range_are_rejected():
+    """Test device clocks far off in either direction are refused instead of filling the default partition."""
+    fix = {"vehicle_id": 1, "latitude": 40.7, "longitude": -74.0}
+    now = datetime.utcnow()
+
+    assert GPSLocationCreate(**fix, timestamp=now - timedelta(days=1)).timestamp == now - timedelta(days=1)
+    with pytest.raises(ValidationError, match="future"):
+        GPSLocationCreate(**fix, timestamp=now + timedelta(days=30))
+    with pytest.raises(ValidationError, match="retention"):
+        GPSLocationCreate(**fix, timestamp=now - timedelta(days=365))
@@ -0,0 +1,95 @@
+"""
+Tests for the last-known-position registry.
+"""
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.services.position_registry import PositionRegistry
+
+
+def make_row(vehicle_id: int, timestamp: datetime, lat: float = 40.7, lng: float = -74.0) -> dict:
+    """Build a minimal gps_locations row."""
+    return {"vehicle_id": vehicle_id, "latitude": lat, "longitude": lng, "timestamp": timestamp}
+
+
+def test_update_keeps_newest_fix():
+    """Test an older fix does not replace a newer one."""
+    registry = PositionRegistry()
+    now = datetime.utcnow()
+
+    assert registry.update(make_row(1, now, lat=40.0), location_id=10) is not None
+    assert registry.update(make_row(1, now - timedelta(seconds=5), lat=41.0)) is None
+
+    position = registry.get(1)
+    assert position.latitude == 40.0
+    assert position.id == 10
+    assert len(registry) == 1
+
+
+def test_update_normalizes_aware_timestamps():
+    """Test fixes with timezone-aware timestamps compare with naive UTC ones."""
+    from datetime import timezone
+
+    registry = PositionRegistry()
+    now = datetime.utcnow()
+    registry.update(make_row(1, now))
+    newer = (now + timedelta(seconds=1)).replace(tzinfo=timezone.utc)
+
+    position = registry.update(make_row(1, newer, lat=42.0))
+
+    assert position is not None
+    assert position.timestamp.tzinfo is None
+
+
+def test_snapshot_filters_by_age_and_sorts_newest_first():
+    """Test snapshot only returns recent positions, newest first."""
+    registry = PositionRegistry()
+    now = datetime.utcnow()
+    registry.update(make_row(1, now - timedelta(seconds=30)))
+    registry.update(make_row(2, now))
+    registry.update(make_row(3, now - timedelta(minutes=10)))
+
+    assert [p.vehicle_id for p in registry.snapshot(max_age_seconds=60)] == [2, 1]
+    assert len(registry.snapshot()) == 3
+
+
+def test_position_message_format():
+    """Test the WebSocket payload of a position."""
+    registry = PositionRegistry()
+    position = registry.update({**make_row(7, datetime(2024, 1, 1, 12)), "speed": 30, "heading": 90})
+
+    assert position.to_message() == {
+        "id": None,
+        "vehicle_id": 7,
+        "latitude": 40.7,
+        "longitude": -74.0,
+        "speed": 30.0,
+        "heading": 90.0,
+        "timestamp": "2024-01-01T12:00:00",
+    }
+
+
+@pytest.mark.asyncio
+async def test_nearest_confirmed_widens_until_a_candidate_is_accepted():
+    """Test only the nearest vehicles are confirmed, in growing batches, nearest accepted first."""
+    registry = PositionRegistry()
+    now = datetime.utcnow()
+    for vehicle_id in range(1, 21):
+        registry.update(make_row(vehicle_id, now, lat=40.0 + vehicle_id * 0.001, lng=-74.0))
+    batches = []
+
+    async def confirm(vehicle_ids):
+        batches.append(vehicle_ids)
+        return {vehicle_id: f"driver-{vehicle_id}" for vehicle_id in vehicle_ids if vehicle_id in (6, 15)}
+
+    assert await registry.nearest_confirmed(40.0, -74.0, confirm, k=4) == (6, "driver-6")
+    assert batches == [[1, 2, 3, 4], list(range(5, 21))]
+
+    async def nobody(vehicle_ids):
+        batches.append(vehicle_ids)
+        return {}
+
+    batches.clear()
+    assert await registry.nearest_confirmed(40.0, -74.0, nobody, k=8) is None
+    assert [len(batch) for batch in batches] == [8, 12]
@@ -0,0 +1,180 @@
+"""
+Tests for packing uploaded frames into archive segments.
+"""
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.schemas.video import FrameSegment, FrameUploadResponse, VideoArchiveResponse
+from app.services.frame_storage import FrameStorage
+from app.services.segmenter import Segmenter, frame_at
+
+START = datetime(2024, 1, 1, 12, 0, 0)
+
+
+class RecordingSink:
+    def __init__(self):
+        self.segments = []
+
+    async def __call__(self, segment):
+        self.segments.append(segment)
+
+
+class MemoryBackend:
+    def __init__(self):
+        self.written = {}
+
+    def write(self, key: str, data: bytes):
+        self.written[key] = data
+
+
+def jpeg(n: int, size: int = 100) -> bytes:
+    return b"\xff\xd8" + bytes([n]) * (size - 4) + b"\xff\xd9"
+
+
+@pytest.mark.asyncio
+async def test_frames_are_packed_into_fixed_duration_segments():
+    """Test one segment per duration with the frames concatenated and indexed by time."""
+    sink = RecordingSink()
+    segmenter = Segmenter(seconds=60, sink=sink)
+
+    for second in range(150):
+        segmenter.add(1, "FRONT", jpeg(second % 256), START + timedelta(seconds=second), device_id="ESP32_001")
+    await segmenter.stop()
+
+    assert [len(s.index) for s in sink.segments] == [60, 60, 30]
+    first = sink.segments[0]
+    assert first.duration == 59
+    assert first.size == 6000
+    assert first.path == "segments/vehicle_1/FRONT/20240101_120000_000000.mjpeg"
+    assert first.index[10] == [10000, 1000, 100]
+    payload = first.payload()
+    assert payload[1000:1100] == jpeg(10)
+    assert first.metadata()["frames"] == 60
+    assert segmenter.get_stats()["closed"] == 3
+
+
+@pytest.mark.asyncio
+async def test_cameras_and_trips_get_separate_segments():
+    """Test frames of different cameras and trips never share a segment."""
+    sink = RecordingSink()
+    segmenter = Segmenter(seconds=60, sink=sink)
+
+    segmenter.add(1, "FRONT", jpeg(1), START)
+    segmenter.add(1, "CABIN", jpeg(2), START)
+    segmenter.add(1, "FRONT", jpeg(3), START, trip_id=9)
+    await segmenter.stop()
+
+    keys = sorted((s.camera_position, s.trip_id or 0) for s in sink.segments)
+    assert keys == [("CABIN", 0), ("FRONT", 0), ("FRONT", 9)]
+
+
+@pytest.mark.asyncio
+async def test_sweep_closes_segments_of_quiet_cameras():
+    """Test a segment is archived once it is a segment long, without waiting for a newer frame."""
+    sink = RecordingSink()
+    segmenter = Segmenter(seconds=60, sink=sink)
+    segmenter.add(1, "FRONT", jpeg(1), START)
+
+    segmenter.sweep(START + timedelta(seconds=30))
+    await asyncio.sleep(0)
+    assert sink.segments == []
+
+    segmenter.sweep(START + timedelta(seconds=60))
+    await asyncio.sleep(0)
+    assert len(sink.segments) == 1
+    assert segmenter.open == {}
+
+
+@pytest.mark.asyncio
+async def test_memory_budget_closes_largest_segment_early():
+    """Test open segments over the budget are archived early, largest first."""
+    sink = RecordingSink()
+    segmenter = Segmenter(seconds=60, memory_bytes=1000, sink=sink)
+
+    for i in range(10):
+        segmenter.add(1, "FRONT", jpeg(i), START + timedelta(seconds=i))
+    segmenter.add(2, "FRONT", jpeg(9), START)
+    await asyncio.sleep(0)
+
+    assert [s.vehicle_id for s in sink.segments] == [1]
+    assert segmenter.bytes == 100
+    assert segmenter.closed_early == 1
+    await segmenter.stop()
+
+
+@pytest.mark.asyncio
+async def test_failed_archive_is_counted_and_does_not_block():
+    """Test a failing sink is logged and later segments are still archived."""
+    calls = []
+
+    async def sink(segment):
+        calls.append(segment)
+        if len(calls) == 1:
+            raise RuntimeError("database down")
+
+    segmenter = Segmenter(seconds=1, sink=sink)
+    segmenter.add(1, "FRONT", jpeg(1), START)
+    segmenter.add(1, "FRONT", jpeg(2), START + timedelta(seconds=1))
+    await segmenter.stop()
+
+    assert len(calls) == 2
+    assert segmenter.failed == 1
+
+
+def test_frame_at_seeks_to_last_frame_at_or_before_time():
+    """Test seeking picks the frame on screen at the requested offset."""
+    index = [[0, 0, 100], [1000, 100, 120], [2500, 220, 90]]
+
+    assert frame_at(index, 0) == [0, 0, 100]
+    assert frame_at(index, 0.999) == [0, 0, 100]
+    assert frame_at(index, 1) == [1000, 100, 120]
+    assert frame_at(index, 2.4) == [1000, 100, 120]
+    assert frame_at(index, 99) == [2500, 220, 90]
+
+
+@pytest.mark.asyncio
+async def test_stop_before_frame_storage_writes_open_segments():
+    """Test the shutdown order of the lifespan: open segments are queued and written before storage stops."""
+    backend = MemoryBackend()
+    stored = []
+
+    async def marker(archive_ids):
+        stored.extend(archive_ids)
+
+    storage = FrameStorage(backend=backend, workers=2, max_size=10, mark_interval_ms=10, marker=marker)
+    storage.start()
+    ids = iter(range(1, 10))
+
+    async def sink(segment):
+        storage.put(next(ids), segment.path, segment.payload())
+
+    segmenter = Segmenter(seconds=60, sink=sink)
+    front = segmenter.add(1, "FRONT", jpeg(1), START)
+    cabin = segmenter.add(1, "CABIN", jpeg(2), START)
+
+    await segmenter.stop()
+    await storage.stop()
+
+    assert backend.written == {front.path: jpeg(1), cabin.path: jpeg(2)}
+    assert sorted(stored) == [1, 2]
+
+
+def test_upload_response_keeps_archive_fields():
+    """Test the upload response has every archive field, with the frame's place in the segment added."""
+    segmenter = Segmenter(seconds=60, sink=RecordingSink())
+    segmenter.add(1, "FRONT", jpeg(1), START)
+    segment = segmenter.add(1, "FRONT", jpeg(2), START + timedelta(seconds=1), device_id="ESP32_001")
+
+    response = FrameUploadResponse(
+        vehicle_id=1, camera_position=segment.camera_position, file_path=segment.path,
+        file_size=segment.size, duration=segment.duration, extra_metadata=segment.metadata(index=False),
+        created_at=START, retention_until=segment.retention_until,
+        segment=FrameSegment(path=segment.path, frame=1, offset=100, size=100),
+    ).model_dump()
+
+    assert set(VideoArchiveResponse.model_fields) <= set(response)
+    assert response["id"] is None
+    assert response["metadata"]["frames"] == 2 and "index" not in response["metadata"]
+    assert response["segment"] == {"path": segment.path, "frame": 1, "offset": 100, "size": 100}
@@ -0,0 +1,94 @@
+"""
+Tests for the spatial grid index.
+"""
+import random
+
+from app.services.spatial_index import BoxIndex, GridIndex, haversine_km
+
+
+def brute_force(points: dict, lat: float, lng: float) -> list:
+    """Reference result: every point with its distance, nearest first."""
+    return sorted(
+        ((key, haversine_km(lat, lng, p[0], p[1])) for key, p in points.items()),
+        key=lambda hit: hit[1]
+    )
+
+
+def make_points(count: int, seed: int = 42) -> dict:
+    """Random points around New York."""
+    rng = random.Random(seed)
+    return {
+        key: (40.7 + rng.uniform(-0.3, 0.3), -74.0 + rng.uniform(-0.3, 0.3))
+        for key in range(count)
+    }
+
+
+def test_haversine_known_distance():
+    """Test haversine against a known distance (JFK to LAX ~3974 km)."""
+    assert abs(haversine_km(40.6413, -73.7781, 33.9416, -118.4085) - 3974) < 5
+
+
+def test_nearest_matches_brute_force():
+    """Test k-nearest results match an exhaustive search."""
+    points = make_points(2000)
+    index = GridIndex(cell_size_deg=0.01)
+    for key, (lat, lng) in points.items():
+        index.upsert(key, lat, lng)
+
+    for lat, lng in [(40.7, -74.0), (40.95, -73.75), (41.5, -74.0)]:
+        expected = [key for key, _ in brute_force(points, lat, lng)[:5]]
+        assert [key for key, _ in index.nearest(lat, lng, k=5)] == expected
+
+
+def test_within_radius_matches_brute_force():
+    """Test radius results match an exhaustive search, nearest first."""
+    points = make_points(2000)
+    index = GridIndex(cell_size_deg=0.01)
+    for key, (lat, lng) in points.items():
+        index.upsert(key, lat, lng)
+
+    expected = [hit for hit in brute_force(points, 40.7, -74.0) if hit[1] <= 3.0]
+    hits = index.within_radius(40.7, -74.0, 3.0)
+
+    assert [key for key, _ in hits] == [key for key, _ in expected]
+    assert all(distance <= 3.0 for _, distance in hits)
+
+
+def test_predicate_and_moves():
+    """Test moving and removing keys, and filtering with a predicate."""
+    index = GridIndex(cell_size_deg=0.01)
+    index.upsert("a", 40.70, -74.00)
+    index.upsert("b", 40.71, -74.00)
+    index.upsert("c", 40.90, -74.00)
+
+    assert index.nearest(40.70, -74.00, k=1)[0][0] == "a"
+    assert index.nearest(40.70, -74.00, k=1, predicate=lambda key: key != "a")[0][0] == "b"
+
+    index.upsert("c", 40.70, -74.001)
+    index.remove("a")
+
+    assert index.nearest(40.70, -74.00, k=1)[0][0] == "c"
+    assert "a" not in index
+    assert len(index) == 2
+    assert index.nearest(40.70, -74.00, k=1, max_radius_km=0.01) == []
+
+
+def test_box_index_containing_matches_brute_force():
+    """Test point-in-box lookups match checking every box, including oversized ones."""
+    rng = random.Random(11)
+    index = BoxIndex(cell_size_deg=0.05, max_cells=50)
+    boxes = {}
+    for key in range(200):
+        lat, lng = 40.7 + rng.uniform(-0.3, 0.3), -74.0 + rng.uniform(-0.3, 0.3)
+        size = rng.choice([0.01, 0.05, 0.2, 1.0])
+        boxes[key] = (lat, lng, lat + size, lng + size)
+        index.upsert(key, boxes[key])
+    index.remove(0)
+    del boxes[0]
+
+    for _ in range(200):
+        lat, lng = 40.7 + rng.uniform(-0.4, 0.6), -74.0 + rng.uniform(-0.4, 0.6)
+        expected = {
+            key for key, (a, b, c, d) in boxes.items() if a <= lat <= c and b <= lng <= d
+        }
+        assert index.containing(lat, lng) == expected
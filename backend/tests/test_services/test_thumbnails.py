@@ -0,0 +1,113 @@
+"""
+Tests for preview rendering.
+"""
+import asyncio
+import io
+
+import pytest
+from PIL import Image
+
+from app.services.blob_store import BlobNotFound, LocalBlobStore
+from app.services.thumbnails import Thumbnailer, preview_key, preview_url, render
+from app.websocket.frames import VideoFrame
+
+
+def make_jpeg(width: int = 640, height: int = 480) -> bytes:
+    out = io.BytesIO()
+    Image.new("RGB", (width, height), (200, 40, 40)).save(out, "JPEG", quality=90)
+    return out.getvalue()
+
+
+def dimensions(jpeg: bytes):
+    with Image.open(io.BytesIO(jpeg)) as image:
+        return image.size
+
+
+class RecordingUpdater:
+    def __init__(self):
+        self.calls = []
+
+    async def __call__(self, archive_id, url):
+        self.calls.append((archive_id, url))
+
+
+def test_render_keeps_aspect_ratio_and_never_upscales():
+    """Test each preview has the requested width and is smaller than the source."""
+    jpeg = make_jpeg(640, 480)
+    previews = render(jpeg, [160, 320, 1024], 70)
+
+    assert dimensions(previews[160]) == (160, 120)
+    assert dimensions(previews[320]) == (320, 240)
+    assert dimensions(previews[1024]) == (640, 480)
+    assert len(previews[160]) < len(previews[320]) < len(jpeg)
+
+
+@pytest.mark.asyncio
+async def test_preview_renders_once_on_demand(tmp_path):
+    """Test a missing preview is rendered from the stored source and reused afterwards."""
+    store = LocalBlobStore(str(tmp_path))
+    thumbnailer = Thumbnailer(widths=[160, 320], store=store)
+    source, _ = await store.put(make_jpeg())
+
+    keys = await asyncio.gather(*(thumbnailer.preview(source, 160) for _ in range(3)))
+    assert keys == [preview_key(source, 160)] * 3
+    assert dimensions(await store.get(keys[0])) == (160, 120)
+    # Every width is stored by the same render
+    assert await store.exists(preview_key(source, 320))
+
+    await thumbnailer.preview(source, 320)
+    assert thumbnailer.rendered == 1
+
+    with pytest.raises(ValueError):
+        await thumbnailer.preview(source, 200)
+    with pytest.raises(BlobNotFound):
+        await thumbnailer.preview("0" * 64, 160)
+
+
+@pytest.mark.asyncio
+async def test_submitted_uploads_are_rendered_in_worker_processes(tmp_path):
+    """Test queued previews are stored in the background and the archive is pointed at its thumbnail."""
+    store = LocalBlobStore(str(tmp_path))
+    updater = RecordingUpdater()
+    thumbnailer = Thumbnailer(widths=[160, 320], processes=1, store=store, archive_updater=updater)
+    thumbnailer.start()
+    source, _ = await store.put(make_jpeg())
+
+    assert thumbnailer.submit(source, make_jpeg(), archive_id=7)
+    for _ in range(200):
+        if updater.calls:
+            break
+        await asyncio.sleep(0.02)
+    await thumbnailer.stop()
+
+    assert updater.calls == [(7, preview_url(source, 160))]
+    assert dimensions(await store.get(preview_key(source, 320))) == (320, 240)
+    assert not thumbnailer.submit(source, make_jpeg())
+
+
+@pytest.mark.asyncio
+async def test_full_queue_drops_background_work(tmp_path):
+    """Test uploads beyond the queue size are dropped rather than waited for."""
+    thumbnailer = Thumbnailer(widths=[160], max_size=1, store=LocalBlobStore(str(tmp_path)))
+    thumbnailer._queue = asyncio.Queue(maxsize=1)
+    thumbnailer._tasks = [asyncio.create_task(asyncio.sleep(10))]
+
+    assert thumbnailer.submit("a" * 64, b"jpeg")
+    assert not thumbnailer.submit("b" * 64, b"jpeg")
+    assert thumbnailer.get_stats()["dropped"] == 1
+
+    thumbnailer._tasks[0].cancel()
+
+
+@pytest.mark.asyncio
+async def test_live_frame_preview_is_kept_on_the_frame():
+    """Test a live frame is rendered once and its JSON message carries the preview."""
+    thumbnailer = Thumbnailer(widths=[160, 320])
+    frame = VideoFrame("taxi-01", 1, make_jpeg(), "2024-01-01T12:00:00")
+
+    await asyncio.gather(thumbnailer.frame_preview(frame, 160), thumbnailer.frame_preview(frame, 320))
+
+    assert thumbnailer.rendered == 1
+    message = frame.as_dict(160)
+    assert message["size"] == len(frame.previews[160])
+    assert frame.as_dict()["size"] == len(frame.jpeg)
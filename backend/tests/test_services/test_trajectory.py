@@ -0,0 +1,96 @@
+"""
+Tests for trajectory simplification.
+"""
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import numpy as np
+
+from app.services.trajectory import TraceSimplifier, segment_distances, simplify, to_local_xy
+
+
+def make_rows(lats, lngs, start=datetime(2024, 12, 1, 8, 0)):
+    """Rows shaped like the history query results, one per second."""
+    return [
+        SimpleNamespace(latitude=lat, longitude=lng, speed=30.0, heading=None,
+                        timestamp=start + timedelta(seconds=i))
+        for i, (lat, lng) in enumerate(zip(lats, lngs))
+    ]
+
+
+def test_straight_line_keeps_endpoints():
+    """Test collinear points collapse to the two endpoints."""
+    xy = np.column_stack((np.linspace(0, 1000, 50), np.zeros(50)))
+    assert simplify(xy, tolerance_m=1.0).tolist() == [0, 49]
+
+
+def test_corner_is_kept():
+    """Test an L-shaped trace keeps its corner."""
+    xy = np.array([[0, 0], [500, 0], [1000, 0], [1000, 500], [1000, 1000]], dtype=float)
+    assert simplify(xy, tolerance_m=1.0).tolist() == [0, 2, 4]
+
+
+def test_max_points_budget():
+    """Test the point budget is respected and keeps the largest deviations."""
+    rng = np.random.default_rng(1)
+    xy = np.column_stack((np.arange(1000, dtype=float), rng.normal(0, 10, 1000)))
+    xy[500, 1] = 10_000  # A spike that must survive
+    kept = simplify(xy, max_points=20)
+    assert len(kept) == 20
+    assert 500 in kept
+
+
+def test_segment_distance_clamps_to_endpoints():
+    """Test points beyond a segment are measured to its nearest endpoint."""
+    distances = segment_distances(np.array([[-3.0, 4.0]]), np.array([0.0, 0.0]), np.array([10.0, 0.0]))
+    assert distances[0] == 5.0
+
+
+def test_chunked_matches_tolerance():
+    """Test chunked simplification stays within tolerance of every input point."""
+    t = np.linspace(0, 4 * np.pi, 5000)
+    lats = 40.70 + 0.01 * np.sin(t)
+    lngs = -74.00 + 0.002 * t
+    rows = make_rows(lats, lngs)
+
+    simplifier = TraceSimplifier(tolerance_m=5.0)
+    for start in range(0, len(rows), 700):
+        simplifier.add(rows[start:start + 700])
+    points = simplifier.finish()
+
+    assert simplifier.total_points == 5000
+    assert 2 < len(points) < 500
+    assert points[0]["timestamp"] < points[-1]["timestamp"]
+    assert points[0]["heading"] is None
+
+    kept_lats = np.array([p["latitude"] for p in points])
+    kept_lngs = np.array([p["longitude"] for p in points])
+    xy = to_local_xy(np.concatenate((lats, kept_lats)), np.concatenate((lngs, kept_lngs)))
+    all_xy, kept_xy = xy[:len(lats)], xy[len(lats):]
+    nearest = np.min(
+        [segment_distances(all_xy, kept_xy[i], kept_xy[i + 1]) for i in range(len(kept_xy) - 1)],
+        axis=0,
+    )
+    assert nearest.max() <= 5.0 + 0.1  # Slack for per-chunk projection
+    assert len({p["timestamp"] for p in points}) == len(points)
+
+
+def test_point_budget_alone_bounds_retained_points():
+    """Test a max_points-only trace is compacted while streaming and still keeps its endpoints and spike."""
+    n = 20_000
+    lats = 40.70 + 0.0001 * np.random.default_rng(2).normal(size=n)
+    lats[12_345] = 40.80  # A spike that must survive
+    lngs = -74.00 + 0.00001 * np.arange(n)
+    rows = make_rows(lats, lngs)
+
+    simplifier = TraceSimplifier(max_points=50)
+    peak = 0
+    for start in range(0, n, 500):
+        simplifier.add(rows[start:start + 500])
+        peak = max(peak, simplifier.held_points)
+    points = simplifier.finish()
+
+    assert peak < 4 * 50 + 500
+    assert len(points) == 50
+    assert points[0]["latitude"] == lats[0] and points[-1]["latitude"] == lats[-1]
+    assert max(p["latitude"] for p in points) == 40.80
@@ -0,0 +1,57 @@
+"""
+Tests for compact msgpack location frames.
+"""
+import msgpack
+
+from app.websocket.compact import CompactEncoder, pack_position
+
+
+def make_update(vehicle_id: int, lat: float, lng: float, second: int) -> dict:
+    return {"vehicle_id": vehicle_id, "latitude": lat, "longitude": lng, "speed": 31.25,
+            "heading": 90, "timestamp": f"2024-12-01T08:00:{second:02d}"}
+
+
+def apply(frames: list, state: dict) -> dict:
+    """Decode frames the way a client would, returning absolute positions by vehicle."""
+    for frame in frames:
+        message = msgpack.unpackb(frame)
+        if message["t"] == "k":
+            state[("base", message["v"][0])] = message["v"]
+            state[message["v"][0]] = message["v"]
+        elif message["t"] == "d":
+            vehicle_id, dlat, dlng, speed, heading, dts = message["v"]
+            base = state[("base", vehicle_id)]
+            state[vehicle_id] = [vehicle_id, base[1] + dlat, base[2] + dlng, speed, heading, base[5] + dts]
+    return state
+
+
+def test_keyframes_and_deltas_reconstruct_positions():
+    """Test a client decoding keyframes and deltas ends at the exact fixed-point positions."""
+    encoder = CompactEncoder(keyframe_every=3)
+    early, late = object(), object()
+    early_frames, late_frames, generations = [], [], []
+
+    for i in range(8):
+        update = make_update(7, 40.7128 + i * 0.0001, -74.006 - i * 0.0001, i)
+        generation, keyframe, delta = encoder.encode(update)
+        generations.append(generation)
+        for client, frames in ((early, early_frames), (late, late_frames)):
+            if client is late and i < 5:
+                continue  # Joins later: must get the current base before any delta
+            if encoder.needs_keyframe(client, 7, generation):
+                frames.append(keyframe)
+            if delta is not None:
+                frames.append(delta)
+
+    expected = pack_position(make_update(7, 40.7128 + 7 * 0.0001, -74.006 - 7 * 0.0001, 7))
+    assert apply(early_frames, {})[7] == expected
+    assert apply(late_frames, {})[7] == expected
+    assert generations == [0, 0, 0, 0, 1, 1, 1, 1]
+
+
+def test_delta_frames_are_small():
+    """Test a delta frame is a fraction of the JSON update size."""
+    encoder = CompactEncoder()
+    encoder.encode(make_update(1, 40.7128, -74.006, 0))
+    _, _, delta = encoder.encode(make_update(1, 40.7129, -74.0061, 1))
+    assert len(delta) < 30
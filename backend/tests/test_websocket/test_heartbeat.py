@@ -0,0 +1,102 @@
+"""
+Tests for WebSocket heartbeats and connection limits.
+"""
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from app.config import settings
+from app.websocket.heartbeat import ConnectionLimits
+from app.websocket.outbound import ChannelGroup
+
+
+class FakeSocket:
+    """WebSocket stand-in with a peer address and a scripted inbound stream."""
+
+    def __init__(self, host: str = "10.0.0.1"):
+        self.client = SimpleNamespace(host=host)
+        self.frames = []
+        self.inbound = asyncio.Queue()
+        self.close_code = None
+
+    async def send_text(self, text: str):
+        self.frames.append(text)
+
+    async def receive_text(self) -> str:
+        return await self.inbound.get()
+
+    async def close(self, code: int = 1000):
+        self.close_code = code
+
+
+def test_connection_limits_cap_total_and_per_address(monkeypatch):
+    """Test connections beyond the per-address or global cap are refused until slots free up."""
+    monkeypatch.setattr(settings, "WS_MAX_CONNECTIONS", 3)
+    monkeypatch.setattr(settings, "WS_MAX_CONNECTIONS_PER_IP", 2)
+    limits = ConnectionLimits()
+    a1, a2, a3, b1, c1 = (FakeSocket(host) for host in ("a", "a", "a", "b", "c"))
+
+    assert limits.acquire(a1) and limits.acquire(a2)
+    assert not limits.acquire(a3)  # Per-address cap
+    assert limits.acquire(b1)
+    assert not limits.acquire(c1)  # Global cap
+
+    limits.release(a1)
+    limits.release(a1)
+    assert limits.acquire(a3)
+    assert limits.stats()["rejected"] == 2
+    assert limits.per_address == {"a": 2, "b": 1}
+
+
+class VanishingSocket(FakeSocket):
+    """Client that disconnects during the handshake."""
+
+    async def accept(self, subprotocol=None):
+        raise RuntimeError("client disconnected")
+
+
+@pytest.mark.asyncio
+async def test_failed_handshake_releases_its_slot(monkeypatch):
+    """Test a connection whose accept fails does not keep counting against the limits."""
+    limits = ConnectionLimits()
+    monkeypatch.setattr("app.websocket.outbound.connection_limits", limits)
+
+    assert not await ChannelGroup().admit(VanishingSocket("a"))
+    assert limits.stats()["connections"] == 0
+    assert limits.per_address == {}
+
+
+@pytest.mark.asyncio
+async def test_silent_clients_are_pinged_then_reaped():
+    """Test an idle client gets one ping, a pong keeps it, and silence past the timeout reaps it."""
+    group = ChannelGroup()
+    quiet, answering = FakeSocket(), FakeSocket()
+    closed = []
+    for socket in (quiet, answering):
+        group.open(socket, on_close=lambda ws: (closed.append(ws), group.close(ws)))
+
+    group.heartbeat(interval=0, timeout=0.05)
+    group.heartbeat(interval=0, timeout=0.05)  # Still unanswered: no second ping
+    await asyncio.sleep(0.01)
+    assert [json.loads(f)["type"] for f in quiet.frames] == ["ping"]
+
+    reader = asyncio.create_task(group.receive_text(answering))
+    answering.inbound.put_nowait('{"type":"pong"}')
+    answering.inbound.put_nowait('{"action":"subscribe"}')
+    assert await reader == '{"action":"subscribe"}'  # Pongs are consumed
+
+    await asyncio.sleep(0.05)
+    answering.inbound.put_nowait('{"type":"pong"}')
+    reader = asyncio.create_task(group.receive_text(answering))
+    await asyncio.sleep(0)
+    group.heartbeat(interval=0.04, timeout=0.02)
+    await asyncio.sleep(0.01)
+    reader.cancel()
+
+    assert closed == [quiet]
+    assert quiet.close_code == 1001
+    assert list(group.channels) == [answering]
+    assert group.stats()["reaped"] == 1
+    group.close(answering)
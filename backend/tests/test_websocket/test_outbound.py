@@ -0,0 +1,72 @@
+"""
+Tests for bounded outbound WebSocket queues.
+"""
+import asyncio
+import json
+
+import pytest
+
+from app.websocket.outbound import ChannelGroup, ClientChannel, encode
+
+
+class BlockedSocket:
+    """WebSocket whose sends wait until released."""
+
+    def __init__(self):
+        self.frames = []
+        self.release = asyncio.Event()
+        self.closed = False
+
+    async def send_text(self, text: str):
+        await self.release.wait()
+        self.frames.append(json.loads(text))
+
+    async def close(self, code: int = 1000):
+        self.closed = True
+
+
+def queued_types(channel: ClientChannel):
+    return [json.loads(payload)["type"] for payload, _ in channel.queue]
+
+
+@pytest.mark.asyncio
+async def test_drop_oldest_keeps_newest_updates():
+    """Test a full queue evicts the oldest location update, not trip events."""
+    group = ChannelGroup(max_size=3)
+    socket = BlockedSocket()
+    channel = group.open(socket)
+    await asyncio.sleep(0)
+
+    group.send_json(socket, {"type": "location_update", "n": 1})
+    await asyncio.sleep(0)  # Writer takes n=1 and blocks on the socket
+    group.send_json(socket, {"type": "trip_accepted", "n": 2})
+    group.send_json(socket, {"type": "location_update", "n": 3})
+    group.send_json(socket, {"type": "location_update", "n": 4})
+    group.send_json(socket, {"type": "location_update", "n": 5})
+
+    assert queued_types(channel) == ["trip_accepted", "location_update", "location_update"]
+    assert [json.loads(payload)["n"] for payload, _ in channel.queue] == [2, 4, 5]
+    assert group.stats()["dropped"] == 1
+    assert group.stats()["max_queue_depth"] == 3
+
+    socket.release.set()
+    await asyncio.sleep(0.01)
+    assert [frame["n"] for frame in socket.frames] == [1, 2, 4, 5]
+    assert group.stats()["sent"] == 4
+
+
+@pytest.mark.asyncio
+async def test_never_drop_overflow_closes_client():
+    """Test a queue full of trip events disconnects the client instead of dropping one."""
+    closed = []
+    group = ChannelGroup(max_size=2)
+    socket = BlockedSocket()
+    group.open(socket, on_close=closed.append)
+    await asyncio.sleep(0)
+
+    for n in range(4):
+        group.send(socket, encode({"type": "new_trip", "n": n}), "new_trip")
+    await asyncio.sleep(0.01)
+
+    assert closed == [socket]
+    assert socket.closed
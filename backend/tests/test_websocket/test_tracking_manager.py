@@ -0,0 +1,214 @@
+"""
+Tests for the tracking WebSocket connection manager.
+"""
+import asyncio
+import json
+
+import pytest
+
+from app.config import settings
+from app.websocket.tracking import ConnectionManager
+
+
+class FakeSocket:
+    """WebSocket stand-in that records frames and can stall or fail."""
+
+    def __init__(self, delay: float = 0, fail: bool = False):
+        self.delay = delay
+        self.fail = fail
+        self.frames = []
+        self.closed = False
+
+    async def send_text(self, text: str):
+        if self.fail:
+            raise RuntimeError("connection reset")
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        self.frames.append(text)
+
+    async def send_bytes(self, data: bytes):
+        await self.send_text(data)
+
+    async def close(self, code: int = 1000):
+        self.closed = True
+
+
+@pytest.mark.asyncio
+async def test_broadcast_sends_same_payload_to_all():
+    """Test every client receives the message, serialized once."""
+    manager = ConnectionManager()
+    sockets = [FakeSocket() for _ in range(3)]
+    for socket in sockets:
+        manager.register(socket)
+
+    manager.broadcast({"type": "location_update", "data": {"vehicle_id": 1}})
+    await asyncio.sleep(0.01)
+
+    assert all(len(socket.frames) == 1 for socket in sockets)
+    assert len({id(socket.frames[0]) for socket in sockets}) == 1
+    assert json.loads(sockets[0].frames[0])["data"]["vehicle_id"] == 1
+
+
+@pytest.mark.asyncio
+async def test_slow_and_failing_clients_are_dropped(monkeypatch):
+    """Test a stalled client never delays the broadcast and is dropped after the send timeout."""
+    monkeypatch.setattr(settings, "WS_SEND_TIMEOUT_MS", 50)
+    manager = ConnectionManager()
+    fast, slow, broken = FakeSocket(), FakeSocket(delay=5), FakeSocket(fail=True)
+    for socket in (fast, slow, broken):
+        manager.register(socket)
+
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    manager.broadcast({"type": "location_update", "data": {}})
+    assert loop.time() - started < 0.01
+
+    await asyncio.sleep(0.2)
+    assert manager.active_connections == {fast}
+    assert len(fast.frames) == 1
+    assert slow.closed
+    assert manager.get_stats()["connections"] == 1
+
+
+def update(vehicle_id: int, lat: float, lng: float) -> dict:
+    return {"type": "location_update", "data": {"vehicle_id": vehicle_id, "latitude": lat, "longitude": lng}}
+
+
+def received(socket: FakeSocket, message_type: str = "location_update") -> list:
+    messages = [json.loads(frame) for frame in socket.frames]
+    return [m["data"]["vehicle_id"] for m in messages if m["type"] == message_type]
+
+
+@pytest.mark.asyncio
+async def test_subscriptions_route_updates():
+    """Test vehicle and viewport subscribers only get their traffic; others get everything."""
+    manager = ConnectionManager()
+    everything, by_vehicle, by_area = FakeSocket(), FakeSocket(), FakeSocket()
+    for socket in (everything, by_vehicle, by_area):
+        manager.register(socket)
+
+    manager.handle_message(by_vehicle, json.dumps({"action": "subscribe", "vehicle_ids": [1]}))
+    manager.handle_message(by_area, json.dumps({
+        "action": "subscribe",
+        "bbox": {"min_lat": 40.70, "min_lng": -74.02, "max_lat": 40.72, "max_lng": -74.00},
+    }))
+
+    manager.publish_location(update(1, 40.80, -73.90))  # Vehicle 1, outside the area
+    manager.publish_location(update(2, 40.71, -74.01))  # Vehicle 2 enters the area
+    manager.publish_location(update(2, 40.75, -74.01))  # Leaves it: one last update
+    manager.publish_location(update(2, 40.76, -74.01))
+    await asyncio.sleep(0.01)
+
+    assert received(everything) == [1, 2, 2, 2]
+    assert received(by_vehicle) == [1]
+    assert received(by_area) == [2, 2]
+    subscribed = [json.loads(f) for f in by_area.frames if json.loads(f)["type"] == "subscribed"]
+    assert subscribed[0]["bbox"]["min_lat"] == 40.70
+
+
+@pytest.mark.asyncio
+async def test_unsubscribe_and_invalid_messages():
+    """Test clearing all filters restores the full stream and bad messages get an error."""
+    manager = ConnectionManager()
+    socket = FakeSocket()
+    manager.register(socket)
+
+    manager.handle_message(socket, json.dumps({"action": "subscribe", "vehicle_ids": [5]}))
+    manager.publish_location(update(6, 40.7, -74.0))
+    manager.handle_message(socket, json.dumps({"action": "unsubscribe"}))
+    manager.publish_location(update(6, 40.7, -74.0))
+    manager.handle_message(socket, '{"action": "subscribe", "bbox": {"min_lat": 41, "min_lng": 0, '
+                                   '"max_lat": 40, "max_lng": 1}}')
+    manager.handle_message(socket, "not json")
+    await asyncio.sleep(0.01)
+
+    assert received(socket) == [6]
+    assert [json.loads(f)["type"] for f in socket.frames][-2:] == ["error", "error"]
+    assert socket in manager.unfiltered
+
+
+@pytest.mark.asyncio
+async def test_tick_mode_coalesces_newest_position_per_vehicle():
+    """Test a ticking client gets one batch with the newest fix of each vehicle."""
+    manager = ConnectionManager()
+    immediate, ticking, ticking_filtered = FakeSocket(), FakeSocket(), FakeSocket()
+    manager.register(immediate)
+    manager.register(ticking, tick_ms=60000)
+    manager.register(ticking_filtered, tick_ms=60000)
+    manager.handle_message(ticking_filtered, json.dumps({"action": "subscribe", "vehicle_ids": [2]}))
+
+    for lat in (40.70, 40.71, 40.72):
+        manager.publish_location(update(1, lat, -74.0))
+        manager.publish_location(update(2, lat, -73.9))
+    await asyncio.sleep(0.01)
+    assert len(received(immediate)) == 6
+    assert received(ticking) == []
+
+    manager.flush_tick(manager.tick_groups[60000])
+    await asyncio.sleep(0.01)
+
+    batches = [json.loads(f)["data"] for f in ticking.frames if json.loads(f)["type"] == "location_batch"]
+    assert len(batches) == 1
+    assert {(u["vehicle_id"], u["latitude"]) for u in batches[0]} == {(1, 40.72), (2, 40.72)}
+    filtered = [json.loads(f)["data"] for f in ticking_filtered.frames
+                if json.loads(f)["type"] == "location_batch"]
+    assert [[u["vehicle_id"] for u in batch] for batch in filtered] == [[2]]
+
+    manager.disconnect(ticking)
+    manager.disconnect(ticking_filtered)
+    assert manager.tick_groups == {}
+
+
+@pytest.mark.asyncio
+async def test_binary_clients_get_msgpack_frames():
+    """Test msgpack clients get a keyframe then deltas while JSON clients are unchanged."""
+    import msgpack
+
+    manager = ConnectionManager()
+    text_client, binary_client = FakeSocket(), FakeSocket()
+    manager.register(text_client)
+    manager.register(binary_client, binary=True)
+
+    for second in range(3):
+        message = update(4, 40.7 + second * 0.001, -74.0)
+        message["data"].update(speed=20.0, heading=0, timestamp=f"2024-12-01T08:00:0{second}")
+        manager.publish_location(message)
+    await asyncio.sleep(0.01)
+
+    assert received(text_client) == [4, 4, 4]
+    assert all(isinstance(frame, bytes) for frame in binary_client.frames)
+    assert [msgpack.unpackb(frame)["t"] for frame in binary_client.frames] == ["k", "d", "d"]
+
+
+@pytest.mark.asyncio
+async def test_reconnect_with_since_replays_missed_updates(monkeypatch):
+    """Test a client resuming from a buffered seq gets only later updates, else a snapshot."""
+    monkeypatch.setattr(settings, "WS_REPLAY_BUFFER_SIZE", 3)
+    manager = ConnectionManager()
+    watcher = FakeSocket()
+    manager.register(watcher)
+    for vehicle_id in range(1, 5):
+        manager.publish_location(update(vehicle_id, 40.7, -74.0))
+    await asyncio.sleep(0.01)
+    assert [json.loads(frame)["seq"] for frame in watcher.frames] == [1, 2, 3, 4]
+
+    resumed, stale, ahead, other = FakeSocket(), FakeSocket(), FakeSocket(), FakeSocket()
+    for socket, since, epoch in (
+        (resumed, 2, manager.epoch), (stale, 0, manager.epoch), (ahead, 9, manager.epoch), (other, 2, "0" * 8),
+    ):
+        manager.register(socket)
+        manager.resume(socket, since, epoch)
+    await asyncio.sleep(0.01)
+
+    replay = json.loads(resumed.frames[0])
+    assert replay["type"] == "replay"
+    assert replay["seq"] == 4
+    assert replay["epoch"] == manager.epoch
+    assert [u["vehicle_id"] for u in replay["data"]] == [3, 4]
+    # Updates 1 and 2 fell out of the buffer; a restarted counter is behind the client
+    assert json.loads(stale.frames[0])["type"] == "snapshot"
+    assert json.loads(ahead.frames[0])["type"] == "snapshot"
+    # The same number counted by another worker or an earlier process means nothing here
+    snapshot = json.loads(other.frames[0])
+    assert snapshot["type"] == "snapshot"
+    assert snapshot["epoch"] == manager.epoch
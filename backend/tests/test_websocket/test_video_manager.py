@@ -0,0 +1,144 @@
+"""
+Tests for the video streaming WebSocket manager.
+"""
+import asyncio
+import json
+
+import pytest
+
+from app.websocket.frames import FRAME_HEADER, FrameStore
+from app.websocket.video import SUBPROTOCOL, VideoStreamManager
+
+JPEG = b"\xff\xd8\xff\xe0" + bytes(range(256)) * 4 + b"\xff\xd9"
+
+
+class FakeSocket:
+    def __init__(self, subprotocols=()):
+        self.scope = {"subprotocols": list(subprotocols)}
+        self.frames = []
+        self.subprotocol = None
+
+    async def accept(self, subprotocol=None):
+        self.subprotocol = subprotocol
+
+    async def send_text(self, text: str):
+        self.frames.append(json.loads(text))
+
+    async def send_bytes(self, data: bytes):
+        self.frames.append(data)
+
+    async def close(self, code: int = 1000):
+        pass
+
+
+def upload(manager: VideoStreamManager, route_id: str, second: int, trip_id=None):
+    return manager.broadcast_frame(route_id, JPEG, f"2024-12-01T08:00:{second:02d}", trip_id)
+
+
+@pytest.mark.asyncio
+async def test_frames_are_pushed_once_per_viewer_with_route_sequence():
+    """Test uploads reach each viewer of their route exactly once, and late viewers get the latest frame."""
+    manager = VideoStreamManager()
+    early, other_route = FakeSocket(), FakeSocket()
+    await manager.connect(early, "taxi-01")
+    await manager.connect(other_route, "taxi-02")
+
+    for second in range(3):
+        upload(manager, "taxi-01", second)
+    late = FakeSocket()
+    await manager.connect(late, "taxi-01")
+    await asyncio.sleep(0.01)
+
+    assert [(f["seq"], f["timestamp"]) for f in early.frames] == [
+        (1, "2024-12-01T08:00:00"), (2, "2024-12-01T08:00:01"), (3, "2024-12-01T08:00:02"),
+    ]
+    assert [f["seq"] for f in late.frames] == [3]
+    assert other_route.frames == []
+    assert manager.get_stats()["frames"]["frames"] == 3
+
+    for socket, route_id in ((early, "taxi-01"), (late, "taxi-01"), (other_route, "taxi-02")):
+        manager.disconnect(socket, route_id)
+
+
+@pytest.mark.asyncio
+async def test_binary_viewers_get_header_and_original_jpeg():
+    """Test binary viewers get raw JPEG bytes behind a fixed header, without any base64 encoding."""
+    manager = VideoStreamManager()
+    viewer = FakeSocket(subprotocols=[SUBPROTOCOL])
+    await manager.connect(viewer, "taxi-01")
+    assert viewer.subprotocol == SUBPROTOCOL
+
+    frame = upload(manager, "taxi-01", 5, trip_id="42")
+    await asyncio.sleep(0.01)
+
+    message = viewer.frames[0]
+    version, route_len, trip_len, seq, timestamp_ms = FRAME_HEADER.unpack_from(message)
+    body = message[FRAME_HEADER.size:]
+    assert (version, seq, timestamp_ms) == (1, 1, 1733040005000)
+    assert body[:route_len] == b"taxi-01"
+    assert body[route_len:route_len + trip_len] == b"42"
+    assert body[route_len + trip_len:] == JPEG
+    assert frame._base64 is None
+    # Legacy consumers still get the base64 JSON shape
+    assert frame.as_dict()["size"] == len(JPEG)
+
+    manager.disconnect(viewer, "taxi-01")
+
+
+@pytest.mark.asyncio
+async def test_rewind_sends_buffered_frames_oldest_first():
+    """Test a viewer asking to rewind gets the last N buffered frames of its route."""
+    manager = VideoStreamManager()
+    for second in range(5):
+        upload(manager, "taxi-01", second)
+    viewer = FakeSocket()
+    await manager.connect(viewer, "taxi-01", rewind=3)
+    await asyncio.sleep(0.01)
+
+    assert [f["seq"] for f in viewer.frames] == [3, 4, 5]
+    manager.disconnect(viewer, "taxi-01")
+
+
+def test_frame_store_bounds_frames_memory_and_idle_routes(monkeypatch):
+    """Test per-route ring size, the byte budget (idle routes' rewind first) and TTL expiry."""
+    clock = [1000.0]
+    monkeypatch.setattr("app.websocket.frames.time.monotonic", lambda: clock[0])
+    store = FrameStore(frames_per_route=3, memory_bytes=len(JPEG) * 5, ttl_seconds=60)
+
+    for route_id in ("a", "a", "a", "a", "b", "b"):
+        store.append(route_id, JPEG, "2024-12-01T08:00:00")
+    assert [f.seq for f in store.recent("a", 10)] == [2, 3, 4]
+    assert store.bytes == len(JPEG) * 5
+
+    store.append("c", JPEG, "2024-12-01T08:00:00")
+    # Over budget: the least recently updated route loses its oldest rewind frame
+    assert [f.seq for f in store.recent("a", 10)] == [3, 4]
+    assert store.bytes == len(JPEG) * 5
+    assert store.evicted == 1
+
+    clock[0] += 30
+    store.append("b", JPEG, "2024-12-01T08:00:00")
+    clock[0] += 45
+    assert store.latest("a") is None  # No upload for 75 s
+    assert store.route_ids() == ["b"]
+    assert store.expired == 2
+    assert store.bytes == sum(len(f.jpeg) for f in store.recent("b", 10))
+
+
+def test_frame_store_counts_cached_encodings():
+    """Test encodings and previews built for viewers count against the budget and are released on eviction."""
+    store = FrameStore(frames_per_route=2, memory_bytes=len(JPEG) * 4, ttl_seconds=60)
+    first = store.append("a", JPEG, "2024-12-01T08:00:00")
+    first.json_payload()
+    first.binary_payload()
+    first.previews = {160: b"x" * 10}
+    assert store.bytes == first.nbytes > 3 * len(JPEG)
+
+    # Over budget with the next upload: the rewind frame and its encodings go
+    second = store.append("a", JPEG, "2024-12-01T08:00:01")
+    assert store.recent("a", 10) == [second]
+    assert store.bytes == len(JPEG)
+
+    # An evicted frame still being sent no longer charges the store
+    first.previews = {160: b"x" * 10, 320: b"y" * 20}
+    assert store.bytes == len(JPEG)
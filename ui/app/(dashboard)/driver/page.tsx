@@ -80,6 +80,10 @@ export default function DriverPanelPage() {
 
         ws.onmessage = (event) => {
           const data = JSON.parse(event.data);
+          if (data.type === "ping") {
+            ws.send(JSON.stringify({ type: "pong" }));
+            return;
+          }
           console.log("📥 WebSocket message:", data);
 
           if (data.type === "new_trip") {
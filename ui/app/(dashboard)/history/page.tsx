@@ -19,7 +19,9 @@ interface TripImage {
   id: number;
   trip_id: number;
   device_id: string | null;
-  image_data: string;
+  blob_key: string | null;
+  size: number | null;
+  image_data: string | null;
   captured_at: string;
 }
 
@@ -32,6 +34,12 @@ interface Trip {
   identity_verified: boolean;
 }
 
+function imageSrc(image: TripImage, size?: number) {
+  return image.blob_key
+    ? imagesApi.blobUrl(image.blob_key, size)
+    : `data:image/jpeg;base64,${image.image_data}`;
+}
+
 export default function ImageHistoryPage() {
   const [images, setImages] = useState<TripImage[]>([]);
   const [trips, setTrips] = useState<Trip[]>([]);
@@ -144,7 +152,7 @@ export default function ImageHistoryPage() {
                 >
                   <div className="aspect-video bg-gray-100 relative">
                     <img
-                      src={`data:image/jpeg;base64,${image.image_data}`}
+                      src={imageSrc(image, 320)}
                       alt={`Trip ${image.trip_id}`}
                       className="w-full h-full object-cover"
                     />
@@ -219,7 +227,7 @@ export default function ImageHistoryPage() {
             </div>
             <div className="p-4">
               <img
-                src={`data:image/jpeg;base64,${selectedImage.image_data}`}
+                src={imageSrc(selectedImage)}
                 alt={`Trip ${selectedImage.trip_id}`}
                 className="w-full h-auto rounded-lg"
               />
@@ -87,6 +87,10 @@ export default function TripTrackingPage() {
 
         ws.onmessage = (event) => {
           const data = JSON.parse(event.data);
+          if (data.type === "ping") {
+            ws.send(JSON.stringify({ type: "pong" }));
+            return;
+          }
           console.log("📥 Trip update:", data);
 
           // Only process updates for this trip
@@ -157,6 +161,10 @@ export default function TripTrackingPage() {
 
     ws.onmessage = (event) => {
       const data = JSON.parse(event.data);
+      if (data.type === "ping") {
+        ws.send(JSON.stringify({ type: "pong" }));
+        return;
+      }
       if (data.type === "frame" && data.image) {
         setCameraFrame(`data:image/jpeg;base64,${data.image}`);
       }
@@ -47,7 +47,7 @@ export default function VideoMonitorPage() {
       // Also fetch latest frame for each device
       for (const deviceId of data.devices || []) {
         try {
-          const frameResponse = await fetch(`${apiUrl}/video/device/latest/${deviceId}`);
+          const frameResponse = await fetch(`${apiUrl}/video/device/latest/${deviceId}?size=320`);
           const frameData = await frameResponse.json();
           if (frameData.image) {
             setActiveDevices(prev => {
@@ -93,6 +93,10 @@ export default function VideoMonitorPage() {
 
     ws.onmessage = (event) => {
       const data = JSON.parse(event.data);
+      if (data.type === 'ping') {
+        ws.send(JSON.stringify({ type: 'pong' }));
+        return;
+      }
       if (data.type === 'frame' && data.image) {
         setActiveDevices(prev => {
           const newMap = new Map(prev);
@@ -304,6 +304,9 @@ export const imagesApi = {
     const response = await api.delete(`/images/${imageId}`);
     return response.data;
   },
+
+  blobUrl: (blobKey: string, size?: number) =>
+    `${API_BASE_URL}/images/blobs/${blobKey}${size ? `?size=${size}` : ''}`,
 };
 
 // Trips API
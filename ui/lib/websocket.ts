@@ -30,6 +30,10 @@ export function useTrackingWebSocket() {
       ws.onmessage = (event) => {
         try {
           const message = JSON.parse(event.data);
+          if (message.type === 'ping') {
+            ws.send(JSON.stringify({ type: 'pong' }));
+            return;
+          }
 
           if (message.type === 'location_update') {
             updateLocation(message.data);